@@ -1,221 +1,42 @@
-import html
 import os
-from dotenv import load_dotenv
+import re
+import socket
 
-from src.epub_utils import preserve_head_links
-from src.epub_utils import get_metadata_author
-from src.epub_utils import get_metadata_title
-from src.html_utils import format_html_to_multiline_block_tags, minify_attributes, restore_attributes
-from src.html_utils import split_html_by_newline
-from src.utils import generate_book_filename, truncate_text
-from src.utils import save_chunk_to_file
-from src.utils import lang_code_to_full_lang
+from dotenv import load_dotenv
 
 load_dotenv()
 
-from langchain.llms import BaseLLM
-import langcodes
-import tiktoken
-import typer
-import re
-
 import ebooklib
-from ebooklib import epub
+import typer
 from bs4 import BeautifulSoup
+from ebooklib import epub
 
-from src.llm import extract_response_text, get_api_key, get_model
-from src.llm_prompts import TRANSLATE_PROMPT
-from src.llm_prompts import generate_book_info_prompt
+from src.dedup import DEDUP_BLOCKS, DEDUPLICATE
+from src.distributed import assemble_translation, enqueue_translation, requeue_failed_tasks, run_worker
+from src.html_utils import split_html_by_newline
+from src.job_queue import open_queue
+from src.llm import get_api_key, get_model
 from src.model_prices import calculate_price
-import tempfile
+from src.passthrough import PassthroughClassifier
+from src.run_log import SORT_KEYS, format_report, load_records
+from src.server import is_loopback_host, parse_tenant_limits
+from src.translation_service import create_translation_server
+from src.translator import MAX_CHUNK_SIZE, MAX_CONCURRENCY, MODEL_NAME, MODEL_VENDOR, TEMPERATURE, TranslationOptions, translate
 
 app = typer.Typer()
 
-MODEL_VENDOR = os.getenv("MODEL_VENDOR", "openai")
-MODEL_NAME = os.getenv("MODEL_NAME", "gpt-4o-mini")
-TEMPERATURE = float(os.getenv("TEMPERATURE", 0.2))
-RETRY_LIMIT = int(os.getenv("RETRY_LIMIT", 1))
-
-MAX_CHUNK_SIZE = int(os.getenv("MAX_CHUNK_SIZE", 10_000))
-
-
-def translate_chunk(client: BaseLLM, text, from_lang, to_lang, book_title=None, book_author=None, retry_num=0):
-    MAX_LINE_DIFF_PERCENTAGE = 0.1
-    MIN_LINES_FOR_RETRY = 10
-
-    messages = TRANSLATE_PROMPT.format_messages(
-        from_lang=from_lang,
-        to_lang=to_lang,
-        book_details=generate_book_info_prompt(book_title, book_author),
-        # source_text=html.escape(text)
-        source_text=text
-    )
-
-    response = client.invoke(messages)
-    print("\t\t" + str(response.usage_metadata))
-
-    translated_text = extract_response_text(response)
-    decoded_text = html.unescape(translated_text)
-
-    original_lines = text.count('\n')
-    decoded_lines = decoded_text.count('\n')
-
-    if abs(original_lines - decoded_lines) > 2:
-        print(f"\t\tWarning: The number of lines in the original text ({original_lines}) and the decoded text ({decoded_lines}) are different.")
-        print("\t\t\tOriginal last line:", truncate_text(text.splitlines()[-1]))
-        print("\t\t\tTranslated last line:", truncate_text(decoded_text.splitlines()[-1]))
-
-        should_retry = (
-            retry_num < RETRY_LIMIT and 
-            original_lines > MIN_LINES_FOR_RETRY and 
-            abs(original_lines - decoded_lines) / original_lines > MAX_LINE_DIFF_PERCENTAGE
-        )
-
-        if should_retry:
-            print(f"\t\tRetrying translation... Attempt {retry_num + 1} of {RETRY_LIMIT}")
-            return translate_chunk(
-                client=client,
-                text=text, 
-                from_lang=from_lang, 
-                to_lang=to_lang, 
-                book_title=book_title, 
-                book_author=book_author, 
-                retry_num=retry_num + 1
-            )
-
-    return decoded_text, text
-
-
-def translate_toc(client: BaseLLM, toc, from_lang='EN', to_lang='PL'):
-    toc_list = list(toc)
-    toc_text = "\n".join([item.title.strip() for item in toc_list if isinstance(item, epub.Link)])
-
-    translated_toc_text = translate_text(client, toc_text, from_lang, to_lang)
-    translated_titles = [title.strip() for title in translated_toc_text.split('\n')]
-
-    translated_toc = []
-    title_index = 0
-    for item in toc_list:
-        if isinstance(item, epub.Link):
-            translated_toc.append(epub.Link(item.href, translated_titles[title_index], item.uid))
-            title_index += 1
-        else:
-            translated_toc.append(item)
-
-    return tuple(translated_toc)
-
-
-def translate_text(
-    client: BaseLLM,
-    text,
-    from_lang,
-    to_lang,
-    temp_dir=None,
-    book_title=None,
-    book_author=None,
-    chapter_number=None,
-):
-    """
-    Translates HTML text content from one language to another while preserving HTML structure.
-
-    Args:
-        client (BaseLLM): The language model client used for translation
-        text (str): The HTML text content to translate
-        from_lang (str): Source language code
-        to_lang (str): Target language code
-        temp_dir (str, optional): Directory to save intermediate translation chunks. Defaults to None
-        book_title (str, optional): Title of the book being translated. Defaults to None
-        book_author (str, optional): Author of the book being translated. Defaults to None
-        chapter_number (int, optional): Current chapter number being translated. Defaults to None
-
-    Returns:
-        str: The translated HTML text with preserved structure
-    """
-    translated_chunks = []
-
-    soup = BeautifulSoup(text, 'html.parser')
-
-    if not soup.body:
-        return text
-
-    minified_html, mininifed_mapping = minify_attributes(str(soup.body))
-    chunks = split_html_by_newline(minified_html)
-
-    for i, chunk in enumerate(chunks):
-        print("\tTranslating chunk %d/%d..." % (i+1, len(chunks)))
-        translated_chunk, original_chunk = translate_chunk(client, chunk, from_lang, to_lang, book_title, book_author)
-        translated_chunks.append(translated_chunk)
+ESCALATION_MODEL_VENDOR = os.getenv("ESCALATION_MODEL_VENDOR")
+ESCALATION_MODEL_NAME = os.getenv("ESCALATION_MODEL_NAME")
 
-        save_chunk_to_file(temp_dir, chapter_number, restore_attributes(original_chunk, mininifed_mapping), i, prefix='original')
-        save_chunk_to_file(temp_dir, chapter_number, restore_attributes(translated_chunk, mininifed_mapping), i)
+ADAPTIVE_CHUNK_SIZE = os.getenv("ADAPTIVE_CHUNK_SIZE", "false").lower() in ("1", "true", "yes")
+ROLLING_CONTEXT = os.getenv("ROLLING_CONTEXT", "false").lower() in ("1", "true", "yes")
+PASSTHROUGH = os.getenv("PASSTHROUGH", "false").lower() in ("1", "true", "yes")
+JOB_QUEUE_URL = os.getenv("JOB_QUEUE_URL", "sqlite:///translate-queue.db")
 
-    translated_restored_html = restore_attributes("".join(translated_chunks), mininifed_mapping)
 
-    soup.body.clear()
-    soup.body.extend(BeautifulSoup(translated_restored_html, 'html.parser').body.contents)
+def show_chunks(input_epub_path, from_lang='EN', to_lang='PL', passthrough=True):
+    import tiktoken
 
-    return str(soup)
-
-def translate(client: BaseLLM, input_epub_path, output_epub_path=None, from_chapter=0, to_chapter=9999, from_lang='EN', to_lang='PL', toc=True):
-    book = epub.read_epub(input_epub_path)
-
-    full_from_lang = lang_code_to_full_lang(from_lang)
-    full_to_lang = lang_code_to_full_lang(to_lang)
-
-    book.set_unique_metadata('DC', 'language', langcodes.standardize_tag(to_lang))
-
-    book_title = get_metadata_title(book)
-    book_author = get_metadata_author(book)
-
-    current_chapter = 1
-    chapters_count = len([i for i in book.get_items() if i.get_type() == ebooklib.ITEM_DOCUMENT])
-
-    temp_dir = tempfile.mkdtemp()
-    print("Debugging: Translated chunks will be stored in the temporary directory: %s" % temp_dir)
-
-    prompt = TRANSLATE_PROMPT.format_messages(
-        from_lang=full_from_lang,
-        to_lang=full_to_lang,
-        book_details=generate_book_info_prompt(book_title, book_author),
-        source_text="..."
-    )[0].content
-    indented_prompt = '\n'.join(['\t' + line for line in prompt.split('\n')])
-    print("Prompt sample: \n%s" % indented_prompt)
-
-    if toc:
-        book.toc = translate_toc(client, book.toc, from_lang, to_lang)
-
-    for item in book.get_items():
-        if item.get_type() == ebooklib.ITEM_DOCUMENT:
-            preserve_head_links(item)
-
-            if current_chapter >= from_chapter and current_chapter <= to_chapter:
-                print("Processing chapter %d/%d..." % (current_chapter, chapters_count))
-                soup = BeautifulSoup(item.content, 'html.parser')
-                
-                try:
-                    translated_text = translate_text(
-                        client=client,
-                        text=format_html_to_multiline_block_tags(str(soup)),
-                        from_lang=full_from_lang,
-                        to_lang=full_to_lang,
-                        temp_dir=temp_dir,
-                        chapter_number=current_chapter,
-                    )
-                    item.content = translated_text.encode('utf-8')
-                except Exception as e:
-                    print(f"\t\tError translating chapter {current_chapter}: {str(e)}")
-                    break
-   
-            current_chapter += 1
-
-    if not output_epub_path:
-        output_epub_path = generate_book_filename(to_lang, MODEL_NAME, TEMPERATURE, book_title, book_author)
-
-    epub.write_epub(output_epub_path, book, {})
-    print("Translation completed. Output file: %s" % output_epub_path)
-
-def show_chunks(input_epub_path):
     book = epub.read_epub(input_epub_path)
 
     model_name_tokenizer = MODEL_NAME
@@ -226,20 +47,32 @@ def show_chunks(input_epub_path):
     
     encoding = tiktoken.encoding_for_model(model_name_tokenizer)
 
+    classifier = PassthroughClassifier(from_lang, [to_lang]) if passthrough else None
+
     book_total_tokens = 0
+    book_skipped_tokens = 0
     for item in book.get_items():
         if item.get_type() == ebooklib.ITEM_DOCUMENT:
             content_str = str(BeautifulSoup(item.content, 'html.parser'))
-            chunks = split_html_by_newline(content_str)
+            chunks = classifier.split(content_str, MAX_CHUNK_SIZE) if classifier else split_html_by_newline(content_str)
+            document_reason = classifier.classify_document(content_str) if classifier else None
+            document_skipped = classifier.skips(document_reason, to_lang) if classifier else False
 
-            print("Document: %s" % item.get_name())
+            print("Document: %s%s" % (item.get_name(), " (passed through: %s)" % document_reason if document_skipped else ""))
             
             document_total_tokens = 0
+            document_skipped_tokens = 0
             for i, chunk in enumerate(chunks):
                 tokens = encoding.encode(chunk)
-                print("Chunk %d/%d (Tokens: %d):" % (i+1, len(chunks), len(tokens)))
+                if document_skipped:
+                    chunk_reason = document_reason
+                else:
+                    chunk_reason = classifier.chunk_reason(chunk, to_lang) if classifier else None
+                print("Chunk %d/%d (Tokens: %d)%s:" % (i+1, len(chunks), len(tokens), " passed through: %s" % chunk_reason if chunk_reason else ""))
 
                 document_total_tokens += len(tokens)
+                if chunk_reason:
+                    document_skipped_tokens += len(tokens)
                 
                 lines = chunk.split('\n')
                 if len(lines) > 6:
@@ -247,19 +80,21 @@ def show_chunks(input_epub_path):
                 else:
                     print('\n'.join(lines) + "\n\n")
 
-                book_total_tokens += document_total_tokens
+            book_total_tokens += document_total_tokens
+            book_skipped_tokens += document_skipped_tokens
 
-            print("Total tokens in document: %d\n" % document_total_tokens)
+            print("Total tokens in document: %d (passed through: %d)\n" % (document_total_tokens, document_skipped_tokens))
 
-            input_price = calculate_price(document_total_tokens, MODEL_NAME, 'input')
-            output_price = calculate_price(document_total_tokens, MODEL_NAME, 'output')
+            input_price = calculate_price(document_total_tokens - document_skipped_tokens, MODEL_NAME, 'input')
+            output_price = calculate_price(document_total_tokens - document_skipped_tokens, MODEL_NAME, 'output')
             total_price = input_price + output_price
             print("Price for input: $%.2f, Price for output: $%.2f, Total price: $%.2f" % (input_price, output_price, total_price))
             
             print("--------------------------------------------------\n")
 
-    input_price = calculate_price(book_total_tokens, MODEL_NAME, 'input')
-    output_price = calculate_price(book_total_tokens, MODEL_NAME, 'output')
+    print("Total tokens in book: %d, passed through without translation: %d" % (book_total_tokens, book_skipped_tokens))
+    input_price = calculate_price(book_total_tokens - book_skipped_tokens, MODEL_NAME, 'input')
+    output_price = calculate_price(book_total_tokens - book_skipped_tokens, MODEL_NAME, 'output')
     total_price = input_price + output_price
     print("Total book price for input: $%.2f, Price for output: $%.2f, Total price: $%.2f" % (input_price, output_price, total_price))
 
@@ -286,19 +121,113 @@ def translate_command(
     from_chapter: int = typer.Option(0, help="Starting chapter for translation."),
     to_chapter: int = typer.Option(9999, help="Ending chapter for translation."),
     from_lang: str = typer.Option('EN', help="Source language."),
-    to_lang: str = typer.Option('PL', help="Target language."),
-    toc: bool = typer.Option(True, is_flag=True, help="Translate the table of contents.")
+    to_lang: str = typer.Option('PL', help="Target language, or a comma-separated list of languages (e.g. PL,DE,FR) to produce one book per language."),
+    toc: bool = typer.Option(True, is_flag=True, help="Translate the table of contents."),
+    adaptive_chunks: bool = typer.Option(ADAPTIVE_CHUNK_SIZE, help="Adapt the chunk size to observed latency, truncations and retries, and remember it per model and language pair."),
+    max_cost: float = typer.Option(None, help="Budget in USD. Translation stops before going over it and can be resumed by running the same command again."),
+    state: str = typer.Option(None, help="File with translated chunks of an interrupted run to resume from. Defaults to <output>.state.json with --max-cost."),
+    escalation_model: str = typer.Option(ESCALATION_MODEL_NAME, help="Stronger model for a cascade: chunks are translated with MODEL_NAME first and re-sent to this model only if they fail the checks."),
+    escalation_vendor: str = typer.Option(ESCALATION_MODEL_VENDOR, help="Vendor of the escalation model. Defaults to MODEL_VENDOR."),
+    dedup: bool = typer.Option(DEDUPLICATE, help="Send identical chunks to the model only once."),
+    dedup_blocks: bool = typer.Option(DEDUP_BLOCKS, help="With --dedup, also pass repeated scene separators through and translate repeated short paragraphs once, without their surrounding text."),
+    rolling_context: bool = typer.Option(ROLLING_CONTEXT, help="Add the last translated lines and a short running summary to every chunk's prompt, so small chunks stay consistent."),
+    passthrough: bool = typer.Option(PASSTHROUGH, help="Keep cover and image pages, code listings, tables of numbers and text already in the target language without sending them to the model."),
+    run_log: str = typer.Option(None, help="JSONL file the stats of every model call are appended to, for the `report` command. Defaults to <output>.run.jsonl."),
+    enqueue: bool = typer.Option(False, help="Write chunk tasks to the job queue for `worker` processes instead of translating."),
+    queue: str = typer.Option(JOB_QUEUE_URL, help="Job queue used with --enqueue: sqlite:///path.db, redis://host:port/db or a directory path."),
 ):
+    if enqueue:
+        enqueue_translation(open_queue(queue), input, output, from_chapter, to_chapter, from_lang, to_lang, toc)
+        return
+
     client = get_model(get_api_key(MODEL_VENDOR), MODEL_VENDOR, MODEL_NAME, TEMPERATURE)
-    translate(client, input, output, from_chapter, to_chapter, from_lang, to_lang, toc)
+    escalation_client = None
+    if escalation_model:
+        escalation_vendor = escalation_vendor or MODEL_VENDOR
+        escalation_client = get_model(get_api_key(escalation_vendor), escalation_vendor, escalation_model, TEMPERATURE)
+
+    options = TranslationOptions(
+        from_chapter, to_chapter, from_lang, to_lang, toc, adaptive_chunks, max_cost, state, dedup, dedup_blocks,
+        rolling_context, passthrough, run_log,
+    )
+    translate(client, input, output, options, escalation_client)
+
+@app.command('worker', help="Translate chunk tasks from the job queue created by `translate --enqueue`.")
+def worker_command(
+    queue: str = typer.Option(JOB_QUEUE_URL, help="Job queue: sqlite:///path.db, redis://host:port/db or a directory path."),
+    lease_seconds: int = typer.Option(600, help="How long a claimed task is reserved before other workers may take it over."),
+    wait: bool = typer.Option(False, help="Keep waiting for tasks leased by other workers instead of exiting."),
+):
+    client = get_model(get_api_key(MODEL_VENDOR), MODEL_VENDOR, MODEL_NAME, TEMPERATURE)
+    worker_id = "%s-%d" % (socket.gethostname(), os.getpid())
+    run_worker(client, open_queue(queue), worker_id, lease_seconds, wait)
+
+@app.command('assemble', help="Build the translated book from a finished job queue.")
+def assemble_command(
+    queue: str = typer.Option(JOB_QUEUE_URL, help="Job queue: sqlite:///path.db, redis://host:port/db or a directory path."),
+    output: str = typer.Option(None, help="Output file path. Defaults to the one given to `translate --enqueue` or an automatically generated one."),
+):
+    assemble_translation(open_queue(queue), output)
+
+@app.command('requeue', help="Return the failed tasks of the job queue to the pending ones so workers retry them.")
+def requeue_command(
+    queue: str = typer.Option(JOB_QUEUE_URL, help="Job queue: sqlite:///path.db, redis://host:port/db or a directory path."),
+):
+    requeue_failed_tasks(open_queue(queue))
+
+@app.command('serve', help="Run a local HTTP translation service with warm model clients and a fair request queue.")
+def serve_command(
+    host: str = typer.Option('127.0.0.1', help="Interface to listen on."),
+    port: int = typer.Option(8000, help="Port to listen on."),
+    max_concurrency: int = typer.Option(MAX_CONCURRENCY, help="Maximum number of model requests in flight for all tenants."),
+    tenant_limit: int = typer.Option(None, help="Maximum number of model requests in flight per tenant. Defaults to --max-concurrency."),
+    tenant_limits: str = typer.Option(None, help="Limits of specific tenants (X-Tenant header), e.g. acme=4,beta=1."),
+    clients_per_model: int = typer.Option(1, help="Number of warm clients kept per vendor, model and temperature."),
+    max_jobs: int = typer.Option(8, help="Maximum number of document and book jobs running at the same time."),
+    job_ttl: float = typer.Option(3600, help="Seconds a finished job stays available at /jobs/<id>."),
+    epub_root: str = typer.Option(None, help="Directory that /translate-epub input and output paths must be in. Required with a non-loopback --host."),
+):
+    if epub_root is None and not is_loopback_host(host):
+        raise typer.BadParameter("--epub-root is required when serving on a non-loopback interface", param_hint="--host")
+    server = create_translation_server(
+        host, port, max_concurrency=max_concurrency, tenant_limits=parse_tenant_limits(tenant_limits),
+        default_tenant_limit=tenant_limit, clients_per_model=clients_per_model, max_jobs=max_jobs,
+        job_ttl=job_ttl, epub_root=epub_root,
+    )
+    print("Serving on http://%s:%d" % server.server_address[:2])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.jobs.shutdown()
+        server.scheduler.shutdown(wait=False)
 
 @app.command('show-chapters', help="Show the chapters of the book.")
 def show_chapters_command(input: str = typer.Option(..., help="Input file path.")):
     show_chapters(input)
 
 @app.command('show-chunks', help="Show the chunks of the book chapters and estimated prices for each.")
-def show_chunks_command(input: str = typer.Option(..., help="Input file path.")):
-    show_chunks(input)
+def show_chunks_command(
+    input: str = typer.Option(..., help="Input file path."),
+    from_lang: str = typer.Option('EN', help="Source language."),
+    to_lang: str = typer.Option('PL', help="Target language."),
+    passthrough: bool = typer.Option(PASSTHROUGH, help="Report chunks that would be passed through without translation."),
+):
+    show_chunks(input, from_lang, to_lang, passthrough)
+
+@app.command('report', help="Show latency, token and cost statistics of a translation run from its run log.")
+def report_command(
+    input: str = typer.Option(..., help="Run log written by `translate` (<output>.run.jsonl)."),
+    top: int = typer.Option(10, help="Number of slowest or most expensive chunks to list."),
+    sort: str = typer.Option('latency', help="Order of the chunk list: %s." % ", ".join(SORT_KEYS)),
+    run: str = typer.Option(None, help="Run id to report on. Defaults to the latest run in the file."),
+    all_runs: bool = typer.Option(False, help="Report on all runs in the file."),
+):
+    if sort not in SORT_KEYS:
+        raise typer.BadParameter("must be one of: %s" % ", ".join(SORT_KEYS), param_hint="--sort")
+    print(format_report(load_records(input, run, all_runs), top, sort))
 
 if __name__ == "__main__":
     app()
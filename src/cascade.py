@@ -0,0 +1,67 @@
+import threading
+
+from src.llm import ChunkStats, get_client_model_name
+from src.model_prices import calculate_usage_price
+
+
+class ModelCascade:
+    """
+    A cheap primary model with a stronger escalation model for chunks the primary one fails.
+
+    Also keeps the statistics for the run summary: how many chunks were escalated and how much
+    the cascade saved compared to sending every chunk to the escalation model.
+
+    Example:
+        cascade = ModelCascade(get_model(key, 'openai', 'gpt-4o-mini'), get_model(key, 'openai', 'gpt-4o'))
+    """
+
+    def __init__(self, primary, escalation):
+        self.primary = primary
+        self.escalation = escalation
+        self.primary_model_name = get_client_model_name(primary)
+        self.escalation_model_name = get_client_model_name(escalation)
+        self.chunks = 0
+        self.escalated_chunks = 0
+        self.cost = 0.0
+        self.escalation_only_cost = 0.0
+        self._lock = threading.Lock()
+
+    def record_chunk(self, calls: list, escalated: bool):
+        """
+        Records the model calls made for one chunk.
+
+        Args:
+            calls (list): `ChunkStats` of every call made for the chunk, on both models
+            escalated (bool): Whether the chunk was sent to the escalation model
+        """
+        cost = sum(self._price(stats) for stats in calls)
+
+        if escalated:
+            # The escalation model would have handled this chunk anyway
+            escalation_only_cost = sum(self._price(stats) for stats in calls if stats.model_name == self.escalation_model_name)
+        else:
+            # Assume the escalation model would have used the same number of tokens
+            escalation_only_cost = sum(self._price(stats, self.escalation_model_name) for stats in calls)
+
+        with self._lock:
+            self.chunks += 1
+            self.escalated_chunks += int(escalated)
+            self.cost += cost
+            self.escalation_only_cost += escalation_only_cost
+
+    def _price(self, stats: ChunkStats, model_name: str | None = None) -> float:
+        return calculate_usage_price(stats.input_tokens, stats.output_tokens, model_name or stats.model_name, stats.cached_tokens)
+
+    @property
+    def escalation_rate(self) -> float:
+        return self.escalated_chunks / self.chunks if self.chunks else 0.0
+
+    @property
+    def cost_saved(self) -> float:
+        return self.escalation_only_cost - self.cost
+
+    def summary(self) -> str:
+        return "Cascade %s -> %s: escalated %d/%d chunks (%.1f%%), cost $%.4f, saved $%.4f compared to %s only" % (
+            self.primary_model_name, self.escalation_model_name, self.escalated_chunks, self.chunks,
+            self.escalation_rate * 100, self.cost, self.cost_saved, self.escalation_model_name,
+        )
@@ -0,0 +1,168 @@
+import json
+import os
+import threading
+
+from src.llm import ChunkStats
+
+ADAPTIVE_MIN_CHUNK_SIZE = int(os.getenv("ADAPTIVE_MIN_CHUNK_SIZE", 2_000))
+ADAPTIVE_MAX_CHUNK_SIZE = int(os.getenv("ADAPTIVE_MAX_CHUNK_SIZE", 40_000))
+TARGET_CHUNK_LATENCY = float(os.getenv("TARGET_CHUNK_LATENCY", 60))
+CHUNK_SIZER_STATE = os.getenv(
+    "CHUNK_SIZER_STATE", os.path.join(os.path.expanduser("~"), ".cache", "translate-book-gpt", "chunk_sizes.json")
+)
+
+GROW_FACTOR = 1.15
+SHRINK_FACTOR = 0.7
+SLOW_SHRINK_FACTOR = 0.9
+# Keep the expected output of a chunk below this share of the model's output token limit
+OUTPUT_TOKEN_HEADROOM = 0.8
+# Responses using this share of the output token limit are treated as truncated
+TRUNCATION_THRESHOLD = 0.95
+# Smoothing factor of the output-tokens-per-input-character moving average
+RATIO_SMOOTHING = 0.3
+
+
+class AdaptiveChunkSizer:
+    """
+    Adjusts the target chunk size online from the outcome of completed `translate_chunk` calls.
+
+    Failures (line mismatches, retries, truncated output) shrink the size multiplicatively,
+    slow calls shrink it gently and clean, full-sized calls grow it. The size is also capped so
+    the expected output fits the model's output token limit, based on the observed ratio of
+    output tokens to input characters. With `model_name` set, calls made with other models (e.g.
+    the escalation model of a cascade) are ignored, as their ratios and limits do not apply.
+    `observe` may be called from several chunk threads at once.
+
+    Example:
+        sizer = AdaptiveChunkSizer(initial_size=10_000, max_output_tokens=16_384)
+        sizer.observe(stats)
+        chunks = split_html_by_newline(html, sizer.chunk_size)
+    """
+
+    def __init__(
+        self,
+        initial_size: int,
+        min_size: int = ADAPTIVE_MIN_CHUNK_SIZE,
+        max_size: int = ADAPTIVE_MAX_CHUNK_SIZE,
+        max_output_tokens: int | None = None,
+        target_latency: float = TARGET_CHUNK_LATENCY,
+        tokens_per_char: float | None = None,
+        model_name: str | None = None,
+    ):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_output_tokens = max_output_tokens
+        self.target_latency = target_latency
+        self.tokens_per_char = tokens_per_char
+        self.model_name = model_name
+        self.observations = 0
+        self._size = float(initial_size)
+        self._lock = threading.Lock()
+        self._clamp()
+
+    @property
+    def chunk_size(self) -> int:
+        return int(self._size)
+
+    def _upper_bound(self) -> float:
+        if self.max_output_tokens and self.tokens_per_char:
+            return min(self.max_size, self.max_output_tokens * OUTPUT_TOKEN_HEADROOM / self.tokens_per_char)
+        return self.max_size
+
+    def _clamp(self):
+        self._size = max(self.min_size, min(self._size, self._upper_bound()))
+
+    def observe(self, stats: ChunkStats):
+        if self.model_name is not None and stats.model_name != self.model_name:
+            return
+
+        with self._lock:
+            self._observe(stats)
+
+    def _observe(self, stats: ChunkStats):
+        self.observations += 1
+
+        if stats.input_chars and stats.output_tokens:
+            ratio = stats.output_tokens / stats.input_chars
+            if self.tokens_per_char is None:
+                self.tokens_per_char = ratio
+            else:
+                self.tokens_per_char += RATIO_SMOOTHING * (ratio - self.tokens_per_char)
+
+        truncated = (
+            self.max_output_tokens is not None
+            and stats.output_tokens >= self.max_output_tokens * TRUNCATION_THRESHOLD
+        )
+
+        if stats.line_mismatch or stats.retry_num > 0 or truncated:
+            self._size *= SHRINK_FACTOR
+        elif stats.latency > self.target_latency:
+            self._size *= SLOW_SHRINK_FACTOR
+        elif stats.input_chars >= self._size * 0.5:
+            # Only chunks close to the target size prove that the target works; short tail
+            # chunks at the end of a chapter say nothing about larger ones.
+            self._size *= GROW_FACTOR
+
+        self._clamp()
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                'chunk_size': self.chunk_size,
+                'tokens_per_char': self.tokens_per_char,
+                'observations': self.observations,
+            }
+
+
+def chunk_sizer_key(model_name: str, from_lang: str, to_lang: str) -> str:
+    return f"{model_name}:{from_lang.lower()}:{to_lang.lower()}"
+
+
+def load_chunk_sizer(key: str, initial_size: int, max_output_tokens: int | None = None, path: str = CHUNK_SIZER_STATE, model_name: str | None = None):
+    """
+    Creates an `AdaptiveChunkSizer`, resuming from the state learned in previous runs if available.
+
+    Args:
+        key (str): State key, see `chunk_sizer_key`
+        initial_size (int): Chunk size used when nothing was learned yet for the key
+        max_output_tokens (int, optional): Output token limit of the model
+        path (str): Path to the JSON state file
+        model_name (str, optional): Only calls made with this model are observed
+
+    Returns:
+        AdaptiveChunkSizer: The chunk sizer
+    """
+    state = _read_state(path).get(key, {})
+
+    sizer = AdaptiveChunkSizer(
+        initial_size=state.get('chunk_size', initial_size),
+        max_output_tokens=max_output_tokens,
+        tokens_per_char=state.get('tokens_per_char'),
+        model_name=model_name,
+    )
+    sizer.observations = state.get('observations', 0)
+
+    return sizer
+
+
+def save_chunk_sizer(key: str, sizer: AdaptiveChunkSizer, path: str = CHUNK_SIZER_STATE):
+    state = _read_state(path)
+    state[key] = sizer.to_dict()
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _read_state(path: str) -> dict:
+    if not os.path.exists(path):
+        return {}
+
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except ValueError:
+        print(f"Warning: Ignoring invalid chunk size state file {path}")
+        return {}
@@ -0,0 +1,67 @@
+import pytest
+from ebooklib import epub
+from src.llm import ChunkStats
+
+
+@pytest.fixture
+def make_stats():
+    """Factory for the `ChunkStats` of a clean model call; any field can be overridden."""
+
+    def make(model_name='gpt-4o-mini', input_tokens=1_000_000, output_tokens=1_000_000, **fields):
+        return ChunkStats(**{
+            'model_name': model_name,
+            'input_chars': 4 * input_tokens,
+            'output_chars': 4 * output_tokens,
+            'input_tokens': input_tokens,
+            'output_tokens': output_tokens,
+            'cached_tokens': 0,
+            'latency': 1.0,
+            'retry_num': 0,
+            'line_mismatch': False,
+            **fields,
+        })
+
+    return make
+
+
+class FakeResponse:
+    def __init__(self, content):
+        self.content = content
+        self.usage_metadata = {'input_tokens': 100, 'output_tokens': 100, 'total_tokens': 200}
+
+
+class FakeClient:
+    def __init__(self, model_name, translate=lambda text: text.replace('Hello', 'Cześć')):
+        self.model_name = model_name
+        self.translate = translate
+        self.calls = 0
+
+    def invoke(self, messages):
+        self.calls += 1
+        return FakeResponse(self.translate(messages[-1].content))
+
+
+@pytest.fixture
+def fake_client():
+    """The `FakeClient` class: a model client that translates 'Hello' and counts its calls."""
+    return FakeClient
+
+
+@pytest.fixture
+def write_book():
+    """Writes a one-chapter EPUB (a single 'Hello' paragraph) to the given path."""
+
+    def write(path):
+        book = epub.EpubBook()
+        book.set_identifier('id')
+        book.set_title('Title')
+        chapter = epub.EpubHtml(title='One', file_name='one.xhtml', lang='en')
+        chapter.content = '<html><head></head><body><p>Hello</p></body></html>'
+        book.add_item(chapter)
+        book.toc = (epub.Link('one.xhtml', 'One', 'one'),)
+        book.add_item(epub.EpubNcx())
+        book.add_item(epub.EpubNav())
+        book.spine = ['nav', chapter]
+        epub.write_epub(str(path), book, {})
+
+    return write
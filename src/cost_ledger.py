@@ -0,0 +1,110 @@
+import threading
+from collections import defaultdict
+
+from src.llm import ChunkStats
+from src.model_prices import calculate_usage_price
+
+# Used to estimate the cost of a chunk before it is sent, until real usage has been observed
+DEFAULT_INPUT_TOKENS_PER_CHAR = 0.25
+DEFAULT_OUTPUT_TOKENS_PER_CHAR = 0.35
+PROMPT_OVERHEAD_TOKENS = 150
+
+
+class BudgetExceededError(Exception):
+    pass
+
+
+class CostLedger:
+    """
+    Running cost of a translation run, built from the real token usage of every model call.
+
+    Costs are tracked per chapter and per book (target language) and for the whole run.
+    With `max_cost` set, every model call (retries, escalations and summaries included) must
+    reserve its estimated cost before it is made and keep it until its real cost is recorded, so
+    that requests running concurrently cannot together go over the budget. `previous_cost` is what
+    earlier runs resumed from the same state already spent; it counts against `max_cost` too.
+
+    Example:
+        ledger = CostLedger(max_cost=5.0)
+        estimate = ledger.reserve_estimate(chunk, 'gpt-4o-mini')  # raises BudgetExceededError
+        try:
+            ...
+            ledger.record(stats, 'PL', chapter=3)
+        finally:
+            ledger.release(estimate)
+    """
+
+    def __init__(self, max_cost: float | None = None, previous_cost: float = 0.0):
+        self.max_cost = max_cost
+        self.previous_cost = previous_cost
+        self.total_cost = 0.0
+        self.reserved_cost = 0.0
+        self.book_costs = defaultdict(float)
+        self.chapter_costs = defaultdict(float)
+        self.tokens = defaultdict(lambda: {'input_tokens': 0, 'output_tokens': 0, 'cached_tokens': 0})
+        self._input_chars = 0
+        self._input_tokens = 0
+        self._output_tokens = 0
+        self._lock = threading.Lock()
+
+    def record(self, stats: ChunkStats, lang: str, chapter: int | None = None) -> float:
+        cost = calculate_usage_price(stats.input_tokens, stats.output_tokens, stats.model_name, stats.cached_tokens)
+
+        with self._lock:
+            self.total_cost += cost
+            self.book_costs[lang] += cost
+            self.chapter_costs[(lang, chapter)] += cost
+
+            tokens = self.tokens[lang]
+            tokens['input_tokens'] += stats.input_tokens
+            tokens['output_tokens'] += stats.output_tokens
+            tokens['cached_tokens'] += stats.cached_tokens
+
+            if stats.input_tokens:
+                self._input_chars += stats.input_chars
+                self._input_tokens += stats.input_tokens
+                self._output_tokens += stats.output_tokens
+
+        return cost
+
+    @property
+    def spent_cost(self) -> float:
+        """Cost of this run and of the earlier runs it resumed."""
+        return self.previous_cost + self.total_cost
+
+    def estimate_cost(self, text: str, model_name: str, context: str = '') -> float:
+        with self._lock:
+            if self._input_chars:
+                input_tokens_per_char = self._input_tokens / self._input_chars
+                output_tokens_per_char = self._output_tokens / self._input_chars
+            else:
+                input_tokens_per_char = DEFAULT_INPUT_TOKENS_PER_CHAR
+                output_tokens_per_char = DEFAULT_OUTPUT_TOKENS_PER_CHAR
+
+        input_tokens = int((len(text) + len(context)) * input_tokens_per_char) + PROMPT_OVERHEAD_TOKENS
+        output_tokens = int(len(text) * output_tokens_per_char)
+
+        return calculate_usage_price(input_tokens, output_tokens, model_name)
+
+    def reserve(self, estimated_cost: float):
+        """Reserves budget for a model call about to be made; raises BudgetExceededError if it does not fit."""
+        with self._lock:
+            if self.max_cost is not None and self.spent_cost + self.reserved_cost + estimated_cost > self.max_cost:
+                raise BudgetExceededError(
+                    "Budget of $%.2f would be exceeded (spent $%.4f, in flight $%.4f, next call ~$%.4f)"
+                    % (self.max_cost, self.spent_cost, self.reserved_cost, estimated_cost)
+                )
+            self.reserved_cost += estimated_cost
+
+    def reserve_estimate(self, text: str, model_name: str, context: str = '') -> float:
+        """Reserves the estimated cost of sending `text` to `model_name` and returns it for `release`."""
+        estimated_cost = self.estimate_cost(text, model_name, context)
+        self.reserve(estimated_cost)
+        return estimated_cost
+
+    def release(self, estimated_cost: float):
+        with self._lock:
+            self.reserved_cost -= estimated_cost
+
+    def chapter_cost(self, lang: str, chapter: int) -> float:
+        return self.chapter_costs.get((lang, chapter), 0.0)
@@ -0,0 +1,189 @@
+import hashlib
+import os
+import re
+import threading
+from collections import Counter
+from concurrent.futures import Future
+
+DEDUPLICATE = os.getenv("DEDUPLICATE", "false").lower() in ("1", "true", "yes")
+DEDUP_MAX_BLOCK_LENGTH = int(os.getenv("DEDUP_MAX_BLOCK_LENGTH", 200))
+DEDUP_MIN_BLOCK_OCCURRENCES = int(os.getenv("DEDUP_MIN_BLOCK_OCCURRENCES", 3))
+DEDUP_BLOCKS = os.getenv("DEDUP_BLOCKS", "false").lower() in ("1", "true", "yes")
+# Same as the line count difference `translate_chunk` accepts without retrying
+MAX_LINE_DIFF = 2
+
+PLACEHOLDER_PATTERN = re.compile(r'="(v\d+)"')
+# A single block element: the closing tag of the opening one appears only at the end
+BLOCK_LINE_PATTERN = re.compile(r'^<(p|div|h[1-6]|li|blockquote)\b[^>]*>(?:(?!</\1>).)*</\1>$', re.DOTALL)
+TAG_OR_ENTITY_PATTERN = re.compile(r'<[^>]*>|&#?\w+;')
+
+
+def restore_placeholders(html: str, attribute_mapping: dict) -> str:
+    """
+    Replaces attribute placeholders produced by `minify_attributes` with their original values.
+
+    A fast, string-based counterpart of `restore_attributes`, used to compare chunks minified
+    with different mappings.
+    """
+    return PLACEHOLDER_PATTERN.sub(lambda m: '="%s"' % attribute_mapping.get(m.group(1), m.group(1)), html)
+
+
+def remap_placeholders(html: str, from_mapping: dict, to_mapping: dict) -> str:
+    """
+    Rewrites attribute placeholders of `html` from one document's mapping to another's.
+
+    Example:
+        >>> remap_placeholders('<p class="v1">Hi</p>', {'v1': 'text'}, {'v7': 'text'})
+        '<p class="v7">Hi</p>'
+    """
+    if from_mapping is to_mapping:
+        return html
+
+    value_to_placeholder = {value: placeholder for placeholder, value in to_mapping.items()}
+
+    def remap(match):
+        value = from_mapping.get(match.group(1))
+        return '="%s"' % value_to_placeholder.get(value, match.group(1))
+
+    return PLACEHOLDER_PATTERN.sub(remap, html)
+
+
+def normalize_text(html: str) -> str:
+    return ' '.join(html.split())
+
+
+def has_translatable_text(html: str) -> bool:
+    return any(c.isalpha() for c in TAG_OR_ENTITY_PATTERN.sub('', html))
+
+
+def is_short_block(line: str, max_length: int = DEDUP_MAX_BLOCK_LENGTH) -> bool:
+    line = line.strip()
+    return len(line) <= max_length and BLOCK_LINE_PATTERN.match(line) is not None
+
+
+def short_blocks(html: str, max_length: int = DEDUP_MAX_BLOCK_LENGTH) -> list:
+    """Returns the normalized short block lines of a document, before it is minified."""
+    return [normalize_text(line) for line in html.split('\n') if is_short_block(line, max_length)]
+
+
+class ChunkDeduplicator:
+    """
+    Sends each distinct chunk or repeated short block of a book to the model only once.
+
+    Chunks are compared after normalizing whitespace and restoring attribute placeholders,
+    so identical content minified with different mappings (e.g. in different chapters) matches.
+    Chunks without any letters are passed through untranslated.
+
+    With `dedup_blocks`, short standalone blocks that occur at least `min_block_occurrences` times
+    in the book are cut out of their chunks: blocks without letters (scene separators) are passed
+    through and blocks with text (epigraphs, boilerplate notes) are translated once on their own.
+    This is off by default: a short line such as a repeated line of dialogue translated without its
+    surrounding text can come out wrong, e.g. with the wrong grammatical gender, and a remainder
+    whose line count changed by more than `MAX_LINE_DIFF` has to be sent again as a whole chunk.
+    Identical requests running concurrently are coalesced: duplicates wait for the first one.
+
+    Example:
+        deduplicator = ChunkDeduplicator()
+        for text in documents:
+            deduplicator.count_blocks(text)
+        translated = deduplicator.translate(chunk, mapping, 'PL', send)
+    """
+
+    def __init__(self, max_block_length: int = DEDUP_MAX_BLOCK_LENGTH, min_block_occurrences: int = DEDUP_MIN_BLOCK_OCCURRENCES, dedup_blocks: bool = DEDUP_BLOCKS):
+        self.max_block_length = max_block_length
+        self.min_block_occurrences = min_block_occurrences
+        self.dedup_blocks = dedup_blocks
+        self.block_counts = Counter()
+        self.requests = 0
+        self.hits = 0
+        self.passthrough = 0
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def count_blocks(self, html: str):
+        """Counts the short block lines of a document, before it is minified."""
+        self.add_blocks(short_blocks(html, self.max_block_length))
+
+    def add_blocks(self, blocks: list):
+        """Counts block lines already extracted with `short_blocks`."""
+        self.block_counts.update(blocks)
+
+    def _is_repeated_block(self, line: str, attribute_mapping: dict) -> bool:
+        if not self.dedup_blocks or not is_short_block(line, self.max_block_length):
+            return False
+        return self.block_counts[normalize_text(restore_placeholders(line, attribute_mapping))] >= self.min_block_occurrences
+
+    def translate(self, chunk: str, attribute_mapping: dict, lang: str, send) -> str:
+        """
+        Translates a minified chunk, reusing translations of identical chunks and blocks.
+
+        Args:
+            chunk (str): Minified chunk
+            attribute_mapping (dict): Attribute mapping of the chunk's document
+            lang (str): Target language code
+            send (callable): Translates a piece of minified text with the model and returns the translation
+
+        Returns:
+            str: The translated chunk, using placeholders of `attribute_mapping`
+        """
+        lines = chunk.split('\n')
+        block_positions = [j for j, line in enumerate(lines) if self._is_repeated_block(line, attribute_mapping)]
+
+        if not block_positions or len(block_positions) == len(lines) == 1:
+            return self._translate_once(chunk, attribute_mapping, lang, send)
+
+        translated_lines = {j: self._translate_once(lines[j], attribute_mapping, lang, send) for j in block_positions}
+
+        remaining_positions = [j for j in range(len(lines)) if j not in translated_lines]
+        if remaining_positions:
+            remainder = '\n'.join(lines[j] for j in remaining_positions)
+            translated_remainder = self._translate_once(remainder, attribute_mapping, lang, send).split('\n')
+
+            extra_lines = len(translated_remainder) - len(remaining_positions)
+            if abs(extra_lines) > MAX_LINE_DIFF:
+                # Blocks are put back by position; fall back to the whole chunk
+                return self._translate_once(chunk, attribute_mapping, lang, send)
+            if extra_lines > 0:
+                last = len(remaining_positions) - 1
+                translated_remainder[last:] = ['\n'.join(translated_remainder[last:])]
+
+            # Like `translate_chunk`, a few merged or split lines are accepted; blocks stay in order
+            translated_lines.update(zip(remaining_positions, translated_remainder))
+
+        return '\n'.join(translated_lines[j] for j in range(len(lines)) if j in translated_lines)
+
+    def _translate_once(self, text: str, attribute_mapping: dict, lang: str, send) -> str:
+        if not has_translatable_text(text):
+            with self._lock:
+                self.passthrough += 1
+            return text
+
+        canonical_text = normalize_text(restore_placeholders(text, attribute_mapping))
+        key = hashlib.sha1(f"{lang}\n{canonical_text}".encode('utf-8')).hexdigest()
+
+        with self._lock:
+            self.requests += 1
+            future = self._futures.get(key)
+            is_owner = future is None
+            if is_owner:
+                future = Future()
+                self._futures[key] = future
+            else:
+                self.hits += 1
+
+        if is_owner:
+            try:
+                future.set_result((send(text), attribute_mapping))
+            except Exception as e:
+                future.set_exception(e)
+                # Let a later occurrence try again instead of failing with the cached error
+                with self._lock:
+                    del self._futures[key]
+
+        translated_text, source_mapping = future.result()
+        return remap_placeholders(translated_text, source_mapping, attribute_mapping)
+
+    def summary(self) -> str:
+        return "Deduplication: %d of %d requests served from earlier or in-flight translations, %d blocks without text passed through" % (
+            self.hits, self.requests, self.passthrough
+        )
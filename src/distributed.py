@@ -0,0 +1,217 @@
+import os
+import time
+from typing import TYPE_CHECKING
+
+import ebooklib
+import langcodes
+from bs4 import BeautifulSoup
+from ebooklib import epub
+
+from src import job_queue
+from src.epub_utils import get_metadata_author, get_metadata_title, preserve_head_links
+from src.epub_writer import write_epub
+from src.html_utils import format_html_to_multiline_block_tags, prepare_html, rebuild_html
+from src.translator import MODEL_NAME, TEMPERATURE, apply_translated_toc, toc_to_text, translate_chunk
+from src.utils import add_lang_suffix, generate_book_filename, lang_code_to_full_lang, split_lang_codes
+
+if TYPE_CHECKING:
+    from langchain.llms import BaseLLM
+
+
+def enqueue_translation(queue, input_epub_path, output_epub_path=None, from_chapter=0, to_chapter=9999, from_lang='EN', to_lang='PL', toc=True):
+    """
+    Splits the book into chunk tasks and writes them to a job queue for `worker` processes.
+
+    Only prompt inputs travel with each task; the attribute mapping of every document is stored
+    once in the job metadata and referenced from tasks by the document name.
+
+    Args:
+        queue: Job queue backend (see `src.job_queue.open_queue`)
+        input_epub_path (str): Path to the source EPUB file, must be readable by `assemble`
+        output_epub_path (str, optional): Output path used by `assemble`. Defaults to None
+        from_chapter (int): Starting chapter for translation
+        to_chapter (int): Ending chapter for translation
+        from_lang (str): Source language code
+        to_lang (str | list): Target language code, a comma-separated list or a list of codes
+        toc (bool): Whether to translate the table of contents
+    """
+    book = epub.read_epub(input_epub_path)
+
+    to_langs = split_lang_codes(to_lang)
+    full_from_lang = lang_code_to_full_lang(from_lang)
+
+    book_title = get_metadata_title(book)
+    book_author = get_metadata_author(book)
+
+    task_defaults = {
+        lang: {
+            'from_lang': full_from_lang,
+            'to_lang': lang_code_to_full_lang(lang),
+            'book_title': book_title,
+            'book_author': book_author,
+        }
+        for lang in to_langs
+    }
+
+    job = {
+        'input': os.path.abspath(input_epub_path),
+        'output': output_epub_path,
+        'to_langs': to_langs,
+        'model_name': MODEL_NAME,
+        'temperature': TEMPERATURE,
+        'toc': toc,
+        'documents': {},
+    }
+    tasks = []
+
+    if toc:
+        toc_text = toc_to_text(list(book.toc))
+        tasks.extend(
+            {**task_defaults[lang], 'id': '%s-toc' % lang, 'document': None, 'text': toc_text}
+            for lang in to_langs
+        )
+
+    current_chapter = 1
+    for item in book.get_items():
+        if item.get_type() == ebooklib.ITEM_DOCUMENT:
+            if current_chapter >= from_chapter and current_chapter <= to_chapter:
+                soup = BeautifulSoup(item.content, 'html.parser')
+                prepared = prepare_html(format_html_to_multiline_block_tags(str(soup)))
+
+                if prepared:
+                    chunks, mapping = prepared
+                    task_ids = {
+                        lang: ["%s-%05d-%05d" % (lang, current_chapter, i) for i in range(len(chunks))]
+                        for lang in to_langs
+                    }
+
+                    job['documents'][item.get_name()] = {'chapter': current_chapter, 'mapping': mapping, 'tasks': task_ids}
+                    for lang in to_langs:
+                        tasks.extend(
+                            {**task_defaults[lang], 'id': task_id, 'document': item.get_name(), 'text': chunk}
+                            for task_id, chunk in zip(task_ids[lang], chunks)
+                        )
+
+            current_chapter += 1
+
+    queue.put_job(job)
+    queue.put_tasks(tasks)
+    print("Enqueued %d tasks from %d chapters." % (len(tasks), len(job['documents'])))
+
+
+def run_worker(client: "BaseLLM", queue, worker_id, lease_seconds=600, wait=False, poll_interval=5):
+    """
+    Claims chunk tasks from a job queue, translates them and writes the results back.
+
+    The worker exits when no tasks are left. A task whose lease expires (e.g. the worker crashed)
+    is claimed again by another worker.
+
+    Args:
+        client (BaseLLM): The language model client used for translation
+        queue: Job queue backend (see `src.job_queue.open_queue`)
+        worker_id (str): Identifier stored with the lease
+        lease_seconds (int): How long a claimed task stays reserved for this worker
+        wait (bool): Keep polling while other workers hold leases that may still expire
+        poll_interval (int): Seconds to sleep between polls when waiting
+    """
+    processed = 0
+
+    while True:
+        task = queue.claim(worker_id, lease_seconds)
+
+        if task is None:
+            counts = queue.counts()
+            if not wait or counts[job_queue.LEASED] == 0:
+                break
+            time.sleep(poll_interval)
+            continue
+
+        print("Translating task %s..." % task['id'])
+        try:
+            translated_chunk, _ = translate_chunk(
+                client, task['text'], task['from_lang'], task['to_lang'], task['book_title'], task['book_author']
+            )
+        except Exception as e:
+            print(f"\t\tError translating task {task['id']}: {str(e)}")
+            if not queue.fail(task['id'], worker_id, str(e)):
+                print("\t\tLease of task %s expired, another worker has taken it over" % task['id'])
+            continue
+
+        if queue.complete(task['id'], worker_id, translated_chunk):
+            processed += 1
+        else:
+            print("\t\tLease of task %s expired, the result was discarded" % task['id'])
+
+    print("Worker %s finished, translated %d tasks." % (worker_id, processed))
+
+
+def assemble_translation(queue, output_epub_path=None):
+    """
+    Rebuilds the translated EPUBs (one per target language) from the results of a completed job queue.
+
+    Args:
+        queue: Job queue backend (see `src.job_queue.open_queue`)
+        output_epub_path (str, optional): Output file path, overrides the one given at enqueue time
+    """
+    job = queue.get_job()
+    if not job:
+        print("No job found in the queue.")
+        return
+
+    results = queue.results()
+    counts = queue.counts()
+    if counts[job_queue.FAILED]:
+        print("%d tasks failed:" % counts[job_queue.FAILED])
+        for task_id, error in sorted(queue.failed().items()):
+            print("\t%s: %s" % (task_id, error))
+        print("Run `requeue` to retry them with workers.")
+        return
+    if counts[job_queue.DONE] < sum(counts.values()):
+        print("Job is not finished yet: %s" % counts)
+        return
+
+    book = epub.read_epub(job['input'])
+
+    book_title = get_metadata_title(book)
+    book_author = get_metadata_author(book)
+
+    documents = [item for item in book.get_items() if item.get_type() == ebooklib.ITEM_DOCUMENT]
+    for item in documents:
+        preserve_head_links(item)
+
+    original_toc = book.toc
+    original_contents = {item.get_name(): item.content for item in documents}
+
+    for lang in job['to_langs']:
+        book.set_unique_metadata('DC', 'language', langcodes.standardize_tag(lang))
+        book.toc = apply_translated_toc(list(original_toc), results['%s-toc' % lang]) if job['toc'] else original_toc
+
+        for item in documents:
+            document = job['documents'].get(item.get_name())
+            if document:
+                soup = BeautifulSoup(original_contents[item.get_name()], 'html.parser')
+                translated_chunks = [results[task_id] for task_id in document['tasks'][lang]]
+                translated_text = rebuild_html(
+                    format_html_to_multiline_block_tags(str(soup)), translated_chunks, document['mapping']
+                )
+                item.content = translated_text.encode('utf-8')
+
+        lang_output_epub_path = output_epub_path or job['output']
+        if not lang_output_epub_path:
+            lang_output_epub_path = generate_book_filename(lang, job['model_name'], job['temperature'], book_title, book_author)
+        elif len(job['to_langs']) > 1:
+            lang_output_epub_path = add_lang_suffix(lang_output_epub_path, lang)
+
+        write_epub(lang_output_epub_path, book, {})
+        print("Translation to %s completed. Output file: %s" % (lang, lang_output_epub_path))
+
+
+def requeue_failed_tasks(queue):
+    """
+    Returns the failed tasks of a job queue to the pending ones, with their attempts reset,
+    so `worker` processes retry them.
+
+    Args:
+        queue: Job queue backend (see `src.job_queue.open_queue`)
+    """
+    print("Requeued %d failed tasks." % queue.requeue_failed())
@@ -0,0 +1,136 @@
+import os
+import time
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from ebooklib import epub
+
+EPUB_WRITE_WORKERS = int(os.getenv("EPUB_WRITE_WORKERS", 0)) or None
+EPUB_COMPRESSION_LEVEL = int(os.getenv("EPUB_COMPRESSION_LEVEL", 6))
+
+# Private ZipFile attributes used by `write_deflated`; without them entries go through `writestr`
+ZIPFILE_INTERNALS = ('_lock', '_writing', '_writecheck', '_didModify', 'start_dir', 'fp')
+
+# Formats that are already compressed; deflating them again costs time and saves next to nothing
+STORED_EXTENSIONS = {
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.avif',
+    '.woff', '.woff2',
+    '.mp3', '.m4a', '.aac', '.ogg', '.opus', '.mp4', '.m4v', '.webm',
+    '.zip', '.gz',
+}
+
+
+def is_stored(file_name: str) -> bool:
+    return os.path.splitext(file_name)[1].lower() in STORED_EXTENSIONS
+
+
+def deflate(data: bytes, level: int = EPUB_COMPRESSION_LEVEL) -> bytes:
+    """Compresses data into a raw deflate stream, as stored in a zip entry."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def write_deflated(zip_file: zipfile.ZipFile, name: str, data: bytes, compressed: bytes):
+    """
+    Writes an entry whose data was already deflated with `deflate`.
+
+    `ZipFile.writestr` always compresses on the calling thread, so the local header is written
+    here from the known sizes and CRC, the same way `ZipFile` writes it for a seekable file.
+    If this Python's `ZipFile` lacks any of the internals that needs, the entry is written with
+    `writestr` instead and compressed again.
+    """
+    zinfo = zipfile.ZipInfo(name, date_time=time.localtime(time.time())[:6])
+    zinfo.compress_type = zipfile.ZIP_DEFLATED
+    zinfo.external_attr = 0o600 << 16
+    zinfo.file_size = len(data)
+    zinfo.compress_size = len(compressed)
+    zinfo.CRC = zlib.crc32(data)
+    if not all(hasattr(zip_file, attribute) for attribute in ZIPFILE_INTERNALS):
+        zip_file.writestr(zinfo, data, compresslevel=EPUB_COMPRESSION_LEVEL)
+        return
+
+    zip64 = max(zinfo.file_size, zinfo.compress_size) > zipfile.ZIP64_LIMIT
+
+    with zip_file._lock:
+        if zip_file._writing:
+            raise ValueError("Can't write to the ZIP file while there is another write handle open on it.")
+        zip_file.fp.seek(zip_file.start_dir)
+        zinfo.header_offset = zip_file.fp.tell()
+        zip_file._writecheck(zinfo)
+        zip_file._didModify = True
+        zip_file.fp.write(zinfo.FileHeader(zip64))
+        zip_file.fp.write(compressed)
+        zip_file.filelist.append(zinfo)
+        zip_file.NameToInfo[zinfo.filename] = zinfo
+        zip_file.start_dir = zip_file.fp.tell()
+
+
+class ParallelEpubWriter(epub.EpubWriter):
+    """
+    EpubWriter that renders and deflates documents in a thread pool.
+
+    Entries keep ebooklib's order (`mimetype` first and stored, then the container, the OPF and the
+    items in book order). Already compressed media (images, WOFF fonts, audio and video) is stored
+    as is; XHTML, CSS, NCX and other text is rendered and deflated by `max_workers` threads.
+    At most a few entries per worker are kept in memory while waiting to be written.
+    """
+
+    def __init__(self, name, book, options=None, max_workers: int | None = EPUB_WRITE_WORKERS):
+        super().__init__(name, book, options)
+        self.max_workers = max_workers
+
+    def _get_entry(self, item):
+        if isinstance(item, epub.EpubNcx):
+            return '%s/%s' % (self.book.FOLDER_NAME, item.file_name), self._get_ncx()
+        if isinstance(item, epub.EpubNav):
+            return '%s/%s' % (self.book.FOLDER_NAME, item.file_name), self._get_nav(item)
+        if item.manifest:
+            return '%s/%s' % (self.book.FOLDER_NAME, item.file_name), item.get_content()
+        return item.file_name, item.get_content()
+
+    def _prepare_entry(self, item):
+        name, data = self._get_entry(item)
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        return name, data, None if is_stored(name) else deflate(data)
+
+    def _write_entry(self, name, data, compressed):
+        if compressed is None:
+            self.out.writestr(name, data, compress_type=zipfile.ZIP_STORED)
+        else:
+            write_deflated(self.out, name, data, compressed)
+
+    def _write_items(self):
+        window = 4 * (self.max_workers or os.cpu_count() or 1)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = deque()
+            for item in self.book.get_items():
+                pending.append(executor.submit(self._prepare_entry, item))
+                if len(pending) >= window:
+                    self._write_entry(*pending.popleft().result())
+            while pending:
+                self._write_entry(*pending.popleft().result())
+
+    def write(self):
+        self.out = zipfile.ZipFile(self.file_name, 'w', zipfile.ZIP_DEFLATED, compresslevel=EPUB_COMPRESSION_LEVEL)
+        try:
+            self.out.writestr('mimetype', 'application/epub+zip', compress_type=zipfile.ZIP_STORED)
+
+            self._write_container()
+            self._write_opf()
+            self._write_items()
+        finally:
+            self.out.close()
+
+
+def write_epub(name, book, options=None, max_workers: int | None = EPUB_WRITE_WORKERS):
+    """
+    Drop-in replacement for `ebooklib.epub.write_epub` that uses `ParallelEpubWriter`.
+
+    Unlike ebooklib, write errors are raised instead of being silently ignored.
+    """
+    writer = ParallelEpubWriter(name, book, options, max_workers=max_workers)
+    writer.process()
+    writer.write()
@@ -1,4 +1,6 @@
 ﻿import os
+from collections import Counter
+
 from bs4 import BeautifulSoup
 
 MAX_CHUNK_SIZE = int(os.getenv("MAX_CHUNK_SIZE", 10_000))
@@ -144,4 +146,81 @@ def format_html_to_multiline_block_tags(html: str) -> str:
     while '\n\n' in formatted:
         formatted = formatted.replace('\n\n', '\n')
         
-    return formatted
\ No newline at end of file
+    return formatted
+
+def prepare_html(html: str, max_chunk_size=MAX_CHUNK_SIZE, passthrough=None):
+    """
+    Prepares an HTML document for translation by minifying the attributes of its body
+    and splitting it into chunks.
+
+    Args:
+        html (str): The full HTML document
+        max_chunk_size (int): Maximum size of a single chunk
+        passthrough (PassthroughClassifier, optional): Splits with `passthrough.split`, so that long
+            non-translatable runs get chunks of their own. Defaults to None
+
+    Returns:
+        tuple | None: A tuple of (chunks, attribute_mapping), or None if the document has no body
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+
+    if not soup.body:
+        return None
+
+    minified_html, attribute_mapping = minify_attributes(str(soup.body))
+
+    if passthrough:
+        return passthrough.split(minified_html, max_chunk_size), attribute_mapping
+
+    return split_html_by_newline(minified_html, max_chunk_size), attribute_mapping
+
+
+def rebuild_html(html: str, translated_chunks: list, attribute_mapping: dict) -> str:
+    """
+    Replaces the body of an HTML document with translated chunks produced from `prepare_html`.
+
+    Args:
+        html (str): The original full HTML document passed to `prepare_html`
+        translated_chunks (list): Translated chunks, in the same order as the prepared ones
+        attribute_mapping (dict): Attribute mapping returned by `prepare_html`
+
+    Returns:
+        str: The HTML document with translated body and original attribute values restored
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+    translated_restored_html = restore_attributes("".join(translated_chunks), attribute_mapping)
+
+    soup.body.clear()
+    soup.body.extend(BeautifulSoup(translated_restored_html, 'html.parser').body.contents)
+
+    return str(soup)
+
+
+def html_structure_matches(source_html: str, translated_html: str) -> bool:
+    """
+    Checks that a translation kept the markup of the source: the same tags and the same
+    (minified) attribute values, regardless of their text content.
+
+    Args:
+        source_html (str): The source HTML fragment
+        translated_html (str): The translated HTML fragment
+
+    Returns:
+        bool: True if both fragments contain the same tags and attribute values
+
+    Example:
+        >>> html_structure_matches('<p class="v1">Hello</p>', '<p class="v1">Cześć</p>')
+        True
+        >>> html_structure_matches('<p class="v1">Hello <b>world</b></p>', '<p class="v1">Cześć świecie</p>')
+        False
+    """
+    def structure(html):
+        tags = Counter()
+        values = Counter()
+        for tag in BeautifulSoup(html, 'html.parser').find_all():
+            tags[tag.name] += 1
+            for value in tag.attrs.values():
+                values[' '.join(value) if isinstance(value, list) else value] += 1
+        return tags, values
+
+    return structure(source_html) == structure(translated_html)
@@ -0,0 +1,494 @@
+import json
+import os
+import sqlite3
+import time
+
+# Task statuses
+PENDING = 'pending'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+
+MAX_TASK_ATTEMPTS = int(os.getenv("MAX_TASK_ATTEMPTS", 3))
+
+# Error stored for tasks whose last attempt ended with an expired lease
+LEASE_EXPIRED_ERROR = 'Lease expired'
+
+
+def open_queue(url: str):
+    """
+    Opens a job queue backend based on the URL scheme.
+
+    Args:
+        url (str): Queue location. Supported formats:
+            - "sqlite:///path/to/queue.db" - SQLite database file
+            - "redis://host:port/db" - Redis server (requires the `redis` package)
+            - "file:///path/to/dir" or a plain directory path - file-based queue
+
+    Returns:
+        SQLiteJobQueue | RedisJobQueue | FileJobQueue: The queue backend
+
+    Example:
+        >>> queue = open_queue("sqlite:///translate-queue.db")
+    """
+    if url.startswith("sqlite:///"):
+        return SQLiteJobQueue(url[len("sqlite:///"):])
+    elif url.startswith("redis://") or url.startswith("rediss://"):
+        return RedisJobQueue(url)
+    elif url.startswith("file://"):
+        return FileJobQueue(url[len("file://"):])
+    else:
+        return FileJobQueue(url)
+
+
+class SQLiteJobQueue:
+    """
+    Job queue stored in a single SQLite database file.
+
+    Suitable for several worker processes sharing one machine or a network filesystem
+    with working file locks.
+
+    In all backends `complete` and `fail` only take effect for the worker that still holds the
+    task's lease, and return False otherwise (e.g. the lease expired and another worker took over,
+    or the task is already done). Taking over an expired lease counts as a failed attempt, so a task
+    that keeps crashing its workers is eventually marked as failed. `requeue_failed` returns failed
+    tasks to the pending ones with their attempts reset.
+    """
+
+    def __init__(self, path: str, max_attempts: int = MAX_TASK_ATTEMPTS):
+        self.path = path
+        self.max_attempts = max_attempts
+
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS job (key TEXT PRIMARY KEY, value TEXT)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tasks ("
+                "id TEXT PRIMARY KEY, seq INTEGER, payload TEXT, status TEXT, worker TEXT, "
+                "lease_expires REAL, attempts INTEGER DEFAULT 0, result TEXT, error TEXT)"
+            )
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return _Transaction(conn)
+
+    def put_job(self, job: dict):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM job")
+            conn.execute("DELETE FROM tasks")
+            conn.execute("INSERT INTO job (key, value) VALUES ('job', ?)", (json.dumps(job),))
+
+    def get_job(self) -> dict | None:
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM job WHERE key = 'job'").fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_tasks(self, tasks: list):
+        with self._connect() as conn:
+            start = conn.execute("SELECT COUNT(*) FROM tasks").fetchone()[0]
+            conn.executemany(
+                "INSERT INTO tasks (id, seq, payload, status) VALUES (?, ?, ?, ?)",
+                [(task['id'], start + i, json.dumps(task), PENDING) for i, task in enumerate(tasks)],
+            )
+
+    def claim(self, worker_id: str, lease_seconds: float) -> dict | None:
+        now = time.time()
+        with self._connect() as conn:
+            while True:
+                row = conn.execute(
+                    "SELECT id, payload, status, attempts FROM tasks "
+                    "WHERE status = ? OR (status = ? AND lease_expires < ?) "
+                    "ORDER BY seq LIMIT 1",
+                    (PENDING, LEASED, now),
+                ).fetchone()
+
+                if not row:
+                    return None
+
+                task_id, payload, status, attempts = row
+                if status == LEASED:
+                    attempts += 1
+                    if attempts >= self.max_attempts:
+                        conn.execute(
+                            "UPDATE tasks SET status = ?, attempts = ?, error = ?, lease_expires = NULL WHERE id = ?",
+                            (FAILED, attempts, LEASE_EXPIRED_ERROR, task_id),
+                        )
+                        continue
+
+                conn.execute(
+                    "UPDATE tasks SET status = ?, worker = ?, lease_expires = ?, attempts = ? WHERE id = ?",
+                    (LEASED, worker_id, now + lease_seconds, attempts, task_id),
+                )
+                return json.loads(payload)
+
+    def complete(self, task_id: str, worker_id: str, result: str) -> bool:
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE tasks SET status = ?, result = ?, lease_expires = NULL WHERE id = ? AND worker = ? AND status = ?",
+                (DONE, result, task_id, worker_id, LEASED),
+            )
+        return cursor.rowcount == 1
+
+    def fail(self, task_id: str, worker_id: str, error: str) -> bool:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT attempts FROM tasks WHERE id = ? AND worker = ? AND status = ?", (task_id, worker_id, LEASED)
+            ).fetchone()
+            if not row:
+                return False
+
+            attempts = row[0] + 1
+            status = FAILED if attempts >= self.max_attempts else PENDING
+            conn.execute(
+                "UPDATE tasks SET status = ?, attempts = ?, error = ?, lease_expires = NULL WHERE id = ?",
+                (status, attempts, error, task_id),
+            )
+        return True
+
+    def requeue_failed(self) -> int:
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE tasks SET status = ?, attempts = 0, worker = NULL WHERE status = ?", (PENDING, FAILED)
+            )
+        return cursor.rowcount
+
+    def results(self) -> dict:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT id, result FROM tasks WHERE status = ?", (DONE,)).fetchall()
+        return dict(rows)
+
+    def failed(self) -> dict:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT id, error FROM tasks WHERE status = ?", (FAILED,)).fetchall()
+        return dict(rows)
+
+    def counts(self) -> dict:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) FROM tasks GROUP BY status").fetchall()
+        return {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0, **dict(rows)}
+
+
+class _Transaction:
+    """Runs the statements of a `with` block in one immediate (write-locked) transaction."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        self.conn.close()
+
+
+class FileJobQueue:
+    """
+    Job queue stored as JSON files in a directory.
+
+    A stand-in for environments without a database server: tasks are claimed by atomically
+    linking a lease file into place and expired leases are taken over by atomically renaming
+    them away, so it works for workers sharing a local or network filesystem.
+    Task ids and worker ids are used in file names, so they must be filename-safe.
+    """
+
+    def __init__(self, path: str, max_attempts: int = MAX_TASK_ATTEMPTS):
+        self.path = path
+        self.max_attempts = max_attempts
+
+        for subdir in ('tasks', 'leases', 'results', 'failed'):
+            os.makedirs(os.path.join(path, subdir), exist_ok=True)
+
+    def _file(self, subdir, name):
+        return os.path.join(self.path, subdir, name + '.json')
+
+    def _read(self, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _write(self, path, data):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def _task_ids(self, subdir):
+        return sorted(name[:-len('.json')] for name in os.listdir(os.path.join(self.path, subdir)) if name.endswith('.json'))
+
+    def put_job(self, job: dict):
+        for subdir in ('tasks', 'leases', 'results', 'failed'):
+            for task_id in self._task_ids(subdir):
+                os.remove(self._file(subdir, task_id))
+        self._write(os.path.join(self.path, 'job.json'), job)
+
+    def get_job(self) -> dict | None:
+        job_path = os.path.join(self.path, 'job.json')
+        return self._read(job_path) if os.path.exists(job_path) else None
+
+    def put_tasks(self, tasks: list):
+        # Task ids double as file names; claim order follows their sort order
+        for task in tasks:
+            self._write(self._file('tasks', task['id']), {**task, 'attempts': 0})
+
+    def _take_over_expired_lease(self, task_id, worker_id, now):
+        lease_path = self._file('leases', task_id)
+        try:
+            lease = self._read(lease_path)
+        except (OSError, ValueError):
+            return False
+        if lease['expires'] >= now:
+            return False
+
+        # Only one worker's rename of the lease file succeeds. If another worker took over between
+        # the read and the rename, the file moved is its new lease, which is linked back in place.
+        expired_path = f"{lease_path}.{worker_id}.expired"
+        try:
+            os.rename(lease_path, expired_path)
+        except FileNotFoundError:
+            return False
+        try:
+            if self._read(expired_path) != lease:
+                try:
+                    os.link(expired_path, lease_path)
+                except FileExistsError:
+                    pass
+                return False
+        finally:
+            os.remove(expired_path)
+
+        task = self._read(self._file('tasks', task_id))
+        task['attempts'] += 1
+        task['error'] = LEASE_EXPIRED_ERROR
+        self._write(self._file('tasks', task_id), task)
+        if task['attempts'] >= self.max_attempts:
+            self._write(self._file('failed', task_id), task)
+            return False
+        return True
+
+    def _try_lease(self, task_id, worker_id, lease_seconds):
+        lease_path = self._file('leases', task_id)
+        now = time.time()
+
+        if os.path.exists(lease_path) and not self._take_over_expired_lease(task_id, worker_id, now):
+            return False
+
+        # The lease is written in full before it is linked into place, which fails if the file exists
+        tmp_path = f"{lease_path}.{worker_id}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'worker': worker_id, 'expires': now + lease_seconds}, f)
+        try:
+            os.link(tmp_path, lease_path)
+        except FileExistsError:
+            return False
+        finally:
+            os.remove(tmp_path)
+
+        return True
+
+    def _holds_lease(self, task_id, worker_id):
+        if os.path.exists(self._file('results', task_id)) or os.path.exists(self._file('failed', task_id)):
+            return False
+        try:
+            return self._read(self._file('leases', task_id))['worker'] == worker_id
+        except (OSError, ValueError):
+            return False
+
+    def _release(self, task_id):
+        try:
+            os.remove(self._file('leases', task_id))
+        except FileNotFoundError:
+            pass
+
+    def claim(self, worker_id: str, lease_seconds: float) -> dict | None:
+        finished = set(self._task_ids('results')) | set(self._task_ids('failed'))
+
+        for task_id in self._task_ids('tasks'):
+            if task_id in finished:
+                continue
+            if self._try_lease(task_id, worker_id, lease_seconds):
+                return self._read(self._file('tasks', task_id))
+
+        return None
+
+    def complete(self, task_id: str, worker_id: str, result: str) -> bool:
+        if not self._holds_lease(task_id, worker_id):
+            return False
+        self._write(self._file('results', task_id), {'id': task_id, 'result': result})
+        self._release(task_id)
+        return True
+
+    def fail(self, task_id: str, worker_id: str, error: str) -> bool:
+        if not self._holds_lease(task_id, worker_id):
+            return False
+        task = self._read(self._file('tasks', task_id))
+        task['attempts'] += 1
+        task['error'] = error
+
+        if task['attempts'] >= self.max_attempts:
+            self._write(self._file('failed', task_id), task)
+        self._write(self._file('tasks', task_id), task)
+        self._release(task_id)
+        return True
+
+    def requeue_failed(self) -> int:
+        task_ids = self._task_ids('failed')
+        for task_id in task_ids:
+            task = self._read(self._file('tasks', task_id))
+            self._write(self._file('tasks', task_id), {**task, 'attempts': 0})
+            os.remove(self._file('failed', task_id))
+        return len(task_ids)
+
+    def results(self) -> dict:
+        return {
+            data['id']: data['result']
+            for data in (self._read(self._file('results', key)) for key in self._task_ids('results'))
+        }
+
+    def failed(self) -> dict:
+        return {task_id: self._read(self._file('failed', task_id)).get('error') for task_id in self._task_ids('failed')}
+
+    def counts(self) -> dict:
+        total = len(self._task_ids('tasks'))
+        done = len(self._task_ids('results'))
+        failed = len(self._task_ids('failed'))
+        leased = len(set(self._task_ids('leases')) - set(self._task_ids('results')) - set(self._task_ids('failed')))
+        return {PENDING: total - done - failed - leased, LEASED: leased, DONE: done, FAILED: failed}
+
+
+# Re-queues expired leases (or marks them failed after the last attempt) and moves the next
+# pending task to the leases in one atomic step, so a worker dying mid-claim cannot leave a task
+# in neither list.
+# KEYS: pending, leases, workers, attempts, failed; ARGV: now, lease expiry, worker id, max attempts, error
+REDIS_CLAIM_SCRIPT = """
+for _, task_id in ipairs(redis.call('ZRANGEBYSCORE', KEYS[2], 0, ARGV[1])) do
+    redis.call('ZREM', KEYS[2], task_id)
+    if redis.call('HINCRBY', KEYS[4], task_id, 1) >= tonumber(ARGV[4]) then
+        redis.call('HSET', KEYS[5], task_id, ARGV[5])
+    else
+        redis.call('LPUSH', KEYS[1], task_id)
+    end
+end
+local task_id = redis.call('LPOP', KEYS[1])
+if not task_id then
+    return false
+end
+redis.call('ZADD', KEYS[2], ARGV[2], task_id)
+redis.call('HSET', KEYS[3], task_id, ARGV[3])
+return task_id
+"""
+
+# Stores a result only for the worker that still holds the lease.
+# KEYS: leases, workers, results; ARGV: task id, worker id, result
+REDIS_COMPLETE_SCRIPT = """
+if not redis.call('ZSCORE', KEYS[1], ARGV[1]) or redis.call('HGET', KEYS[2], ARGV[1]) ~= ARGV[2] then
+    return 0
+end
+redis.call('ZREM', KEYS[1], ARGV[1])
+redis.call('HSET', KEYS[3], ARGV[1], ARGV[3])
+return 1
+"""
+
+# Re-queues a task or marks it failed, only for the worker that still holds the lease.
+# KEYS: leases, workers, attempts, failed, pending; ARGV: task id, worker id, error, max attempts
+REDIS_FAIL_SCRIPT = """
+if not redis.call('ZSCORE', KEYS[1], ARGV[1]) or redis.call('HGET', KEYS[2], ARGV[1]) ~= ARGV[2] then
+    return 0
+end
+redis.call('ZREM', KEYS[1], ARGV[1])
+if redis.call('HINCRBY', KEYS[3], ARGV[1], 1) >= tonumber(ARGV[4]) then
+    redis.call('HSET', KEYS[4], ARGV[1], ARGV[3])
+else
+    redis.call('RPUSH', KEYS[5], ARGV[1])
+end
+return 1
+"""
+
+
+class RedisJobQueue:
+    """
+    Job queue stored in Redis, for workers spread across several machines.
+
+    Claims, completions and failures run as Lua scripts, so each is atomic on the server.
+    Requires the optional `redis` package.
+    """
+
+    def __init__(self, url: str, prefix: str = "translate-book", max_attempts: int = MAX_TASK_ATTEMPTS):
+        try:
+            import redis
+        except ImportError:
+            raise ImportError("Redis queue requires the `redis` package: pip install redis")
+
+        self.redis = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self.max_attempts = max_attempts
+        self._claim = self.redis.register_script(REDIS_CLAIM_SCRIPT)
+        self._complete = self.redis.register_script(REDIS_COMPLETE_SCRIPT)
+        self._fail = self.redis.register_script(REDIS_FAIL_SCRIPT)
+
+    def _key(self, name):
+        return f"{self.prefix}:{name}"
+
+    def put_job(self, job: dict):
+        self.redis.delete(*[self._key(name) for name in ('tasks', 'pending', 'leases', 'workers', 'results', 'failed', 'attempts')])
+        self.redis.set(self._key('job'), json.dumps(job))
+
+    def get_job(self) -> dict | None:
+        job = self.redis.get(self._key('job'))
+        return json.loads(job) if job else None
+
+    def put_tasks(self, tasks: list):
+        if not tasks:
+            return
+        pipe = self.redis.pipeline()
+        pipe.hset(self._key('tasks'), mapping={task['id']: json.dumps(task) for task in tasks})
+        pipe.rpush(self._key('pending'), *[task['id'] for task in tasks])
+        pipe.execute()
+
+    def claim(self, worker_id: str, lease_seconds: float) -> dict | None:
+        now = time.time()
+        task_id = self._claim(
+            keys=[self._key('pending'), self._key('leases'), self._key('workers'), self._key('attempts'), self._key('failed')],
+            args=[now, now + lease_seconds, worker_id, self.max_attempts, LEASE_EXPIRED_ERROR],
+        )
+        if task_id is None:
+            return None
+
+        return json.loads(self.redis.hget(self._key('tasks'), task_id))
+
+    def complete(self, task_id: str, worker_id: str, result: str) -> bool:
+        return bool(self._complete(
+            keys=[self._key('leases'), self._key('workers'), self._key('results')],
+            args=[task_id, worker_id, result],
+        ))
+
+    def fail(self, task_id: str, worker_id: str, error: str) -> bool:
+        return bool(self._fail(
+            keys=[self._key('leases'), self._key('workers'), self._key('attempts'), self._key('failed'), self._key('pending')],
+            args=[task_id, worker_id, error, self.max_attempts],
+        ))
+
+    def requeue_failed(self) -> int:
+        task_ids = self.redis.hkeys(self._key('failed'))
+        if not task_ids:
+            return 0
+        pipe = self.redis.pipeline()
+        pipe.hdel(self._key('failed'), *task_ids)
+        pipe.hdel(self._key('attempts'), *task_ids)
+        pipe.rpush(self._key('pending'), *task_ids)
+        pipe.execute()
+        return len(task_ids)
+
+    def results(self) -> dict:
+        return self.redis.hgetall(self._key('results'))
+
+    def failed(self) -> dict:
+        return self.redis.hgetall(self._key('failed'))
+
+    def counts(self) -> dict:
+        return {
+            PENDING: self.redis.llen(self._key('pending')),
+            LEASED: self.redis.zcard(self._key('leases')),
+            DONE: self.redis.hlen(self._key('results')),
+            FAILED: self.redis.hlen(self._key('failed')),
+        }
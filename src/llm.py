@@ -1,11 +1,12 @@
 ﻿import os
-from typing import Any, Dict
-from langchain.llms import BaseLLM
-from langchain_anthropic import ChatAnthropic
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_openai import ChatOpenAI
-from langchain_core.messages.ai import AIMessage
-from langchain_openai.chat_models.base import BaseChatOpenAI
+from dataclasses import asdict, dataclass
+from typing import TYPE_CHECKING, Any, Dict
+
+# Vendor SDKs are heavy to import (several seconds together), so they are
+# imported lazily in `get_model` only for the vendor that is actually selected.
+if TYPE_CHECKING:
+    from langchain.llms import BaseLLM
+    from langchain_core.messages.ai import AIMessage
 
 MAX_OUPUT_TOKENS = {
     'gpt-4o': 16_384,
@@ -37,22 +38,76 @@ def get_api_key(model_vendor) -> str:
 
 def get_model(
     api_key: str, model_vendor="openai", model_name="gpt-4o-mini", temperature: float = 0.2
-) -> BaseLLM:
+) -> "BaseLLM":
     if model_vendor == "openai":
+        from langchain_openai import ChatOpenAI
+
         max_tokens = MAX_OUPUT_TOKENS.get(model_name, 16_384)
         return ChatOpenAI(model_name=model_name, temperature=temperature, api_key=api_key, max_tokens=max_tokens)
     elif model_vendor == "anthropic":
+        from langchain_anthropic import ChatAnthropic
+
         max_tokens = MAX_OUPUT_TOKENS.get(model_name, 4_096)
         return ChatAnthropic(model_name=model_name, temperature=temperature, api_key=api_key, max_tokens=max_tokens, stop=None)
     elif model_vendor == "google":
+        from langchain_google_genai import ChatGoogleGenerativeAI
+
         max_tokens = MAX_OUPUT_TOKENS.get(model_name, 8_192)
         return ChatGoogleGenerativeAI(model=model_name, temperature=temperature, api_key=api_key, max_tokens=max_tokens)
     elif model_vendor == "deepseek":
+        from langchain_openai.chat_models.base import BaseChatOpenAI
+
         max_tokens = MAX_OUPUT_TOKENS.get(model_name, 8_192)
         return BaseChatOpenAI(model=model_name, temperature=temperature, api_key=api_key, max_tokens=max_tokens, openai_api_base='https://api.deepseek.com')
     else:
         raise ValueError(f"Unsupported model vendor: {model_vendor}")
 
 
-def extract_response_text(response: AIMessage, model_vendor: str = 'openai') -> str:
+def extract_response_text(response: "AIMessage", model_vendor: str = 'openai') -> str:
     return response.content
+
+
+def get_client_model_name(client) -> str | None:
+    # Vendor classes name the attribute differently (`model_name` vs `model`)
+    model_name = getattr(client, 'model_name', None) or getattr(client, 'model', None)
+    return model_name.removeprefix('models/') if isinstance(model_name, str) else None
+
+
+def extract_usage(response: "AIMessage") -> Dict[str, int]:
+    """
+    Extracts token usage from a model response.
+
+    Args:
+        response (AIMessage): The model response
+
+    Returns:
+        dict: Token counts with keys 'input_tokens', 'output_tokens' and 'cached_tokens'
+            (cached input tokens are included in 'input_tokens'). Missing values are 0.
+    """
+    usage = getattr(response, 'usage_metadata', None) or {}
+
+    return {
+        'input_tokens': usage.get('input_tokens', 0),
+        'output_tokens': usage.get('output_tokens', 0),
+        'cached_tokens': (usage.get('input_token_details') or {}).get('cache_read', 0),
+    }
+
+
+@dataclass
+class ChunkStats:
+    """Measurements of a single LLM call made for one chunk (each retry is a separate call)."""
+    model_name: str | None
+    input_chars: int
+    output_chars: int
+    input_tokens: int
+    output_tokens: int
+    cached_tokens: int
+    latency: float
+    retry_num: int
+    line_mismatch: bool
+    structure_mismatch: bool = False
+    # Set when the call raised instead of returning a response
+    error: str | None = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
@@ -1,17 +1,48 @@
-﻿from langchain_core.prompts import ChatPromptTemplate
-
-TRANSLATE_PROMPT_SYSTEM = \
+﻿TRANSLATE_PROMPT_SYSTEM = \
 """You are a professional book translator and {to_lang} native speaker.
 Please translate the text from {from_lang} to {to_lang}.
 {book_details}
 Keep all special characters and HTML tags as in the source text.
 Provide THE ENTIRE TRANSLATION in a single response and do not stop until the full text is translated.
-PLEASE RETURN ONLY {to_lang} TRANSLATION."""
+PLEASE RETURN ONLY {to_lang} TRANSLATION.{translation_context}"""
+
+TRANSLATION_CONTEXT_TEMPLATE = """
+
+Context from the previous part of the book, for consistency of names, terms and style. Do not translate or repeat it.
+{context}"""
+
+SUMMARIZE_CONTEXT_PROMPT_SYSTEM = \
+"""You are helping to translate a book into {to_lang}.
+Update the summary of the book so far with the newly translated text below.
+Keep it under {max_words} words, in {to_lang}. Keep the names of characters and places, recurring terms
+as they were translated, the narrator's point of view and the tone. Return only the summary.
+
+Summary so far:
+{summary}"""
+
+
+def __getattr__(name):
+    # langchain_core.prompts takes ~0.4s to import, so prompt templates are built on
+    # first access instead of at import time (commands like `show-chapters` never need them).
+    if name == "TRANSLATE_PROMPT":
+        from langchain_core.prompts import ChatPromptTemplate
+
+        globals()[name] = ChatPromptTemplate([
+            ("system", TRANSLATE_PROMPT_SYSTEM),
+            ("user", "{source_text}")
+        ]).partial(translation_context="")
+        return globals()[name]
+
+    if name == "SUMMARIZE_CONTEXT_PROMPT":
+        from langchain_core.prompts import ChatPromptTemplate
+
+        globals()[name] = ChatPromptTemplate([
+            ("system", SUMMARIZE_CONTEXT_PROMPT_SYSTEM),
+            ("user", "{translated_text}")
+        ])
+        return globals()[name]
 
-TRANSLATE_PROMPT = ChatPromptTemplate([
-    ("system", TRANSLATE_PROMPT_SYSTEM),
-    ("user", "{source_text}")
-])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def generate_book_info_prompt(book_title, book_author):
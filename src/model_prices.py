@@ -1,4 +1,7 @@
-﻿# Prices per million tokens
+﻿import json
+import os
+
+# Prices per million tokens
 INPUT_PRICES_PER_MILLION = {
     'gpt-4o': 2.50,
     'gpt-4o-mini': 0.150,
@@ -7,7 +10,10 @@ INPUT_PRICES_PER_MILLION = {
     'claude-3-5-haiku-20241022': 0.80,
     'claude-3-5-sonnet-20241022': 3.00,
     'gemini-1.5-flash': 0.075,
-    'gemini-1.5-pro': 1.25
+    'gemini-1.5-pro': 1.25,
+    # Free while experimental; priced as the stable gemini-2.0-flash to keep estimates conservative
+    'gemini-2.0-flash-exp': 0.10,
+    'deepseek-chat': 0.27
 }
 
 OUTPUT_PRICES_PER_MILLION = {
@@ -18,22 +24,42 @@ OUTPUT_PRICES_PER_MILLION = {
     'claude-3-5-haiku-20241022': 4.80,
     'claude-3-5-sonnet-20241022': 15.00,
     'gemini-1.5-flash': 0.30,
-    'gemini-1.5-pro': 5.00
+    'gemini-1.5-pro': 5.00,
+    'gemini-2.0-flash-exp': 0.40,
+    'deepseek-chat': 1.10
+}
+
+# Prices of input tokens served from the prompt cache (cache reads)
+CACHED_INPUT_PRICES_PER_MILLION = {
+    'gpt-4o': 1.25,
+    'gpt-4o-mini': 0.075,
+    'o1-mini': 1.50,
+    'claude-3-haiku-20240307': 0.03,
+    'claude-3-5-haiku-20241022': 0.08,
+    'claude-3-5-sonnet-20241022': 0.30,
+    'gemini-1.5-flash': 0.01875,
+    'gemini-1.5-pro': 0.3125,
+    'gemini-2.0-flash-exp': 0.025,
+    'deepseek-chat': 0.07
 }
 
+MODEL_PRICES_FILE = os.getenv("MODEL_PRICES_FILE")
+
 def calculate_price(tokens, model_name, token_type='input'):
     """Calculate the price for the given number of tokens and model.
     
     Args:
         tokens (int): The number of tokens.
         model_name (str): The name of the model.
-        token_type (str): The type of tokens ('input' or 'output').
+        token_type (str): The type of tokens ('input', 'cached_input' or 'output').
 
     Returns:
         float: The calculated price.
     """
     if token_type == 'input':
         model_prices_per_million = INPUT_PRICES_PER_MILLION
+    elif token_type == 'cached_input':
+        model_prices_per_million = CACHED_INPUT_PRICES_PER_MILLION
     elif token_type == 'output':
         model_prices_per_million = OUTPUT_PRICES_PER_MILLION
     else:
@@ -45,4 +71,62 @@ def calculate_price(tokens, model_name, token_type='input'):
     price_per_million = model_prices_per_million[model_name]
     price_per_token = price_per_million / 1_000_000
 
-    return tokens * price_per_token
\ No newline at end of file
+    return tokens * price_per_token
+
+
+def has_price(model_name):
+    """Whether both input and output prices of the model are known (unknown models are priced at 0)."""
+    return model_name in INPUT_PRICES_PER_MILLION and model_name in OUTPUT_PRICES_PER_MILLION
+
+
+def calculate_usage_price(input_tokens, output_tokens, model_name, cached_tokens=0):
+    """Calculate the price of a single model call from its token usage.
+
+    Cached input tokens are a part of `input_tokens` and are billed at the cached input price
+    (or the regular input price if the model has no cached price).
+
+    Args:
+        input_tokens (int): The number of input tokens, including cached ones.
+        output_tokens (int): The number of output tokens.
+        model_name (str): The name of the model.
+        cached_tokens (int): The number of input tokens read from the prompt cache.
+
+    Returns:
+        float: The calculated price.
+    """
+    cached_token_type = 'cached_input' if model_name in CACHED_INPUT_PRICES_PER_MILLION else 'input'
+
+    return (
+        calculate_price(input_tokens - cached_tokens, model_name, 'input')
+        + calculate_price(cached_tokens, model_name, cached_token_type)
+        + calculate_price(output_tokens, model_name, 'output')
+    )
+
+
+def load_price_overrides(path):
+    """Override or extend the price tables from a JSON file.
+
+    The file maps model names to prices per million tokens, e.g.:
+        {"gpt-4o": {"input": 2.5, "cached_input": 1.25, "output": 10.0}}
+
+    Args:
+        path (str): Path to the JSON file.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        overrides = json.load(f)
+
+    tables = {
+        'input': INPUT_PRICES_PER_MILLION,
+        'cached_input': CACHED_INPUT_PRICES_PER_MILLION,
+        'output': OUTPUT_PRICES_PER_MILLION,
+    }
+
+    for model_name, prices in overrides.items():
+        for token_type, price in prices.items():
+            if token_type not in tables:
+                raise ValueError(f"Unknown token type '{token_type}' for model {model_name} in {path}")
+            tables[token_type][model_name] = price
+
+
+if MODEL_PRICES_FILE:
+    load_price_overrides(MODEL_PRICES_FILE)
@@ -0,0 +1,256 @@
+import html
+import os
+import re
+import threading
+from collections import Counter
+
+from src.html_utils import split_html_by_newline
+
+PASSTHROUGH_MIN_BLOCK_SIZE = int(os.getenv("PASSTHROUGH_MIN_BLOCK_SIZE", 500))
+PASSTHROUGH_NUMBER_DENSITY = float(os.getenv("PASSTHROUGH_NUMBER_DENSITY", 0.5))
+# Language detection needs some running text to be reliable
+LANGUAGE_DETECTION_MIN_WORDS = 20
+
+MARKUP = 'markup'
+CODE = 'code'
+NUMBERS = 'numbers'
+LANGUAGE_PREFIX = 'lang:'
+
+TAG_PATTERN = re.compile(r'<[^>]*>')
+HEAD_PATTERN = re.compile(r'<head\b.*?</head>', re.DOTALL | re.IGNORECASE)
+CODE_TAG_PATTERN = re.compile(r'<(/?)(pre|code)\b[^>]*>', re.IGNORECASE)
+CODE_SYMBOLS = set('{}()[];=<>_/\\|&*+#$')
+WORD_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+STOPWORDS = {
+    'en': 'the and of to is in that it was he she with for you not this but his her they have are had be at',
+    'pl': 'nie się na że to jest do jak co ale tak mnie go już był była jego jej tylko przez po od',
+    'de': 'der die und das ist nicht ein eine zu den mit sich auf es dem sie ich war auch aber wie',
+    'fr': 'le la les et des est un une du que pas il elle dans pour qui sur au ne se je avec',
+    'es': 'el la los las y de que en un una es por con no se para lo su pero como del más',
+    'it': 'il la di che e un una non per è con si le del della ma come gli sono lo anche',
+    'pt': 'o os as de que e do da em um uma não com para por se mais mas ele ela é',
+    'nl': 'de het een en van ik is dat niet je op te zijn met hij ze maar voor er aan',
+    'cs': 'je se na že to jsem jako ale by jeho není tak už jak když která který jsou bylo',
+    'sv': 'och att det är en som på av för med jag inte han hon till den har var om men',
+    'ru': 'и в не на я что он с как это она но его к по был так все из у же мне',
+    'uk': 'і в не на що я з він як це та але до його вона був так у й ми є від',
+}
+STOPWORDS = {lang: set(words.split()) for lang, words in STOPWORDS.items()}
+
+# Scripts used by a single language (or where only one is supported): first code point, last code point, language
+SCRIPT_RANGES = [
+    (0x3040, 0x30FF, 'ja'),
+    (0xAC00, 0xD7AF, 'ko'),
+    (0x4E00, 0x9FFF, 'zh'),
+    (0x0370, 0x03FF, 'el'),
+    (0x0590, 0x05FF, 'he'),
+    (0x0600, 0x06FF, 'ar'),
+    (0x0900, 0x097F, 'hi'),
+    (0x0E00, 0x0E7F, 'th'),
+]
+
+
+def base_lang(lang_code: str) -> str:
+    return lang_code.lower().replace('_', '-').split('-')[0]
+
+
+def detect_language(text: str, min_words: int = LANGUAGE_DETECTION_MIN_WORDS) -> str | None:
+    """
+    Detects the language of a text from its script and the frequency of common words.
+
+    Returns None when there is not enough text or no language clearly stands out.
+
+    Example:
+        >>> detect_language('Es war einmal ein König, der hatte eine Tochter, und sie war die schönste im ganzen Land und auch die klügste.')
+        'de'
+    """
+    words = [word.lower() for word in WORD_PATTERN.findall(text) if not word.isdigit()]
+    if len(words) < min_words:
+        return None
+
+    letters = [c for c in text if c.isalpha()]
+    script_counts = Counter()
+    for c in letters:
+        code_point = ord(c)
+        if code_point < 0x0370:
+            continue
+        for first, last, lang in SCRIPT_RANGES:
+            if first <= code_point <= last:
+                script_counts[lang] += 1
+                break
+
+    if script_counts:
+        lang, count = script_counts.most_common(1)[0]
+        if script_counts['ja'] > 0.1 * len(letters):
+            return 'ja'
+        if count > 0.5 * len(letters):
+            return lang
+
+    scores = Counter({lang: sum(word in stopwords for word in words) for lang, stopwords in STOPWORDS.items()})
+    (best, best_score), (_, second_score) = scores.most_common(2)
+
+    if best_score >= 3 and best_score >= 0.1 * len(words) and best_score >= 1.5 * second_score:
+        return best
+    return None
+
+
+def split_code_text(line: str, in_code: int = 0) -> tuple:
+    """
+    Splits the text of an HTML line into text inside and outside <pre>/<code> elements.
+
+    Args:
+        line (str): HTML line
+        in_code (int): Number of code elements open at the start of the line
+
+    Returns:
+        tuple: (text outside code, text inside code, code elements open at the end of the line)
+    """
+    outside, inside = [], []
+    position = 0
+    for match in CODE_TAG_PATTERN.finditer(line):
+        (inside if in_code else outside).append(line[position:match.start()])
+        in_code = max(in_code - 1, 0) if match.group(1) else in_code + 1
+        position = match.end()
+    (inside if in_code else outside).append(line[position:])
+
+    def text(parts):
+        return html.unescape(TAG_PATTERN.sub('', ''.join(parts)))
+
+    return text(outside), text(inside), in_code
+
+
+class PassthroughClassifier:
+    """
+    Fast local check for documents and blocks that do not need a model call.
+
+    Classifies text as `MARKUP` (no letters, e.g. cover or image pages, separators), `CODE`
+    (listings in <pre>/<code> or text dense with code symbols), `NUMBERS` (no letters, or blocks
+    of at least `min_block_size` characters dense with digits, e.g. tables) or as already written
+    in one of the target languages. Such text is passed through unchanged; everything else,
+    including text in a third language, is translated. Short text is only passed through when it
+    has no letters: a heading, a date or a footnote with a letter in it is always translated.
+
+    Example:
+        classifier = PassthroughClassifier('EN', ['PL'])
+        reason = classifier.classify_document(html)  # e.g. 'markup'
+        chunks = classifier.split(minified_body, max_chunk_size)
+        if classifier.chunk_reason(chunk, 'PL'): ...  # send nothing, keep the chunk
+    """
+
+    def __init__(self, from_lang: str, to_langs: list, min_block_size: int = PASSTHROUGH_MIN_BLOCK_SIZE):
+        self.from_lang = base_lang(from_lang)
+        self.to_langs = {base_lang(lang) for lang in to_langs} - {self.from_lang}
+        self.min_block_size = min_block_size
+        self.skipped_chunks = Counter()
+        self.skipped_chars = Counter()
+        self._lock = threading.Lock()
+
+    def classify_text(self, text: str, code_text: str = '') -> str | None:
+        letters = sum(c.isalpha() for c in text)
+        digits = sum(c.isdigit() for c in text)
+
+        if code_text.strip() and letters == 0:
+            return CODE
+        if letters == 0:
+            return NUMBERS if digits else MARKUP
+
+        non_space = [c for c in text if not c.isspace()]
+        # Dates, page references and headings with numbers are short: only long blocks count as tables
+        if len(non_space) >= self.min_block_size and digits / (letters + digits) >= PASSTHROUGH_NUMBER_DENSITY:
+            return NUMBERS
+        if len(non_space) >= 20 and sum(c in CODE_SYMBOLS for c in non_space) / len(non_space) >= 0.15:
+            return CODE
+
+        lang = detect_language(text)
+        if lang in self.to_langs:
+            return LANGUAGE_PREFIX + lang
+        return None
+
+    def classify_document(self, document_html: str) -> str | None:
+        """Classifies a whole (formatted) HTML document; returns None if it should be translated."""
+        body = HEAD_PATTERN.sub('', document_html)
+        outside, inside, _ = split_code_text(body)
+        text = outside + inside
+
+        if not any(c.isalpha() for c in text):
+            return NUMBERS if any(c.isdigit() for c in text) else MARKUP
+
+        # Prose around listings is still translated; long listings get chunks of their own in `split`
+        if inside.strip() and sum(c.isalpha() for c in outside) < 100:
+            return CODE
+
+        return self.classify_text(outside, inside)
+
+    def classify_lines(self, lines: list) -> list:
+        classes = []
+        in_code = 0
+        for line in lines:
+            outside, inside, in_code = split_code_text(line, in_code)
+            classes.append(self.classify_text(outside, inside))
+        return classes
+
+    def skips(self, reason: str | None, to_lang: str) -> bool:
+        """Whether text classified as `reason` is passed through when translating into `to_lang`."""
+        if reason is None:
+            return False
+        if reason.startswith(LANGUAGE_PREFIX):
+            return reason == LANGUAGE_PREFIX + base_lang(to_lang)
+        return True
+
+    def split(self, minified_html: str, max_chunk_size: int) -> list:
+        """
+        Splits a minified body like `split_html_by_newline`, but puts runs of at least
+        `min_block_size` characters that can be passed through into chunks of their own.
+        """
+        if not minified_html:
+            return []
+
+        lines = minified_html.split('\n')
+        # Text in a target language is only passed through for that language
+        keys = [reason if reason is None or reason.startswith(LANGUAGE_PREFIX) else MARKUP for reason in self.classify_lines(lines)]
+
+        runs = []
+        for line, key in zip(lines, keys):
+            if runs and runs[-1][0] == key:
+                runs[-1][1].append(line)
+            else:
+                runs.append((key, [line]))
+
+        chunks = []
+        pending = []
+        for key, run_lines in runs:
+            run_text = '\n'.join(run_lines)
+            if key is not None and len(run_text) >= self.min_block_size:
+                if pending:
+                    chunks.extend(split_html_by_newline('\n'.join(pending), max_chunk_size))
+                    pending = []
+                chunks.append(run_text)
+            else:
+                pending.extend(run_lines)
+
+        if pending:
+            chunks.extend(split_html_by_newline('\n'.join(pending), max_chunk_size))
+
+        return chunks
+
+    def chunk_reason(self, chunk: str, to_lang: str) -> str | None:
+        """Returns why a chunk can be passed through for `to_lang`, or None if it must be translated."""
+        classes = self.classify_lines(chunk.split('\n'))
+        if not all(self.skips(reason, to_lang) for reason in classes):
+            return None
+
+        reasons = Counter(reason for reason in classes if reason != MARKUP)
+        return reasons.most_common(1)[0][0] if reasons else MARKUP
+
+    def record(self, reason: str, text: str):
+        with self._lock:
+            self.skipped_chunks[reason] += 1
+            self.skipped_chars[reason] += len(text)
+
+    def summary(self) -> str:
+        with self._lock:
+            details = ", ".join("%s: %d (%d chars)" % (reason, count, self.skipped_chars[reason]) for reason, count in self.skipped_chunks.most_common())
+            return "Passthrough: %d documents or chunks not sent to the model%s" % (
+                sum(self.skipped_chunks.values()), " (%s)" % details if details else ""
+            )
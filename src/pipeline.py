@@ -0,0 +1,145 @@
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+from bs4 import BeautifulSoup
+
+from src.dedup import short_blocks
+from src.html_utils import format_html_to_multiline_block_tags, prepare_html, rebuild_html
+from src.passthrough import PassthroughClassifier
+
+PREPROCESS_WORKERS = int(os.getenv("PREPROCESS_WORKERS", 0)) or None
+PIPELINE_DEPTH = int(os.getenv("PIPELINE_DEPTH", 2))
+
+
+@dataclass
+class PreparedDocument:
+    text: str
+    chunks: list | None
+    mapping: dict | None
+    passthrough_reason: str | None = None
+
+
+def create_process_pool(max_workers: int | None = PREPROCESS_WORKERS) -> ProcessPoolExecutor:
+    # "spawn" avoids forking a process that already runs the chunk request threads
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+
+
+def prepare_document(content: bytes, max_chunk_size: int, from_lang: str | None = None, to_langs: list | None = None) -> PreparedDocument:
+    """
+    Parses, formats, minifies and splits one chapter. Runs in a worker process.
+
+    Args:
+        content (bytes): Raw content of the EPUB document
+        max_chunk_size (int): Maximum size of a single chunk
+        from_lang (str, optional): Source language code. When set with `to_langs`, the document is
+            classified with `PassthroughClassifier` and split so that long non-translatable runs
+            get chunks of their own
+        to_langs (list, optional): Target language codes
+
+    Returns:
+        PreparedDocument: The formatted HTML, its chunks and attribute mapping (None if the
+            document has no body) and the reason it may be passed through untranslated, if any
+    """
+    text = format_document(content)
+    passthrough = PassthroughClassifier(from_lang, to_langs) if from_lang and to_langs else None
+
+    prepared = prepare_html(text, max_chunk_size, passthrough)
+    chunks, mapping = prepared if prepared else (None, None)
+    passthrough_reason = passthrough.classify_document(text) if passthrough else None
+
+    return PreparedDocument(text, chunks, mapping, passthrough_reason)
+
+
+def format_document(content: bytes) -> str:
+    return format_html_to_multiline_block_tags(str(BeautifulSoup(content, 'html.parser')))
+
+
+def document_blocks(content: bytes) -> list:
+    """Returns the short block lines of a chapter for deduplication. Runs in a worker process."""
+    return short_blocks(format_document(content))
+
+
+def prepare_ahead(executor, items, get_max_chunk_size, depth: int = PIPELINE_DEPTH, from_lang=None, to_langs=None):
+    """
+    Prepares documents in a process pool ahead of the chapter being translated.
+
+    Keeps up to `depth` documents prepared or being prepared ahead of the one yielded, so the
+    parsing of the next chapters overlaps with the model requests of the current one.
+
+    Args:
+        executor (ProcessPoolExecutor): Pool running `prepare_document`
+        items (list): EPUB documents to prepare, in order
+        get_max_chunk_size (callable): Returns the chunk size to use for an item, called when it is submitted
+        depth (int): Number of documents prepared ahead
+        from_lang (str, optional): Source language code, see `prepare_document`
+        to_langs (list, optional): Target language codes, see `prepare_document`
+
+    Yields:
+        tuple: (item, PreparedDocument) in document order
+    """
+    items = iter(items)
+    window = deque()
+
+    def submit_next():
+        item = next(items, None)
+        if item is not None:
+            window.append((item, executor.submit(prepare_document, item.content, get_max_chunk_size(item), from_lang, to_langs)))
+
+    for _ in range(depth + 1):
+        submit_next()
+
+    while window:
+        item, future = window.popleft()
+        submit_next()
+
+        yield item, future.result()
+
+
+class RebuildStage:
+    """
+    Rebuilds translated documents in a process pool behind the chapter being translated.
+
+    At most `max_pending` rebuilds run at a time; submitting more waits for the oldest one.
+    A rebuild that fails in the pool (e.g. a worker process died) is retried in this process;
+    documents that still cannot be rebuilt are listed in `errors` with the reason.
+
+    Example:
+        rebuilds = RebuildStage(executor, max_pending=4)
+        rebuilds.submit(('PL', 'chap_1.xhtml'), text, translated_chunks, mapping)
+        results = rebuilds.finish()  # {('PL', 'chap_1.xhtml'): '<html>...'}
+    """
+
+    def __init__(self, executor, max_pending: int):
+        self.executor = executor
+        self.max_pending = max_pending
+        self.results = {}
+        self.errors = {}
+        self._pending = deque()
+
+    def submit(self, key, text: str, translated_chunks: list, mapping: dict):
+        args = (text, translated_chunks, mapping)
+        self._pending.append((key, args, self.executor.submit(rebuild_html, *args)))
+        while len(self._pending) > self.max_pending:
+            self._collect_oldest()
+
+    def _collect_oldest(self):
+        key, args, future = self._pending.popleft()
+        try:
+            self.results[key] = future.result()
+            return
+        except Exception as e:
+            print(f"\t\tError rebuilding {key}, retrying in this process: {str(e)}")
+
+        try:
+            self.results[key] = rebuild_html(*args)
+        except Exception as e:
+            print(f"\t\tError rebuilding {key}: {str(e)}")
+            self.errors[key] = str(e)
+
+    def finish(self) -> dict:
+        while self._pending:
+            self._collect_oldest()
+        return self.results
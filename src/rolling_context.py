@@ -0,0 +1,139 @@
+import html
+import os
+import re
+from collections import deque
+
+from src.llm_prompts import TRANSLATION_CONTEXT_TEMPLATE
+
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", 500))
+CONTEXT_LINES = int(os.getenv("CONTEXT_LINES", 3))
+CONTEXT_SUMMARY_EVERY = int(os.getenv("CONTEXT_SUMMARY_EVERY", 5))
+CONTEXT_SUMMARY_WORDS = int(os.getenv("CONTEXT_SUMMARY_WORDS", 150))
+CONTEXT_SUMMARY_INPUT_MAX_TOKENS = int(os.getenv("CONTEXT_SUMMARY_INPUT_MAX_TOKENS", 4000))
+CONTEXT_LAG = int(os.getenv("CONTEXT_LAG", 2))
+
+TAG_PATTERN = re.compile(r'<[^>]*>')
+
+
+def tiktoken_counter(model_name: str):
+    """
+    Returns a function counting the tokens of a text with the tokenizer of `model_name`.
+
+    Models not known to tiktoken (other vendors) are counted with the gpt-4o tokenizer, which is
+    close enough for enforcing a context budget.
+    """
+    import tiktoken
+
+    try:
+        encoding = tiktoken.encoding_for_model(model_name)
+    except KeyError:
+        encoding = tiktoken.get_encoding('o200k_base')
+
+    return lambda text: len(encoding.encode(text))
+
+
+def text_lines(chunk: str) -> list:
+    """Returns the non-empty text lines of a minified chunk, without tags."""
+    lines = (html.unescape(TAG_PATTERN.sub('', line)).strip() for line in chunk.split('\n'))
+    return [line for line in lines if any(c.isalpha() for c in line)]
+
+
+def fit_words(text: str, fits, keep_end: bool = False) -> str:
+    """
+    Returns the longest run of leading (or trailing) words of `text` for which `fits` is true.
+
+    Example:
+        >>> fit_words('one two three', lambda t: len(t) <= 8)
+        'one two'
+    """
+    words = text.split()
+    low, high = 0, len(words)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if fits(' '.join(words[-middle:] if keep_end else words[:middle])):
+            low = middle
+        else:
+            high = middle - 1
+
+    if low == 0:
+        return ''
+    return ' '.join(words[-low:] if keep_end else words[:low])
+
+
+class RollingContext:
+    """
+    Compact, token-bounded record of the translation so far, added to the prompt of the next chunk.
+
+    It keeps the last `lines` translated source/target line pairs and, with `summarize` set, a short
+    summary refreshed every `summary_every` chunks from the text translated since the previous one.
+    The rendered context never exceeds `max_tokens`: the oldest lines are dropped first, then the
+    summary is shortened.
+
+    Example:
+        context = RollingContext(tiktoken_counter('gpt-4o-mini'), summarize=summarize)
+        translated = translate_chunk(client, chunk, ..., translation_context=context.render())
+        context.update(chunk, translated)
+    """
+
+    def __init__(self, count_tokens, summarize=None, max_tokens: int = CONTEXT_MAX_TOKENS, lines: int = CONTEXT_LINES,
+                 summary_every: int = CONTEXT_SUMMARY_EVERY, summary_input_max_tokens: int = CONTEXT_SUMMARY_INPUT_MAX_TOKENS):
+        self.count_tokens = count_tokens
+        self.summarize = summarize
+        self.max_tokens = max_tokens
+        self.summary_every = summary_every
+        self.summary_input_max_tokens = summary_input_max_tokens
+        self.recent_lines = deque(maxlen=lines)
+        self.summary = ''
+        self.chunks = 0
+        self._unsummarized = []
+
+    def update(self, source_chunk: str, translated_chunk: str):
+        source_lines = text_lines(source_chunk)
+        translated_lines = text_lines(translated_chunk)
+
+        if len(source_lines) == len(translated_lines):
+            pairs = list(zip(source_lines, translated_lines))
+        else:
+            # Lines cannot be paired reliably, keep the translation only
+            pairs = [(None, line) for line in translated_lines]
+        self.recent_lines.extend(pairs)
+
+        self.chunks += 1
+        self._unsummarized.append('\n'.join(translated_lines))
+
+        if self.summarize and self.chunks % self.summary_every == 0:
+            self._refresh_summary()
+
+    def _refresh_summary(self):
+        text = '\n'.join(self._unsummarized)
+        if self.count_tokens(text) > self.summary_input_max_tokens:
+            text = fit_words(text, lambda t: self.count_tokens(t) <= self.summary_input_max_tokens, keep_end=True)
+
+        try:
+            self.summary = self.summarize(self.summary, text).strip()
+            self._unsummarized = []
+        except Exception as e:
+            print(f"\t\tWarning: Could not update the translation summary: {str(e)}")
+
+    def _format(self, summary: str, lines: list) -> str:
+        parts = []
+        if summary:
+            parts.append("Summary: %s" % summary)
+        if lines:
+            parts.append("Last translated lines:")
+            parts.extend(target if source is None else "%s => %s" % (source, target) for source, target in lines)
+
+        return TRANSLATION_CONTEXT_TEMPLATE.format(context='\n'.join(parts)) if parts else ''
+
+    def render(self) -> str:
+        """Returns the context for the next chunk's prompt, within `max_tokens`."""
+        lines = list(self.recent_lines)
+        summary = self.summary
+
+        while lines and self.count_tokens(self._format(summary, lines)) > self.max_tokens:
+            lines.pop(0)
+
+        if summary and self.count_tokens(self._format(summary, lines)) > self.max_tokens:
+            summary = fit_words(summary, lambda s: self.count_tokens(self._format(s, lines)) <= self.max_tokens)
+
+        return self._format(summary, lines)
@@ -0,0 +1,180 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+from src.llm import ChunkStats
+
+# Upper bounds of the histogram buckets; the last bucket takes everything above
+LATENCY_BUCKETS = [1, 2, 5, 10, 20, 30, 60, 90, 120]
+TOKEN_BUCKETS = [250, 500, 1000, 2000, 4000, 8000, 16000]
+HISTOGRAM_WIDTH = 40
+
+SORT_KEYS = {
+    'latency': lambda record: record['latency'],
+    'cost': lambda record: record['cost'],
+    'tokens': lambda record: record['input_tokens'] + record['output_tokens'],
+}
+
+
+class RunLog:
+    """
+    Structured record of every model call of a translation run, appended to a JSONL file.
+
+    Each line holds the `ChunkStats` of one call together with where the chunk came from
+    (target language, chapter number, document name and chunk index) and its cost. Calls that
+    raised are recorded too, with their latency and `error`.
+    Lines of one run share the same `run` id, so a resumed run can append to the same file.
+
+    Example:
+        run_log = RunLog('book.run.jsonl')
+        run_log.record(stats, 'PL', chapter=3, document='chapter3.xhtml', chunk=0, cost=0.0012)
+        print(format_report(load_records('book.run.jsonl')))
+    """
+
+    def __init__(self, path: str, run: str | None = None):
+        self.path = path
+        self.run = run or time.strftime('%Y%m%d-%H%M%S') + '-%d' % os.getpid()
+        self._lock = threading.Lock()
+
+    def record(self, stats: ChunkStats, lang: str, chapter: int | None = None, document: str | None = None, chunk: int | None = None, cost: float = 0.0, kind: str = 'chunk', chunk_file: str | None = None):
+        line = json.dumps(dict(
+            stats.to_dict(), run=self.run, time=time.time(), kind=kind, lang=lang,
+            chapter=chapter, document=document, chunk=chunk, cost=cost, chunk_file=chunk_file,
+        ), ensure_ascii=False)
+
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+
+
+def load_records(path: str, run: str | None = None, all_runs: bool = False) -> list:
+    """
+    Reads the records of a run log. By default only the records of the latest run are returned.
+
+    Lines that cannot be parsed (e.g. cut off when a run was killed) are skipped.
+    """
+    records = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+
+    if all_runs or not records:
+        return records
+    run = run or records[-1]['run']
+    return [record for record in records if record['run'] == run]
+
+
+def percentile(values: list, q: float) -> float:
+    """Nearest-rank percentile (0 < q <= 100) of a non-empty list of values."""
+    ordered = sorted(values)
+    rank = max(int(-(-q * len(ordered) // 100)), 1)
+    return ordered[rank - 1]
+
+
+def histogram(values: list, buckets: list, unit: str = '') -> list:
+    """Returns the lines of a text histogram of `values` counted into `buckets`."""
+    counts = [0] * (len(buckets) + 1)
+    for value in values:
+        counts[next((i for i, bound in enumerate(buckets) if value < bound), len(buckets))] += 1
+
+    labels = ['<%g%s' % (bound, unit) for bound in buckets] + ['>=%g%s' % (buckets[-1], unit)]
+    largest = max(counts) or 1
+    return [
+        ("%8s %6d %s" % (label, count, '#' * (-(-count * HISTOGRAM_WIDTH // largest)))).rstrip()
+        for label, count in zip(labels, counts)
+    ]
+
+
+def summarize_group(records: list) -> str:
+    latencies = [record['latency'] for record in records]
+    output_tokens = [record['output_tokens'] for record in records]
+    return "%5d %7d %6.1f %6.1f %6.1f %6.1f %7d %7d %7d %9.4f" % (
+        len(records),
+        sum(record['retry_num'] > 0 for record in records),
+        percentile(latencies, 50), percentile(latencies, 90), percentile(latencies, 99), max(latencies),
+        percentile(output_tokens, 50), percentile(output_tokens, 90), max(output_tokens),
+        sum(record['cost'] for record in records),
+    )
+
+
+GROUP_HEADER = "%5s %7s %6s %6s %6s %6s %7s %7s %7s %9s" % (
+    'Calls', 'Retries', 'p50 s', 'p90 s', 'p99 s', 'max s', 'p50 out', 'p90 out', 'max out', 'Cost $'
+)
+
+
+def describe_record(record: dict) -> str:
+    if record['kind'] != 'chunk':
+        location = record['kind']
+    else:
+        location = "chapter %s %s chunk %s" % (record['chapter'], record['document'], record['chunk'])
+
+    flags = []
+    if record['retry_num']:
+        flags.append('retry %d' % record['retry_num'])
+    if record['line_mismatch']:
+        flags.append('line mismatch')
+    if record['structure_mismatch']:
+        flags.append('structure mismatch')
+    if record.get('error'):
+        flags.append('failed: %s' % record['error'])
+
+    return "%7.1fs $%.4f %6d in %6d out %-6s %s (%s)%s%s" % (
+        record['latency'], record['cost'], record['input_tokens'], record['output_tokens'], record['lang'],
+        location, record['model_name'],
+        " [%s]" % ", ".join(flags) if flags else "",
+        "\n\t\t%s" % record['chunk_file'] if record.get('chunk_file') else "",
+    )
+
+
+def format_report(records: list, top: int = 10, sort_by: str = 'latency') -> str:
+    """
+    Formats a report of run log records: latency and output token percentiles per chapter and
+    per model, latency and input token histograms per model, latency histograms per chapter and
+    the top `top` calls by `sort_by` ('latency', 'cost' or 'tokens').
+    """
+    if not records:
+        return "No model calls recorded."
+
+    lines = ["Model calls: %d (%d retries, %d failed), %.1f s total latency, $%.4f" % (
+        len(records), sum(record['retry_num'] > 0 for record in records), sum(bool(record.get('error')) for record in records),
+        sum(record['latency'] for record in records), sum(record['cost'] for record in records),
+    )]
+
+    chapters = defaultdict(list)
+    models = defaultdict(list)
+    for record in records:
+        if record['kind'] == 'chunk':
+            chapters[(record['chapter'] or 0, record['document'] or '')].append(record)
+        else:
+            chapters[(None, record['kind'])].append(record)
+        models[record['model_name'] or 'unknown'].append(record)
+
+    sorted_chapters = sorted(chapters.items(), key=lambda item: (item[0][0] is None, item[0]))
+    lines += ["", "Per chapter:", "%-7s %-28s %s" % ('Chapter', 'Document', GROUP_HEADER)]
+    for (chapter, document), chapter_records in sorted_chapters:
+        lines.append("%-7s %-28s %s" % ('-' if chapter is None else chapter, document[-28:], summarize_group(chapter_records)))
+
+    lines += ["", "Per model:", "%-36s %s" % ('Model', GROUP_HEADER)]
+    for model_name, model_records in sorted(models.items()):
+        lines.append("%-36s %s" % (model_name[-36:], summarize_group(model_records)))
+
+    for model_name, model_records in sorted(models.items()):
+        lines += ["", "Latency histogram (%s):" % model_name]
+        lines += histogram([record['latency'] for record in model_records], LATENCY_BUCKETS, 's')
+        lines += ["", "Input tokens histogram (%s):" % model_name]
+        lines += histogram([record['input_tokens'] for record in model_records], TOKEN_BUCKETS)
+
+    for (chapter, document), chapter_records in sorted_chapters:
+        lines += ["", "Latency histogram (%s):" % (document if chapter is None else "chapter %s %s" % (chapter, document))]
+        lines += histogram([record['latency'] for record in chapter_records], LATENCY_BUCKETS, 's')
+
+    lines += ["", "Top %d chunks by %s:" % (top, sort_by)]
+    for record in sorted(records, key=SORT_KEYS[sort_by], reverse=True)[:top]:
+        lines.append("\t" + describe_record(record))
+
+    return "\n".join(lines)
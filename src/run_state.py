@@ -0,0 +1,68 @@
+import hashlib
+import json
+import os
+import threading
+
+
+class RunState:
+    """
+    Translated chunks of an interrupted run, stored in a JSON file so the run can be resumed.
+
+    Chunks are keyed by target language, document name and a hash of the minified chunk text,
+    so a resumed run reuses only chunks whose source did not change. The chunk size each document
+    was split with is stored too, so a resumed run splits it the same way even if the adaptive
+    chunk size changed in the meantime, and so is the cost spent so far, which counts against the
+    budget of the resumed run.
+
+    Example:
+        state = RunState.load('book.state.json')
+        key = RunState.chunk_key('PL', 'chapter1.xhtml', chunk)
+        translated = state.get(key)
+    """
+
+    def __init__(self, path: str, chunks: dict | None = None, chunk_sizes: dict | None = None, spent_cost: float = 0.0):
+        self.path = path
+        self.chunks = chunks or {}
+        self.chunk_sizes = chunk_sizes or {}
+        self.spent_cost = spent_cost
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str):
+        if not os.path.exists(path):
+            return cls(path)
+
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(path, data.get('chunks'), data.get('chunk_sizes'), data.get('spent_cost', 0.0))
+
+    @staticmethod
+    def chunk_key(lang: str, document_name: str, chunk: str) -> str:
+        return "%s:%s:%s" % (lang, document_name, hashlib.sha1(chunk.encode('utf-8')).hexdigest())
+
+    def get(self, key: str) -> str | None:
+        return self.chunks.get(key)
+
+    def put(self, key: str, translated_chunk: str):
+        with self._lock:
+            self.chunks[key] = translated_chunk
+
+    def chunk_size(self, document_name: str) -> int | None:
+        return self.chunk_sizes.get(document_name)
+
+    def set_chunk_size(self, document_name: str, chunk_size: int):
+        with self._lock:
+            self.chunk_sizes[document_name] = chunk_size
+
+    def set_spent_cost(self, spent_cost: float):
+        with self._lock:
+            self.spent_cost = spent_cost
+
+    def save(self):
+        with self._lock:
+            data = json.dumps({'chunks': self.chunks, 'chunk_sizes': self.chunk_sizes, 'spent_cost': self.spent_cost})
+
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,357 @@
+import ipaddress
+import json
+import re
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict, defaultdict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.llm import ChunkStats
+from src.model_prices import calculate_usage_price
+
+DEFAULT_TENANT = 'default'
+
+
+def parse_tenant_limits(value: str | None) -> dict:
+    """
+    Parses per-tenant concurrency limits.
+
+    Example:
+        >>> parse_tenant_limits('acme=4, beta=1')
+        {'acme': 4, 'beta': 1}
+    """
+    limits = {}
+    for entry in (value or '').split(','):
+        if entry.strip():
+            tenant, _, limit = entry.partition('=')
+            if not limit.strip().isdigit():
+                raise ValueError(f"Invalid tenant limit: {entry.strip()}")
+            limits[tenant.strip()] = int(limit)
+    return limits
+
+
+def is_loopback_host(host: str) -> bool:
+    """
+    Tells whether the server would only be reachable from this machine.
+
+    Example:
+        >>> is_loopback_host('127.0.0.1'), is_loopback_host('localhost'), is_loopback_host('0.0.0.0')
+        (True, True, False)
+    """
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+class FairScheduler:
+    """
+    Runs tasks of many tenants on a fixed number of threads, taking turns between tenants.
+
+    Every tenant has its own FIFO queue and a concurrency limit. Free threads pick the next task
+    round-robin from the tenants that are below their limit, so one tenant submitting a whole
+    book does not hold up the single chunks of another.
+
+    Example:
+        scheduler = FairScheduler(max_concurrency=8, tenant_limits={'acme': 4}, default_tenant_limit=2)
+        future = scheduler.submit('acme', translate_chunk, client, text, 'English', 'Polish')
+        executor = scheduler.executor('acme')  # for code expecting a ThreadPoolExecutor
+    """
+
+    def __init__(self, max_concurrency: int, tenant_limits: dict | None = None, default_tenant_limit: int | None = None):
+        self.max_concurrency = max_concurrency
+        self.tenant_limits = tenant_limits or {}
+        self.default_tenant_limit = default_tenant_limit or max_concurrency
+        self.running = Counter()
+        self.completed = Counter()
+        self.failed = Counter()
+        self._queues = OrderedDict()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._threads = [threading.Thread(target=self._run, daemon=True) for _ in range(max_concurrency)]
+        for thread in self._threads:
+            thread.start()
+
+    def tenant_limit(self, tenant: str) -> int:
+        return self.tenant_limits.get(tenant, self.default_tenant_limit)
+
+    def submit(self, tenant: str, fn, *args, **kwargs) -> Future:
+        future = Future()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Scheduler is shut down")
+            self._queues.setdefault(tenant, deque()).append((future, fn, args, kwargs))
+            self._condition.notify()
+        return future
+
+    def executor(self, tenant: str) -> "TenantExecutor":
+        return TenantExecutor(self, tenant)
+
+    def _next_task(self):
+        for tenant, queue in self._queues.items():
+            if queue and self.running[tenant] < self.tenant_limit(tenant):
+                # Move the tenant to the back of the line for the next free thread
+                self._queues.move_to_end(tenant)
+                self.running[tenant] += 1
+                return tenant, queue.popleft()
+        return None
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while (next_task := self._next_task()) is None:
+                    if self._closed:
+                        return
+                    self._condition.wait()
+
+            tenant, (future, fn, args, kwargs) = next_task
+            outcome = None
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn(*args, **kwargs))
+                    outcome = self.completed
+                except BaseException as e:
+                    future.set_exception(e)
+                    outcome = self.failed
+
+            with self._condition:
+                self.running[tenant] -= 1
+                if outcome is not None:
+                    outcome[tenant] += 1
+                self._condition.notify_all()
+
+    def shutdown(self, wait: bool = True):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def stats(self) -> dict:
+        with self._condition:
+            tenants = set(self._queues) | set(self.completed) | set(self.failed)
+            return {
+                'max_concurrency': self.max_concurrency,
+                'tenants': {
+                    tenant: {
+                        'queued': len(self._queues.get(tenant, ())),
+                        'running': self.running[tenant],
+                        'completed': self.completed[tenant],
+                        'failed': self.failed[tenant],
+                        'limit': self.tenant_limit(tenant),
+                    }
+                    for tenant in sorted(tenants)
+                },
+            }
+
+
+class TenantExecutor:
+    """The `submit` interface of ThreadPoolExecutor, scheduling tasks for one tenant."""
+
+    def __init__(self, scheduler: FairScheduler, tenant: str):
+        self.scheduler = scheduler
+        self.tenant = tenant
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        return self.scheduler.submit(self.tenant, fn, *args, **kwargs)
+
+
+class ClientPool:
+    """
+    Warm model clients shared by all requests, `size` per vendor, model and temperature.
+
+    Clients are created on first use and handed out round-robin; each keeps its own HTTP
+    connection pool, so later requests skip client construction and TLS handshakes.
+
+    Example:
+        clients = ClientPool(lambda vendor, model, temperature: get_model(get_api_key(vendor), vendor, model, temperature))
+        client = clients.get('openai', 'gpt-4o-mini', 0.2)
+    """
+
+    def __init__(self, factory, size: int = 1):
+        self.factory = factory
+        self.size = size
+        self.requests = Counter()
+        self._clients = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def get(self, vendor: str, model_name: str, temperature: float):
+        key = (vendor, model_name, temperature)
+        with self._lock:
+            clients = self._clients[key]
+            if len(clients) < self.size:
+                clients.append(self.factory(vendor, model_name, temperature))
+            client = clients[self.requests[key] % len(clients)]
+            self.requests[key] += 1
+            return client
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                '%s/%s/t%s' % key: {'clients': len(clients), 'requests': self.requests[key]}
+                for key, clients in self._clients.items()
+            }
+
+
+class ServiceMetrics:
+    """Token usage, cost and latency of the model calls made by the service, per tenant and model."""
+
+    def __init__(self):
+        self.started = time.time()
+        self.usage = defaultdict(lambda: {'calls': 0, 'input_tokens': 0, 'output_tokens': 0, 'cached_tokens': 0, 'cost': 0.0, 'latency': 0.0, 'max_latency': 0.0})
+        self._lock = threading.Lock()
+
+    def record(self, tenant: str, stats: ChunkStats):
+        cost = calculate_usage_price(stats.input_tokens, stats.output_tokens, stats.model_name, stats.cached_tokens)
+        with self._lock:
+            usage = self.usage[(tenant, stats.model_name)]
+            usage['calls'] += 1
+            usage['input_tokens'] += stats.input_tokens
+            usage['output_tokens'] += stats.output_tokens
+            usage['cached_tokens'] += stats.cached_tokens
+            usage['cost'] += cost
+            usage['latency'] += stats.latency
+            usage['max_latency'] = max(usage['max_latency'], stats.latency)
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                'uptime': time.time() - self.started,
+                'usage': [
+                    dict(usage, tenant=tenant, model=model_name, avg_latency=usage['latency'] / usage['calls'])
+                    for (tenant, model_name), usage in self.usage.items()
+                ],
+            }
+
+
+class JobRegistry:
+    """
+    Long-running translations (documents, books) run in the background and polled by id.
+
+    Job functions receive the job's `progress` dict and update it as they go; their return value
+    becomes the job result. Finished jobs are dropped `job_ttl` seconds after they finish, so a
+    long-lived service does not keep every result in memory.
+    """
+
+    def __init__(self, max_jobs: int, job_ttl: float = 3600):
+        self.jobs = {}
+        self.job_ttl = job_ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_jobs, thread_name_prefix='job')
+        self._lock = threading.Lock()
+
+    def start(self, tenant: str, kind: str, fn) -> dict:
+        job = {'id': uuid.uuid4().hex, 'tenant': tenant, 'type': kind, 'status': 'queued', 'progress': {}, 'result': None, 'error': None, 'created': time.time()}
+        with self._lock:
+            self._expire()
+            self.jobs[job['id']] = job
+
+        def run():
+            with self._lock:
+                job['status'] = 'running'
+            try:
+                result, error, status = fn(job['progress']), None, 'done'
+            except Exception as e:
+                result, error, status = None, str(e), 'failed'
+            with self._lock:
+                job.update(result=result, error=error, status=status, finished=time.time())
+
+        self._executor.submit(run)
+        return job
+
+    def get(self, job_id: str) -> dict | None:
+        """Returns a snapshot of the job, safe to serialize while the job keeps running."""
+        with self._lock:
+            self._expire()
+            job = self.jobs.get(job_id)
+            return dict(job, progress=dict(job['progress'])) if job is not None else None
+
+    def counts(self) -> dict:
+        with self._lock:
+            self._expire()
+            return dict(Counter(job['status'] for job in self.jobs.values()))
+
+    def _expire(self):
+        expired_before = time.time() - self.job_ttl
+        for job_id in [job_id for job_id, job in self.jobs.items() if job.get('finished', float('inf')) < expired_before]:
+            del self.jobs[job_id]
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def create_server(host: str, port: int, routes: list) -> ThreadingHTTPServer:
+    """
+    Creates a JSON HTTP server.
+
+    Args:
+        host (str): Interface to listen on
+        port (int): Port to listen on, 0 picks a free one
+        routes (list): (method, path regex, handler) tuples. Handlers are called with the parsed
+            JSON body (empty for GET), the tenant from the X-Tenant header and the path regex groups,
+            and return a (status, JSON-serializable payload) tuple
+
+    Returns:
+        ThreadingHTTPServer: The server, not started yet
+    """
+    compiled_routes = [(method, re.compile(pattern + '$'), handler) for method, pattern, handler in routes]
+
+    class Handler(BaseHTTPRequestHandler):
+        def _handle(self, method):
+            path = self.path.split('?', 1)[0]
+            try:
+                for route_method, pattern, handler in compiled_routes:
+                    match = pattern.match(path)
+                    if match and route_method == method:
+                        break
+                else:
+                    raise HTTPError(404, f"Not found: {method} {path}")
+
+                body = {}
+                length = int(self.headers.get('Content-Length') or 0)
+                if length:
+                    try:
+                        body = json.loads(self.rfile.read(length))
+                    except ValueError:
+                        raise HTTPError(400, "Request body is not valid JSON")
+                tenant = self.headers.get('X-Tenant') or DEFAULT_TENANT
+
+                status, payload = handler(body, tenant, *match.groups())
+            except HTTPError as e:
+                status, payload = e.status, {'error': str(e)}
+            except KeyError as e:
+                status, payload = 400, {'error': f"Missing field: {e.args[0]}"}
+            except ValueError as e:
+                status, payload = 400, {'error': str(e)}
+            except Exception as e:
+                status, payload = 500, {'error': str(e)}
+
+            data = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            self._handle('GET')
+
+        def do_POST(self):
+            self._handle('POST')
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    return server
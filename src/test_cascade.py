@@ -0,0 +1,27 @@
+import pytest
+from src.cascade import ModelCascade
+
+
+class FakeClient:
+    def __init__(self, model_name):
+        self.model_name = model_name
+
+
+def test_cascade_summary_counts_escalations_and_savings(make_stats):
+    cascade = ModelCascade(FakeClient('gpt-4o-mini'), FakeClient('gpt-4o'))
+
+    cascade.record_chunk([make_stats('gpt-4o-mini')], escalated=False)
+    cascade.record_chunk([make_stats('gpt-4o-mini')], escalated=False)
+    cascade.record_chunk([make_stats('gpt-4o-mini'), make_stats('gpt-4o')], escalated=True)
+
+    assert cascade.escalation_rate == pytest.approx(1 / 3)
+    # 3x gpt-4o-mini ($0.75 each) + 1x gpt-4o ($12.50)
+    assert cascade.cost == pytest.approx(3 * 0.75 + 12.50)
+    # Everything on gpt-4o would cost 3x $12.50
+    assert cascade.cost_saved == pytest.approx(3 * 12.50 - (3 * 0.75 + 12.50))
+
+
+def test_cascade_without_chunks():
+    cascade = ModelCascade(FakeClient('gpt-4o-mini'), FakeClient('gpt-4o'))
+    assert cascade.escalation_rate == 0.0
+    assert cascade.cost_saved == 0.0
@@ -0,0 +1,98 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from src.chunk_sizer import AdaptiveChunkSizer, chunk_sizer_key, load_chunk_sizer, save_chunk_sizer
+
+
+@pytest.fixture
+def chunk_stats(make_stats):
+    """A clean 10K character chunk at 0.25 output tokens per character, translated in 10s."""
+    def make(**fields):
+        return make_stats(**{
+            'input_chars': 10_000, 'output_chars': 10_000, 'input_tokens': 2_500, 'output_tokens': 2_500, 'latency': 10.0,
+            **fields,
+        })
+
+    return make
+
+
+def test_grows_after_clean_full_sized_chunk(chunk_stats):
+    sizer = AdaptiveChunkSizer(initial_size=10_000, min_size=1_000, max_size=50_000)
+    sizer.observe(chunk_stats())
+    assert sizer.chunk_size > 10_000
+
+
+def test_does_not_grow_after_short_tail_chunk(chunk_stats):
+    sizer = AdaptiveChunkSizer(initial_size=10_000, min_size=1_000, max_size=50_000)
+    sizer.observe(chunk_stats(input_chars=1_000))
+    assert sizer.chunk_size == 10_000
+
+
+@pytest.mark.parametrize("failure", [
+    {'line_mismatch': True},
+    {'retry_num': 1},
+    {'output_tokens': 16_000},
+])
+def test_shrinks_after_failure(failure, chunk_stats):
+    sizer = AdaptiveChunkSizer(initial_size=10_000, min_size=1_000, max_size=50_000, max_output_tokens=16_384)
+    sizer.observe(chunk_stats(**failure))
+    assert sizer.chunk_size < 10_000
+
+
+def test_shrinks_after_slow_chunk(chunk_stats):
+    sizer = AdaptiveChunkSizer(initial_size=10_000, min_size=1_000, max_size=50_000, target_latency=30)
+    sizer.observe(chunk_stats(latency=90))
+    assert sizer.chunk_size == 9_000
+
+
+def test_stays_within_bounds(chunk_stats):
+    sizer = AdaptiveChunkSizer(initial_size=10_000, min_size=8_000, max_size=11_000)
+
+    for _ in range(5):
+        sizer.observe(chunk_stats(input_chars=11_000))
+    assert sizer.chunk_size == 11_000
+
+    for _ in range(5):
+        sizer.observe(chunk_stats(line_mismatch=True))
+    assert sizer.chunk_size == 8_000
+
+
+def test_capped_by_output_token_limit(chunk_stats):
+    # 0.5 output tokens per character with a 4096 token limit leaves room for ~6.5K characters
+    sizer = AdaptiveChunkSizer(initial_size=10_000, min_size=1_000, max_size=50_000, max_output_tokens=4_096)
+    sizer.observe(chunk_stats(input_chars=4_000, output_tokens=2_000))
+    assert sizer.chunk_size == int(4_096 * 0.8 / 0.5)
+
+
+def test_ignores_calls_of_other_models(chunk_stats):
+    sizer = AdaptiveChunkSizer(initial_size=10_000, model_name='gpt-4o-mini')
+    sizer.observe(chunk_stats(model_name='gpt-4o', line_mismatch=True))
+
+    assert (sizer.chunk_size, sizer.tokens_per_char, sizer.observations) == (10_000, None, 0)
+
+    sizer.observe(chunk_stats(line_mismatch=True))
+    assert sizer.chunk_size < 10_000
+
+
+def test_concurrent_observations_are_all_counted(chunk_stats):
+    sizer = AdaptiveChunkSizer(initial_size=10_000, min_size=1_000, max_size=50_000)
+    sequential = AdaptiveChunkSizer(initial_size=10_000, min_size=1_000, max_size=50_000)
+    for _ in range(200):
+        sequential.observe(chunk_stats())
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda _: sizer.observe(chunk_stats()), range(200)))
+
+    assert sizer.to_dict() == sequential.to_dict()
+
+
+def test_state_is_persisted_per_key(tmp_path, chunk_stats):
+    path = str(tmp_path / 'state' / 'chunk_sizes.json')
+    key = chunk_sizer_key('gpt-4o-mini', 'EN', 'PL')
+
+    sizer = load_chunk_sizer(key, 10_000, path=path)
+    sizer.observe(chunk_stats())
+    save_chunk_sizer(key, sizer, path=path)
+
+    assert load_chunk_sizer(key, 10_000, path=path).chunk_size == sizer.chunk_size
+    assert load_chunk_sizer(chunk_sizer_key('gpt-4o', 'EN', 'PL'), 10_000, path=path).chunk_size == 10_000
@@ -0,0 +1,59 @@
+import pytest
+from src.cost_ledger import BudgetExceededError, CostLedger
+
+
+def test_record_accumulates_per_chapter_book_and_run(make_stats):
+    ledger = CostLedger()
+
+    ledger.record(make_stats(), 'PL', chapter=1)
+    ledger.record(make_stats(), 'PL', chapter=2)
+    ledger.record(make_stats(), 'DE', chapter=1)
+
+    assert ledger.chapter_cost('PL', 1) == pytest.approx(0.75)
+    assert ledger.book_costs['PL'] == pytest.approx(1.5)
+    assert ledger.total_cost == pytest.approx(2.25)
+    assert ledger.tokens['DE'] == {'input_tokens': 1_000_000, 'output_tokens': 1_000_000, 'cached_tokens': 0}
+
+
+def test_estimate_uses_observed_token_ratios(make_stats):
+    ledger = CostLedger()
+    default_estimate = ledger.estimate_cost('x' * 4_000, 'gpt-4o')
+
+    ledger.record(make_stats(input_tokens=1_000, output_tokens=2_000, model_name='gpt-4o'), 'PL')
+
+    assert ledger.estimate_cost('x' * 4_000, 'gpt-4o') > default_estimate
+
+
+def test_reserve_respects_budget_including_in_flight_chunks(make_stats):
+    ledger = CostLedger(max_cost=1.0)
+    ledger.record(make_stats(), 'PL')  # $0.75
+
+    ledger.reserve(0.2)
+    with pytest.raises(BudgetExceededError):
+        ledger.reserve(0.1)
+
+    ledger.release(0.2)
+    ledger.reserve(0.1)
+
+
+def test_reserve_without_budget_never_fails():
+    ledger = CostLedger()
+    ledger.reserve(1_000_000)
+
+
+def test_previous_cost_counts_against_the_budget():
+    ledger = CostLedger(max_cost=1.0, previous_cost=0.9)
+
+    with pytest.raises(BudgetExceededError):
+        ledger.reserve(0.2)
+    assert ledger.spent_cost == 0.9
+
+
+def test_reserve_estimate_includes_the_context():
+    ledger = CostLedger(max_cost=1.0)
+
+    without_context = ledger.reserve_estimate('x' * 4_000, 'gpt-4o')
+    with_context = ledger.reserve_estimate('x' * 4_000, 'gpt-4o', context='y' * 4_000)
+
+    assert with_context > without_context
+    assert ledger.reserved_cost == pytest.approx(without_context + with_context)
@@ -0,0 +1,148 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from src.dedup import ChunkDeduplicator, has_translatable_text, is_short_block, remap_placeholders, restore_placeholders
+
+
+class FakeSender:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.sent = []
+        self._lock = threading.Lock()
+
+    def __call__(self, text):
+        with self._lock:
+            self.sent.append(text)
+        time.sleep(self.delay)
+        return text.replace('Hello', 'Cześć').replace('The end', 'Koniec')
+
+
+def test_restore_placeholders():
+    assert restore_placeholders('<p class="v1" id="v12">Hi</p>', {'v1': 'text', 'v12': 'note'}) == '<p class="text" id="note">Hi</p>'
+
+
+def test_remap_placeholders_between_documents():
+    html = '<p class="v1">Hi <a href="v2">x</a></p>'
+    assert remap_placeholders(html, {'v1': 'text', 'v2': 'a.html'}, {'v5': 'a.html', 'v9': 'text'}) == '<p class="v9">Hi <a href="v5">x</a></p>'
+
+
+def test_has_translatable_text():
+    assert has_translatable_text('<p class="v1">Hello</p>')
+    assert not has_translatable_text('<p class="v1">* * *&nbsp;</p>')
+
+
+def test_is_short_block():
+    assert is_short_block('<p class="sep">The end.</p>')
+    assert not is_short_block('<p class="sep">The end.</p><p>More</p>')
+    assert not is_short_block('<p>%s</p>' % ('x' * 300))
+
+
+def test_identical_chunks_are_sent_once_across_documents():
+    deduplicator = ChunkDeduplicator()
+    send = FakeSender()
+
+    first = deduplicator.translate('<p class="v1">Hello</p>', {'v1': 'note'}, 'PL', send)
+    second = deduplicator.translate('<p class="v3">Hello</p>', {'v3': 'note'}, 'PL', send)
+
+    assert first == '<p class="v1">Cześć</p>'
+    assert second == '<p class="v3">Cześć</p>'
+    assert len(send.sent) == 1
+
+
+def test_same_text_with_different_attributes_is_not_shared():
+    deduplicator = ChunkDeduplicator()
+    send = FakeSender()
+
+    deduplicator.translate('<p class="v1">Hello</p>', {'v1': 'note'}, 'PL', send)
+    deduplicator.translate('<p class="v1">Hello</p>', {'v1': 'title'}, 'PL', send)
+
+    assert len(send.sent) == 2
+
+
+def test_languages_are_not_shared():
+    deduplicator = ChunkDeduplicator()
+    send = FakeSender()
+
+    deduplicator.translate('<p>Hello</p>', {}, 'PL', send)
+    deduplicator.translate('<p>Hello</p>', {}, 'DE', send)
+
+    assert len(send.sent) == 2
+
+
+def test_concurrent_duplicates_are_coalesced():
+    deduplicator = ChunkDeduplicator()
+    send = FakeSender(delay=0.1)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(lambda _: deduplicator.translate('<p>Hello</p>', {}, 'PL', send), range(4)))
+
+    assert results == ['<p>Cześć</p>'] * 4
+    assert len(send.sent) == 1
+    assert deduplicator.hits == 3
+
+
+def test_failed_translation_is_not_cached():
+    deduplicator = ChunkDeduplicator()
+
+    def fail(text):
+        raise TimeoutError()
+
+    with pytest.raises(TimeoutError):
+        deduplicator.translate('<p>Hello</p>', {}, 'PL', fail)
+
+    assert deduplicator.translate('<p>Hello</p>', {}, 'PL', FakeSender()) == '<p>Cześć</p>'
+
+
+def test_repeated_blocks_are_translated_once_and_put_back():
+    deduplicator = ChunkDeduplicator(min_block_occurrences=2, dedup_blocks=True)
+    deduplicator.count_blocks('<p>Hello one</p>\n<p>The end.</p>\n<p>* * *</p>')
+    deduplicator.count_blocks('<p>Hello two</p>\n<p>The end.</p>\n<p>* * *</p>')
+    send = FakeSender()
+
+    first = deduplicator.translate('<p>Hello one</p>\n<p>The end.</p>\n<p>* * *</p>', {}, 'PL', send)
+    second = deduplicator.translate('<p>Hello two</p>\n<p>The end.</p>\n<p>* * *</p>', {}, 'PL', send)
+
+    assert first == '<p>Cześć one</p>\n<p>Koniec.</p>\n<p>* * *</p>'
+    assert second == '<p>Cześć two</p>\n<p>Koniec.</p>\n<p>* * *</p>'
+    assert send.sent == ['<p>The end.</p>', '<p>Hello one</p>', '<p>Hello two</p>']
+
+
+def test_repeated_blocks_stay_in_their_chunk_by_default():
+    deduplicator = ChunkDeduplicator(min_block_occurrences=2)
+    deduplicator.count_blocks('<p>Hello one</p>\n<p>“I was.”</p>\n<p>* * *</p>')
+    deduplicator.count_blocks('<p>Hello two</p>\n<p>“I was.”</p>\n<p>* * *</p>')
+    send = FakeSender()
+
+    translated = deduplicator.translate('<p>Hello one</p>\n<p>“I was.”</p>\n<p>* * *</p>', {}, 'PL', send)
+
+    assert translated == '<p>Cześć one</p>\n<p>“I was.”</p>\n<p>* * *</p>'
+    assert send.sent == ['<p>Hello one</p>\n<p>“I was.”</p>\n<p>* * *</p>']
+
+
+def test_accepts_a_few_merged_remainder_lines():
+    deduplicator = ChunkDeduplicator(min_block_occurrences=1, dedup_blocks=True)
+    deduplicator.count_blocks('<p>The end.</p>')
+    send = FakeSender()
+
+    def merge_lines(text):
+        return send(text).replace('\n', ' ')
+
+    translated = deduplicator.translate('<p>A</p>\n<p>B</p>\n<p>The end.</p>\n<p>C</p>', {}, 'PL', merge_lines)
+
+    assert translated == '<p>A</p> <p>B</p> <p>C</p>\n<p>Koniec.</p>'
+    assert send.sent == ['<p>The end.</p>', '<p>A</p>\n<p>B</p>\n<p>C</p>']
+
+
+def test_falls_back_to_whole_chunk_when_remainder_lines_change():
+    deduplicator = ChunkDeduplicator(min_block_occurrences=1, dedup_blocks=True)
+    deduplicator.count_blocks('<p>The end.</p>')
+
+    def merge_lines(text):
+        return text.replace('\n', ' ')
+
+    chunk = '\n'.join('<p>%s</p>' % letter for letter in 'ABCD') + '\n<p>The end.</p>'
+    translated = deduplicator.translate(chunk, {}, 'PL', merge_lines)
+
+    assert translated == chunk.replace('\n', ' ')
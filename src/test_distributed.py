@@ -0,0 +1,25 @@
+from ebooklib import epub
+from src.distributed import assemble_translation, enqueue_translation, requeue_failed_tasks, run_worker
+from src.job_queue import SQLiteJobQueue
+
+
+def test_sqlite_job_queue_enqueue_worker_assemble(tmp_path, capsys, fake_client, write_book):
+    write_book(tmp_path / 'book.epub')
+    queue = SQLiteJobQueue(str(tmp_path / 'queue.db'))
+    enqueue_translation(queue, str(tmp_path / 'book.epub'), str(tmp_path / 'out.epub'))
+
+    def fail(text):
+        raise TimeoutError('model timed out')
+
+    run_worker(fake_client('gpt-4o-mini', translate=fail), queue, 'w1')
+    assemble_translation(queue)
+
+    assert 'PL-00001-00000: model timed out' in capsys.readouterr().out
+    assert not (tmp_path / 'out.epub').exists()
+
+    requeue_failed_tasks(queue)
+    run_worker(fake_client('gpt-4o-mini'), queue, 'w2')
+    assemble_translation(queue)
+
+    translated = epub.read_epub(str(tmp_path / 'out.epub')).get_item_with_href('one.xhtml')
+    assert b'Cze' in translated.content
@@ -0,0 +1,113 @@
+import re
+import zipfile
+import zlib
+
+import ebooklib
+from ebooklib import epub
+
+from src.epub_utils import preserve_head_links
+from src import epub_writer
+from src.epub_writer import deflate, is_stored, write_epub
+
+PNG = b'\x89PNG\r\n\x1a\n' + bytes(range(256)) * 8
+
+
+def without_modified(content):
+    """Drops the dcterms:modified timestamp the OPF gets when it is written."""
+    return re.sub(rb'<meta property="dcterms:modified">[^<]*</meta>', b'', content)
+
+
+def make_book(chapters=20):
+    book = epub.EpubBook()
+    book.set_identifier('id')
+    book.set_title('Title')
+    book.set_language('en')
+
+    style = epub.EpubItem(uid='style', file_name='style.css', media_type='text/css', content=b'p { margin: 0; }' * 50)
+    image = epub.EpubImage(uid='cover', file_name='cover.png', media_type='image/png', content=PNG)
+    book.add_item(style)
+    book.add_item(image)
+
+    documents = []
+    for i in range(chapters):
+        document = epub.EpubHtml(title='Chapter %d' % i, file_name='chapter_%d.xhtml' % i, lang='en')
+        document.content = (
+            '<html><head><link href="style.css" rel="stylesheet" type="text/css"/></head>'
+            '<body><h1>Chapter %d</h1>%s</body></html>' % (i, '<p>Some text.</p>' * 100)
+        )
+        preserve_head_links(document)
+        book.add_item(document)
+        documents.append(document)
+
+    book.toc = [epub.Link(document.file_name, document.title, 'c%d' % i) for i, document in enumerate(documents)]
+    book.add_item(epub.EpubNcx())
+    book.add_item(epub.EpubNav())
+    book.spine = ['nav'] + documents
+    return book
+
+
+def test_is_stored():
+    assert is_stored('EPUB/images/Cover.JPG')
+    assert is_stored('fonts/font.woff2')
+    assert not is_stored('EPUB/chapter.xhtml')
+    assert not is_stored('fonts/font.ttf')
+
+
+def test_deflate_round_trip():
+    data = b'<p>Some text.</p>' * 100
+    assert zlib.decompress(deflate(data), -zlib.MAX_WBITS) == data
+
+
+def test_write_epub_keeps_ocf_order_and_stores_media(tmp_path):
+    path = str(tmp_path / 'book.epub')
+    write_epub(path, make_book(), {}, max_workers=4)
+
+    with zipfile.ZipFile(path) as archive:
+        assert archive.testzip() is None
+        infos = archive.infolist()
+        assert infos[0].filename == 'mimetype'
+        assert infos[0].compress_type == zipfile.ZIP_STORED
+        assert archive.read('mimetype') == b'application/epub+zip'
+        assert [info.filename for info in infos[1:3]] == ['META-INF/container.xml', 'EPUB/content.opf']
+
+        compress_types = {info.filename: info.compress_type for info in infos}
+        assert compress_types['EPUB/cover.png'] == zipfile.ZIP_STORED
+        assert compress_types['EPUB/style.css'] == zipfile.ZIP_DEFLATED
+        assert compress_types['EPUB/chapter_0.xhtml'] == zipfile.ZIP_DEFLATED
+        assert archive.read('EPUB/cover.png') == PNG
+
+        # Items are written in book order, like ebooklib does
+        chapters = [info.filename for info in infos if info.filename.startswith('EPUB/chapter_')]
+        assert chapters == ['EPUB/chapter_%d.xhtml' % i for i in range(20)]
+
+
+def test_write_epub_matches_ebooklib_output(tmp_path):
+    write_epub(str(tmp_path / 'parallel.epub'), make_book(), {})
+    epub.write_epub(str(tmp_path / 'ebooklib.epub'), make_book(), {})
+
+    with zipfile.ZipFile(tmp_path / 'parallel.epub') as parallel, zipfile.ZipFile(tmp_path / 'ebooklib.epub') as reference:
+        assert parallel.namelist() == reference.namelist()
+        for name in reference.namelist():
+            assert without_modified(parallel.read(name)) == without_modified(reference.read(name)), name
+
+
+def test_write_epub_without_zipfile_internals(tmp_path, monkeypatch):
+    monkeypatch.setattr(epub_writer, 'ZIPFILE_INTERNALS', epub_writer.ZIPFILE_INTERNALS + ('_removed_in_a_future_python',))
+    write_epub(str(tmp_path / 'fallback.epub'), make_book(), {})
+
+    with zipfile.ZipFile(tmp_path / 'fallback.epub') as archive:
+        assert archive.testzip() is None
+        assert archive.namelist()[0] == 'mimetype'
+        assert archive.getinfo('EPUB/chapter_0.xhtml').compress_type == zipfile.ZIP_DEFLATED
+
+
+def test_head_links_survive_read_and_write(tmp_path):
+    write_epub(str(tmp_path / 'book.epub'), make_book(chapters=2), {})
+
+    book = epub.read_epub(str(tmp_path / 'book.epub'))
+    for item in book.get_items_of_type(ebooklib.ITEM_DOCUMENT):
+        preserve_head_links(item)
+    write_epub(str(tmp_path / 'copy.epub'), book, {})
+
+    chapter = epub.read_epub(str(tmp_path / 'copy.epub')).get_item_with_href('chapter_1.xhtml')
+    assert b'href="style.css"' in chapter.content
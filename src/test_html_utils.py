@@ -1,5 +1,6 @@
 ﻿import pytest
 from src.html_utils import format_html_to_multiline_block_tags, minify_attributes, restore_attributes
+from src.html_utils import html_structure_matches, prepare_html, rebuild_html
 
 def test_minify_single_attribute():
     html = '<div class="my-class">Content</div>'
@@ -134,3 +135,31 @@ def test_format_html_to_multiline_block_tags_with_content() -> None:
     expected = "<div>Text<p>More text</p>\nFinal</div>\n"
     assert format_html_to_multiline_block_tags(html) == expected
 
+
+def test_prepare_html_minifies_and_splits_body():
+    html = '<html><head><title>T</title></head><body><p class="a">One</p>\n<p class="b">Two</p></body></html>'
+
+    chunks, mapping = prepare_html(html, max_chunk_size=20)
+
+    assert chunks == ['<body><p class="v1">One</p>', '<p class="v2">Two</p></body>']
+    assert mapping == {'v1': 'a', 'v2': 'b'}
+
+def test_prepare_html_without_body():
+    assert prepare_html('Just a title\nAnother title') is None
+
+def test_rebuild_html_restores_attributes_and_head():
+    html = '<html><head><title>T</title></head><body><p class="a">One</p>\n<p class="b">Two</p></body></html>'
+    translated_chunks = ['<body><p class="v1">Jeden</p>', '<p class="v2">Dwa</p></body>']
+
+    rebuilt = rebuild_html(html, translated_chunks, {'v1': 'a', 'v2': 'b'})
+
+    assert rebuilt == '<html><head><title>T</title></head><body><p class="a">Jeden</p><p class="b">Dwa</p></body></html>'
+
+def test_html_structure_matches_translated_text():
+    assert html_structure_matches('<p class="v1">Hello <b>world</b></p>', '<p class="v1">Cześć <b>świecie</b></p>')
+
+def test_html_structure_mismatch_on_dropped_tag():
+    assert not html_structure_matches('<p class="v1">Hello <b>world</b></p>', '<p class="v1">Cześć świecie</p>')
+
+def test_html_structure_mismatch_on_changed_attribute():
+    assert not html_structure_matches('<p class="v1">Hello</p>', '<p class="v2">Cześć</p>')
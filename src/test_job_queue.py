@@ -0,0 +1,146 @@
+import os
+import time
+
+import pytest
+from src.job_queue import DONE, FAILED, LEASE_EXPIRED_ERROR, LEASED, PENDING, FileJobQueue, RedisJobQueue, SQLiteJobQueue, open_queue
+
+
+@pytest.fixture(params=['sqlite', 'file', 'redis'])
+def queue(request, tmp_path, monkeypatch):
+    if request.param == 'sqlite':
+        return SQLiteJobQueue(str(tmp_path / 'queue.db'), max_attempts=2)
+    if request.param == 'redis':
+        # The Lua scripts run in fakeredis only with lupa installed
+        fakeredis = pytest.importorskip('fakeredis')
+        pytest.importorskip('lupa')
+        monkeypatch.setattr('redis.Redis', fakeredis.FakeRedis)
+        return RedisJobQueue('redis://localhost:6379/0', max_attempts=2)
+    return FileJobQueue(str(tmp_path / 'queue'), max_attempts=2)
+
+
+def make_tasks(count):
+    return [{'id': '%05d' % i, 'text': 'chunk %d' % i} for i in range(count)]
+
+
+def test_open_queue_schemes(tmp_path):
+    assert isinstance(open_queue(f"sqlite:///{tmp_path / 'q.db'}"), SQLiteJobQueue)
+    assert isinstance(open_queue(f"file://{tmp_path / 'q1'}"), FileJobQueue)
+    assert isinstance(open_queue(str(tmp_path / 'q2')), FileJobQueue)
+
+
+def test_put_and_get_job(queue):
+    queue.put_job({'input': 'book.epub', 'documents': {'a.xhtml': {'mapping': {'v1': 'x'}}}})
+
+    assert queue.get_job() == {'input': 'book.epub', 'documents': {'a.xhtml': {'mapping': {'v1': 'x'}}}}
+
+
+def test_claim_in_order_and_complete(queue):
+    queue.put_job({})
+    queue.put_tasks(make_tasks(3))
+
+    first = queue.claim('w1', 60)
+    second = queue.claim('w2', 60)
+    assert (first['id'], second['id']) == ('00000', '00001')
+
+    queue.complete(first['id'], 'w1', 'translated 0')
+
+    assert queue.results() == {'00000': 'translated 0'}
+    assert queue.counts() == {PENDING: 1, LEASED: 1, DONE: 1, FAILED: 0}
+
+
+def test_claim_returns_none_when_empty(queue):
+    queue.put_job({})
+    queue.put_tasks(make_tasks(1))
+
+    assert queue.claim('w1', 60) is not None
+    assert queue.claim('w2', 60) is None
+
+
+def test_expired_lease_is_claimed_again(queue):
+    queue.put_job({})
+    queue.put_tasks(make_tasks(1))
+
+    assert queue.claim('w1', 0.01)['id'] == '00000'
+    time.sleep(0.05)
+
+    assert queue.claim('w2', 60)['id'] == '00000'
+
+
+def test_worker_with_expired_lease_cannot_change_task(queue):
+    queue.put_job({})
+    queue.put_tasks(make_tasks(1))
+
+    assert queue.claim('w1', 0.01)['id'] == '00000'
+    time.sleep(0.05)
+    assert queue.claim('w2', 60)['id'] == '00000'
+    assert queue.complete('00000', 'w2', 'from w2')
+
+    assert not queue.fail('00000', 'w1', 'timeout')
+    assert not queue.complete('00000', 'w1', 'from w1')
+    assert queue.results() == {'00000': 'from w2'}
+    assert queue.counts() == {PENDING: 0, LEASED: 0, DONE: 1, FAILED: 0}
+
+
+def test_failed_task_is_retried_until_max_attempts(queue):
+    queue.put_job({})
+    queue.put_tasks(make_tasks(1))
+
+    queue.fail(queue.claim('w1', 60)['id'], 'w1', 'timeout')
+    assert queue.counts()[PENDING] == 1
+
+    queue.fail(queue.claim('w1', 60)['id'], 'w1', 'timeout')
+    assert queue.counts()[FAILED] == 1
+    assert queue.claim('w1', 60) is None
+
+
+def test_expired_leases_count_as_failed_attempts(queue):
+    queue.put_job({})
+    queue.put_tasks(make_tasks(1))
+
+    assert queue.claim('w1', 0.01)['id'] == '00000'
+    time.sleep(0.05)
+    assert queue.claim('w2', 0.01)['id'] == '00000'
+    time.sleep(0.05)
+
+    assert queue.claim('w3', 60) is None
+    assert queue.failed() == {'00000': LEASE_EXPIRED_ERROR}
+    assert queue.counts() == {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 1}
+
+
+def test_requeue_failed_resets_attempts(queue):
+    queue.put_job({})
+    queue.put_tasks(make_tasks(2))
+    for _ in range(2):
+        queue.fail(queue.claim('w1', 60)['id'], 'w1', 'timeout')
+    assert queue.failed() == {'00000': 'timeout'}
+
+    assert queue.requeue_failed() == 1
+    assert queue.failed() == {}
+    assert queue.counts() == {PENDING: 2, LEASED: 0, DONE: 0, FAILED: 0}
+
+    queue.fail(queue.claim('w1', 60)['id'], 'w1', 'timeout')
+    assert queue.counts()[FAILED] == 0
+
+
+def test_file_queue_takes_over_expired_lease_in_place(tmp_path):
+    queue = FileJobQueue(str(tmp_path / 'queue'))
+    queue.put_job({})
+    queue.put_tasks(make_tasks(1))
+
+    queue.claim('w1', 0.01)
+    time.sleep(0.05)
+    assert queue.claim('w2', 60)['id'] == '00000'
+
+    assert os.listdir(tmp_path / 'queue' / 'leases') == ['00000.json']
+    assert queue.complete('00000', 'w2', 'done')
+
+
+def test_put_job_resets_previous_tasks(queue):
+    queue.put_job({})
+    queue.put_tasks(make_tasks(2))
+    queue.complete(queue.claim('w1', 60)['id'], 'w1', 'done')
+
+    queue.put_job({})
+
+    assert queue.results() == {}
+    assert queue.counts() == {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0}
@@ -0,0 +1,43 @@
+import json
+
+import pytest
+from src import model_prices
+from src.llm import MAX_OUPUT_TOKENS
+from src.model_prices import calculate_price, calculate_usage_price, load_price_overrides
+
+
+@pytest.mark.parametrize("model_name", sorted(MAX_OUPUT_TOKENS))
+def test_every_supported_model_has_prices(model_name):
+    assert model_name in model_prices.INPUT_PRICES_PER_MILLION
+    assert model_name in model_prices.OUTPUT_PRICES_PER_MILLION
+    assert model_name in model_prices.CACHED_INPUT_PRICES_PER_MILLION
+
+
+def test_calculate_price_unknown_model():
+    assert calculate_price(1_000_000, 'unknown-model', 'input') == 0
+
+
+def test_calculate_usage_price_bills_cached_tokens_at_cached_price():
+    price = calculate_usage_price(1_000_000, 1_000_000, 'gpt-4o', cached_tokens=400_000)
+    assert price == pytest.approx(0.6 * 2.50 + 0.4 * 1.25 + 10.00)
+
+
+def test_load_price_overrides(tmp_path, monkeypatch):
+    monkeypatch.setattr(model_prices, 'INPUT_PRICES_PER_MILLION', dict(model_prices.INPUT_PRICES_PER_MILLION))
+    monkeypatch.setattr(model_prices, 'OUTPUT_PRICES_PER_MILLION', dict(model_prices.OUTPUT_PRICES_PER_MILLION))
+    path = tmp_path / 'prices.json'
+    path.write_text(json.dumps({'gpt-4o': {'input': 5.0}, 'my-model': {'input': 1.0, 'output': 2.0}}))
+
+    load_price_overrides(str(path))
+
+    assert calculate_price(1_000_000, 'gpt-4o', 'input') == 5.0
+    assert calculate_price(1_000_000, 'gpt-4o', 'output') == 10.0
+    assert calculate_usage_price(1_000_000, 1_000_000, 'my-model') == 3.0
+
+
+def test_load_price_overrides_unknown_token_type(tmp_path):
+    path = tmp_path / 'prices.json'
+    path.write_text(json.dumps({'gpt-4o': {'reasoning': 5.0}}))
+
+    with pytest.raises(ValueError):
+        load_price_overrides(str(path))
@@ -0,0 +1,93 @@
+from src.passthrough import CODE, MARKUP, NUMBERS, PassthroughClassifier, detect_language, split_code_text
+
+ENGLISH = "It was a bright cold day in April, and the clocks were striking thirteen. Winston Smith, his chin nuzzled into his breast in an effort to escape the vile wind, slipped quickly through the glass doors."
+POLISH = "Był jasny, zimny dzień kwietniowy i zegary biły trzynastą. Winston Smith, z brodą wtuloną w pierś, by uchronić się przed przenikliwym wiatrem, szybko wśliznął się przez szklane drzwi, ale nie dość szybko."
+RUSSIAN = "Было холодное ясное апрельское утро, часы пробили тринадцать. Уткнув подбородок в грудь, чтобы спастись от злого ветра, Уинстон Смит торопливо шмыгнул за стеклянную дверь жилого дома, но все же впустил за собой вихрь."
+LISTING = '<pre><code>' + '\n'.join('def f%d(x):\n    return x * %d' % (i, i) for i in range(40)) + '</code></pre>'
+
+
+def document(body):
+    return '<html><head><title>Title</title></head><body>%s</body></html>' % body
+
+
+def test_detect_language():
+    assert detect_language(ENGLISH) == 'en'
+    assert detect_language(POLISH) == 'pl'
+    assert detect_language(RUSSIAN) == 'ru'
+    assert detect_language('Too short to tell.') is None
+
+
+def test_split_code_text():
+    outside, inside, in_code = split_code_text('<p>See:</p><pre>x = 1')
+    assert (outside, inside, in_code) == ('See:', 'x = 1', 1)
+
+    outside, inside, in_code = split_code_text('y = 2</pre><p>Done</p>', in_code)
+    assert (outside, inside, in_code) == ('Done', 'y = 2', 0)
+
+
+def test_classify_document():
+    classifier = PassthroughClassifier('EN', ['PL'])
+
+    assert classifier.classify_document(document('<div><img src="cover.jpg" alt=""/></div>')) == MARKUP
+    assert classifier.classify_document(document('<h1>Listing 1</h1>' + LISTING)) == CODE
+    assert classifier.classify_document(document('<table>%s</table>' % ''.join('<tr><td>%d</td><td>%.2f</td></tr>' % (i, i / 3) for i in range(20)))) == NUMBERS
+    assert classifier.classify_document(document('<p>%s</p>' % POLISH)) == 'lang:pl'
+    assert classifier.classify_document(document('<p>%s</p>' % ENGLISH)) is None
+    # Text in a third language is still translated
+    assert classifier.classify_document(document('<p>%s</p>' % RUSSIAN)) is None
+
+
+def test_classify_document_translates_short_text_with_letters():
+    classifier = PassthroughClassifier('EN', ['PL'])
+    svg = '<svg viewBox="0 0 600 800"><image width="600" height="800" xlink:href="images/part1.jpg"/>%s</svg>' % ''.join(
+        '<path d="M%d %d L%d %d"/>' % (i, i, i + 10, i + 10) for i in range(50)
+    )
+
+    assert classifier.classify_document(document('<div class="part"><h1>Part One</h1>%s</div>' % svg)) is None
+    assert classifier.classify_document(document('<h1>1914</h1><p>August 4, 1914</p>')) is None
+
+
+def test_classify_text_numbers_need_no_letters_or_a_long_block():
+    classifier = PassthroughClassifier('EN', ['PL'], min_block_size=200)
+    table = ' '.join('Q%d %d %d %d' % (i % 4 + 1, 1990 + i, i * 1234, i * 567) for i in range(20))
+
+    assert classifier.classify_text('Footnote 12: see pp. 123-145, 1998, 2001, 2003.') is None
+    assert classifier.classify_text('123-145, 1998') == NUMBERS
+    assert classifier.classify_text(table) == NUMBERS
+
+
+def test_skips_target_language_only_for_that_language():
+    classifier = PassthroughClassifier('EN', ['PL', 'DE'])
+
+    assert classifier.skips('lang:pl', 'PL')
+    assert not classifier.skips('lang:pl', 'DE')
+    assert classifier.skips(CODE, 'DE')
+    assert not classifier.skips(None, 'PL')
+
+
+def test_split_puts_long_listings_into_own_chunks():
+    classifier = PassthroughClassifier('EN', ['PL'], min_block_size=200)
+    body = '<body><p>%s</p>\n%s\n<p>%s</p></body>' % (ENGLISH, LISTING, ENGLISH)
+
+    chunks = classifier.split(body, 10_000)
+
+    assert len(chunks) == 3
+    assert '\n'.join(chunks) == body
+    assert classifier.chunk_reason(chunks[0], 'PL') is None
+    assert classifier.chunk_reason(chunks[1], 'PL') == CODE
+    assert classifier.chunk_reason(chunks[2], 'PL') is None
+
+
+def test_split_keeps_short_blocks_with_the_text():
+    classifier = PassthroughClassifier('EN', ['PL'], min_block_size=200)
+    body = '<p>%s</p>\n<p>* * *</p>\n<p>%s</p>' % (ENGLISH, ENGLISH)
+
+    assert classifier.split(body, 10_000) == [body]
+
+
+def test_record_and_summary():
+    classifier = PassthroughClassifier('EN', ['PL'])
+    classifier.record(CODE, 'x' * 10)
+    classifier.record(CODE, 'x' * 5)
+
+    assert classifier.summary() == "Passthrough: 2 documents or chunks not sent to the model (code: 2 (15 chars))"
@@ -0,0 +1,102 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import pytest
+from src.html_utils import rebuild_html
+from src.pipeline import RebuildStage, create_process_pool, document_blocks, prepare_ahead, prepare_document
+
+
+class FakeItem:
+    def __init__(self, name, content):
+        self.name = name
+        self.content = content
+
+
+def make_html(title, paragraphs=3):
+    body = '<h1 class="title">%s</h1>' % title + ''.join('<p class="para">Line %d</p>' % i for i in range(paragraphs))
+    return ('<html><head></head><body>%s<p class="sep">* * *</p></body></html>' % body).encode('utf-8')
+
+
+@pytest.fixture(scope='module')
+def process_pool():
+    with create_process_pool(max_workers=2) as pool:
+        yield pool
+
+
+def test_prepare_document():
+    prepared = prepare_document(make_html('Chapter 1'), 10_000)
+
+    assert len(prepared.chunks) == 1
+    assert 'Chapter 1' in prepared.chunks[0]
+    assert 'title' in prepared.mapping.values()
+
+
+def test_prepare_document_without_body():
+    prepared = prepare_document(b'<html><head><title>Cover</title></head></html>', 10_000)
+
+    assert prepared.chunks is None
+    assert prepared.mapping is None
+
+
+def test_prepare_ahead_keeps_order(process_pool):
+    items = [FakeItem('chap_%d' % i, make_html('Chapter %d' % i)) for i in range(5)]
+
+    yielded = []
+    for item, prepared in prepare_ahead(process_pool, items, lambda item: 10_000, depth=2):
+        assert 'Chapter %d' % len(yielded) in prepared.chunks[0]
+        yielded.append(item)
+
+    assert yielded == items
+
+
+def test_prepare_ahead_uses_chunk_size_at_submit_time():
+    items = [FakeItem('chap_%d' % i, make_html('Chapter %d' % i, paragraphs=20)) for i in range(3)]
+    sizes = iter([10_000, 100, 100])
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        chunk_counts = [len(prepared.chunks) for _, prepared in prepare_ahead(executor, items, lambda item: next(sizes), depth=0)]
+
+    assert chunk_counts[0] == 1
+    assert chunk_counts[1] > 1
+
+
+def test_rebuild_stage(process_pool):
+    items = [make_html('Chapter %d' % i) for i in range(3)]
+    rebuilds = RebuildStage(process_pool, max_pending=1)
+
+    expected = {}
+    for i, content in enumerate(items):
+        prepared = prepare_document(content, 10_000)
+        translated = [chunk.replace('Line', 'Linia') for chunk in prepared.chunks]
+        rebuilds.submit(('PL', i), prepared.text, translated, prepared.mapping)
+        expected[('PL', i)] = rebuild_html(prepared.text, translated, prepared.mapping)
+
+    assert rebuilds.finish() == expected
+    assert 'Linia 0' in expected[('PL', 0)]
+
+
+def test_document_blocks():
+    assert '<p class="sep">* * *</p>' in document_blocks(make_html('Chapter 1'))
+
+
+def test_rebuild_stage_retries_pool_failures_in_process():
+    class BrokenPool:
+        def submit(self, fn, *args):
+            future = Future()
+            future.set_exception(RuntimeError('worker died'))
+            return future
+
+    prepared = prepare_document(make_html('Chapter 1'), 10_000)
+    rebuilds = RebuildStage(BrokenPool(), max_pending=1)
+    rebuilds.submit('ok', prepared.text, prepared.chunks, prepared.mapping)
+
+    assert rebuilds.finish() == {'ok': rebuild_html(prepared.text, prepared.chunks, prepared.mapping)}
+    assert rebuilds.errors == {}
+
+
+def test_rebuild_stage_reports_failed_documents():
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        rebuilds = RebuildStage(executor, max_pending=2)
+        rebuilds.submit('bad', None, [], {})
+
+        assert rebuilds.finish() == {}
+        assert list(rebuilds.errors) == ['bad']
@@ -0,0 +1,73 @@
+from src.rolling_context import RollingContext, fit_words, text_lines
+
+
+def count_words(text):
+    return len(text.split())
+
+
+def test_text_lines():
+    chunk = '<h1 class="v1">Chapter&nbsp;1</h1>\n<p class="v2">* * *</p>\n<p>Hello <b>world</b></p>'
+    assert text_lines(chunk) == ['Chapter\xa01', 'Hello world']
+
+
+def test_fit_words():
+    assert fit_words('one two three', lambda t: len(t) <= 8) == 'one two'
+    assert fit_words('one two three', lambda t: len(t) <= 10, keep_end=True) == 'two three'
+    assert fit_words('one two three', lambda t: False) == ''
+
+
+def test_keeps_last_line_pairs():
+    context = RollingContext(count_words, lines=2)
+    assert context.render() == ''
+
+    context.update('<p>One</p>\n<p>Two</p>\n<p>Three</p>', '<p>Jeden</p>\n<p>Dwa</p>\n<p>Trzy</p>')
+    rendered = context.render()
+
+    assert 'Two => Dwa\nThree => Trzy' in rendered
+    assert 'One' not in rendered
+
+
+def test_unpaired_lines_keep_translation_only():
+    context = RollingContext(count_words, lines=2)
+    context.update('<p>One. Two.</p>', '<p>Jeden.</p>\n<p>Dwa.</p>')
+
+    assert 'Jeden.\nDwa.' in context.render()
+    assert '=>' not in context.render()
+
+
+def test_summary_every_n_chunks():
+    calls = []
+
+    def summarize(summary, text):
+        calls.append((summary, text))
+        return 'summary %d' % len(calls)
+
+    context = RollingContext(count_words, summarize, summary_every=2)
+    for i in range(4):
+        context.update('<p>Line %d</p>' % i, '<p>Linia %d</p>' % i)
+
+    assert calls == [('', 'Linia 0\nLinia 1'), ('summary 1', 'Linia 2\nLinia 3')]
+    assert 'Summary: summary 2' in context.render()
+
+
+def test_failed_summary_keeps_text_for_next_attempt():
+    def summarize(summary, text):
+        raise RuntimeError('rate limited')
+
+    context = RollingContext(count_words, summarize, summary_every=1)
+    context.update('<p>One</p>', '<p>Jeden</p>')
+    context.update('<p>Two</p>', '<p>Dwa</p>')
+
+    assert context.summary == ''
+    assert context._unsummarized == ['Jeden', 'Dwa']
+
+
+def test_render_stays_within_budget():
+    context = RollingContext(count_words, lambda summary, text: 'word ' * 200, max_tokens=60, lines=5, summary_every=1)
+    context.update('\n'.join('<p>Source line %d</p>' % i for i in range(5)), '\n'.join('<p>Target line %d</p>' % i for i in range(5)))
+    rendered = context.render()
+
+    assert count_words(rendered) <= 60
+    # Lines are dropped before the summary is shortened
+    assert 'Target line' not in rendered
+    assert 'Summary: word' in rendered
@@ -0,0 +1,68 @@
+from src.run_log import RunLog, format_report, histogram, load_records, percentile
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 90) == 90
+    assert percentile(values, 100) == 100
+    assert percentile([7], 99) == 7
+
+
+def test_histogram():
+    lines = histogram([0.5, 1.5, 1.7, 200], [1, 2, 5], 's')
+
+    assert [line.split()[:2] for line in lines] == [['<1s', '1'], ['<2s', '2'], ['<5s', '0'], ['>=5s', '1']]
+    assert lines[1].endswith('#' * 40)
+
+
+def test_run_log_roundtrip_keeps_latest_run(tmp_path, make_stats):
+    path = str(tmp_path / 'book.run.jsonl')
+    RunLog(path, run='first').record(make_stats(latency=1.0), 'PL', 1, 'one.xhtml', 0, 0.001)
+    run_log = RunLog(path, run='second')
+    run_log.record(make_stats(latency=2.0), 'PL', 2, 'two.xhtml', 0, 0.002)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('{"cut off')
+
+    records = load_records(path)
+    assert [(record['run'], record['document'], record['latency']) for record in records] == [('second', 'two.xhtml', 2.0)]
+    assert len(load_records(path, all_runs=True)) == 2
+    assert load_records(path, run='first')[0]['document'] == 'one.xhtml'
+
+
+def test_format_report(tmp_path, make_stats):
+    path = str(tmp_path / 'book.run.jsonl')
+    run_log = RunLog(path)
+    for i in range(5):
+        run_log.record(make_stats(latency=1.0 + i), 'PL', 1, 'one.xhtml', i, 0.001)
+    run_log.record(make_stats(latency=95.0, output_tokens=4000, retry_num=1), 'PL', 2, 'two.xhtml', 3, 0.01, chunk_file='/tmp/translated_text_2_3.html')
+    run_log.record(make_stats(latency=0.5, model_name='gpt-4o'), 'PL', cost=0.0001, kind='summary')
+
+    report = format_report(load_records(path), top=2)
+
+    assert "Model calls: 7 (1 retries, 0 failed)" in report
+    assert "Latency histogram (gpt-4o-mini):" in report
+    chapter_histogram = report.split("Latency histogram (chapter 1 one.xhtml):\n")[1].split('\n\n')[0].split('\n')
+    assert [line.split()[:2] for line in chapter_histogram[:4]] == [['<1s', '0'], ['<2s', '1'], ['<5s', '3'], ['<10s', '1']]
+    assert "Latency histogram (summary):" in report
+    top = report.split("Top 2 chunks by latency:")[1].strip().split('\n')
+    assert 'chapter 2 two.xhtml chunk 3' in top[0] and '[retry 1]' in top[0]
+    assert top[1].strip() == '/tmp/translated_text_2_3.html'
+    assert 'chapter 1 one.xhtml chunk 4' in top[2]
+
+    by_cost = format_report(load_records(path), top=1, sort_by='cost').split("Top 1 chunks by cost:")[1]
+    assert 'chapter 2 two.xhtml chunk 3' in by_cost
+    assert format_report([]) == "No model calls recorded."
+
+
+def test_format_report_flags_failed_calls(tmp_path, make_stats):
+    path = str(tmp_path / 'book.run.jsonl')
+    run_log = RunLog(path)
+    run_log.record(make_stats(latency=1.0), 'PL', 1, 'one.xhtml', 0, 0.001)
+    run_log.record(make_stats(latency=60.0, input_tokens=0, output_tokens=0, error='Request timed out'), 'PL', 1, 'one.xhtml', 1)
+
+    report = format_report(load_records(path), top=1)
+
+    assert "Model calls: 2 (0 retries, 1 failed)" in report
+    top = report.split("Top 1 chunks by latency:")[1].strip()
+    assert 'chapter 1 one.xhtml chunk 1' in top and '[failed: Request timed out]' in top
@@ -0,0 +1,48 @@
+from src.run_state import RunState
+
+
+def test_run_state_roundtrip(tmp_path):
+    path = str(tmp_path / 'book.state.json')
+    key = RunState.chunk_key('PL', 'chapter1.xhtml', '<p class="v1">Hello</p>')
+
+    state = RunState.load(path)
+    assert state.get(key) is None
+
+    state.put(key, '<p class="v1">Cześć</p>')
+    state.save()
+
+    assert RunState.load(path).get(key) == '<p class="v1">Cześć</p>'
+
+
+def test_chunk_key_depends_on_language_document_and_text():
+    keys = {
+        RunState.chunk_key('PL', 'a.xhtml', 'text'),
+        RunState.chunk_key('DE', 'a.xhtml', 'text'),
+        RunState.chunk_key('PL', 'b.xhtml', 'text'),
+        RunState.chunk_key('PL', 'a.xhtml', 'other text'),
+    }
+    assert len(keys) == 4
+
+
+def test_chunk_sizes_are_saved(tmp_path):
+    path = str(tmp_path / 'book.state.json')
+
+    state = RunState.load(path)
+    assert state.chunk_size('chapter1.xhtml') is None
+
+    state.set_chunk_size('chapter1.xhtml', 7_500)
+    state.save()
+
+    assert RunState.load(path).chunk_size('chapter1.xhtml') == 7_500
+
+
+def test_spent_cost_is_saved(tmp_path):
+    path = str(tmp_path / 'book.state.json')
+
+    state = RunState.load(path)
+    assert state.spent_cost == 0.0
+
+    state.set_spent_cost(0.125)
+    state.save()
+
+    assert RunState.load(path).spent_cost == 0.125
@@ -0,0 +1,161 @@
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+from src.server import ClientPool, FairScheduler, HTTPError, JobRegistry, create_server, is_loopback_host, parse_tenant_limits
+
+
+def test_parse_tenant_limits():
+    assert parse_tenant_limits('acme=4, beta=1') == {'acme': 4, 'beta': 1}
+    assert parse_tenant_limits(None) == {}
+
+    with pytest.raises(ValueError):
+        parse_tenant_limits('acme=many')
+
+
+def test_scheduler_takes_turns_between_tenants():
+    scheduler = FairScheduler(max_concurrency=1)
+    order = []
+    gate = threading.Event()
+
+    blocker = scheduler.submit('acme', gate.wait)
+    futures = [scheduler.submit('acme', order.append, 'acme-%d' % i) for i in range(3)]
+    futures.append(scheduler.submit('beta', order.append, 'beta-0'))
+    gate.set()
+
+    blocker.result()
+    for future in futures:
+        future.result()
+    scheduler.shutdown()
+
+    # beta waited for one acme task only, not for the whole acme queue
+    assert order == ['beta-0', 'acme-0', 'acme-1', 'acme-2']
+
+
+def test_scheduler_respects_tenant_limits():
+    scheduler = FairScheduler(max_concurrency=4, tenant_limits={'acme': 1})
+    lock = threading.Lock()
+    running = []
+    peak = []
+
+    def task():
+        with lock:
+            running.append(1)
+            peak.append(len(running))
+        time.sleep(0.02)
+        with lock:
+            running.pop()
+
+    futures = [scheduler.submit('acme', task) for _ in range(4)]
+    for future in futures:
+        future.result()
+
+    assert max(peak) == 1
+    assert scheduler.stats()['tenants']['acme'] == {'queued': 0, 'running': 0, 'completed': 4, 'failed': 0, 'limit': 1}
+    scheduler.shutdown()
+
+
+def test_scheduler_failures_and_cancel():
+    scheduler = FairScheduler(max_concurrency=1)
+    gate = threading.Event()
+    blocker = scheduler.executor('acme').submit(gate.wait)
+    cancelled = scheduler.executor('acme').submit(lambda: 'never')
+    failing = scheduler.submit('acme', lambda: 1 / 0)
+
+    assert cancelled.cancel()
+    gate.set()
+    blocker.result()
+
+    with pytest.raises(ZeroDivisionError):
+        failing.result()
+
+    scheduler.shutdown()
+    assert scheduler.failed['acme'] == 1
+    assert scheduler.completed['acme'] == 1
+
+
+def test_client_pool_reuses_clients():
+    created = []
+    clients = ClientPool(lambda vendor, model_name, temperature: created.append(model_name) or object(), size=2)
+
+    first = [clients.get('openai', 'gpt-4o-mini', 0.2) for _ in range(4)]
+    clients.get('openai', 'gpt-4o', 0.2)
+
+    assert created == ['gpt-4o-mini', 'gpt-4o-mini', 'gpt-4o']
+    assert first[0] is first[2] and first[1] is first[3]
+    assert clients.stats()['openai/gpt-4o-mini/t0.2'] == {'clients': 2, 'requests': 4}
+
+
+def test_job_registry():
+    jobs = JobRegistry(max_jobs=1)
+    done = jobs.start('acme', 'document', lambda progress: progress.update(step=1) or 'ok')
+    failed = jobs.start('acme', 'document', lambda progress: 1 / 0)
+
+    for _ in range(100):
+        if failed['status'] == 'failed':
+            break
+        time.sleep(0.01)
+
+    assert jobs.get(done['id'])['result'] == 'ok'
+    assert jobs.get(done['id'])['progress'] == {'step': 1}
+    assert 'division' in jobs.get(failed['id'])['error']
+    assert jobs.counts() == {'done': 1, 'failed': 1}
+
+
+def test_job_registry_returns_copies_and_expires_finished_jobs():
+    jobs = JobRegistry(max_jobs=1, job_ttl=0.05)
+    release = threading.Event()
+    running = jobs.start('acme', 'document', lambda progress: progress.update(step=1) or release.wait(5))
+
+    for _ in range(100):
+        if running['progress']:
+            break
+        time.sleep(0.01)
+
+    snapshot = jobs.get(running['id'])
+    snapshot['progress']['step'] = 2
+    assert running['progress'] == {'step': 1}
+
+    release.set()
+    for _ in range(100):
+        if jobs.get(running['id']) is None:
+            break
+        time.sleep(0.01)
+
+    assert jobs.get(running['id']) is None
+    assert jobs.counts() == {}
+
+
+def test_is_loopback_host():
+    assert [is_loopback_host(host) for host in ('127.0.0.1', '::1', 'localhost', '0.0.0.0', '', 'example.com')] == [True, True, True, False, False, False]
+
+
+def test_create_server_routes_and_errors():
+    def echo(body, tenant, name):
+        if name == 'missing':
+            raise HTTPError(404, "no such thing")
+        return 200, {'name': name, 'tenant': tenant, 'value': body['value']}
+
+    server = create_server('127.0.0.1', 0, [('POST', r'/echo/(\w+)', echo)])
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = 'http://127.0.0.1:%d' % server.server_address[1]
+
+    def post(path, body):
+        request = urllib.request.Request(url + path, json.dumps(body).encode('utf-8'), {'X-Tenant': 'acme'})
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, json.load(response)
+        except urllib.error.HTTPError as e:
+            return e.code, json.load(e)
+
+    try:
+        assert post('/echo/x', {'value': 1}) == (200, {'name': 'x', 'tenant': 'acme', 'value': 1})
+        assert post('/echo/x', {}) == (400, {'error': 'Missing field: value'})
+        assert post('/echo/missing', {'value': 1})[0] == 404
+        assert post('/nowhere', {})[0] == 404
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,121 @@
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+from ebooklib import epub
+from src.run_log import load_records
+from src.translation_service import create_translation_server
+
+
+@pytest.fixture
+def translation_server(fake_client):
+    server = create_translation_server('127.0.0.1', 0, client_factory=lambda vendor, model_name, temperature: fake_client(model_name))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    server.scheduler.shutdown(wait=False)
+
+
+def request_json(server, path, body=None, tenant='acme'):
+    url = 'http://127.0.0.1:%d%s' % (server.server_address[1], path)
+    data = json.dumps(body).encode('utf-8') if body is not None else None
+    with urllib.request.urlopen(urllib.request.Request(url, data, {'X-Tenant': tenant})) as response:
+        return response.status, json.load(response)
+
+
+def wait_for_job(server, job_id):
+    for _ in range(500):
+        _, job = request_json(server, '/jobs/%s' % job_id)
+        if job['status'] in ('done', 'failed'):
+            return job
+        time.sleep(0.02)
+    raise TimeoutError(job_id)
+
+
+def test_serve_translate_chunk_and_metrics(translation_server):
+    status, result = request_json(translation_server, '/translate-chunk', {'text': '<p>Hello</p>', 'to_lang': 'PL', 'model': 'gpt-4o-mini'})
+    request_json(translation_server, '/translate-chunk', {'text': '<p>Hello again</p>', 'to_lang': 'PL', 'model': 'gpt-4o-mini'})
+
+    assert status == 200
+    assert result == {'translation': '<p>Cześć</p>'}
+
+    _, metrics = request_json(translation_server, '/metrics')
+    assert metrics['clients']['openai/gpt-4o-mini/t0.2'] == {'clients': 1, 'requests': 2}
+    assert metrics['scheduler']['tenants']['acme']['completed'] == 2
+    assert metrics['usage'][0]['calls'] == 2
+    assert metrics['usage'][0]['input_tokens'] == 200
+
+
+def test_serve_translate_document(translation_server):
+    html_text = '<html><head></head><body><h1>Hello</h1><p class="x">Hello world</p></body></html>'
+    status, result = request_json(translation_server, '/translate-document', {'html': html_text, 'to_lang': 'PL,DE'})
+    job = wait_for_job(translation_server, result['job_id'])
+
+    assert status == 202
+    assert job['status'] == 'done'
+    assert job['progress'] == {'chunks_total': 2, 'chunks_translated': 2}
+    assert '<p class="x">Cześć world</p>' in job['result']['PL']
+    assert set(job['result']) == {'PL', 'DE'}
+
+
+def test_serve_translate_epub(translation_server, tmp_path, write_book):
+    write_book(tmp_path / 'book.epub')
+
+    _, result = request_json(translation_server, '/translate-epub', {
+        'input': str(tmp_path / 'book.epub'), 'output': str(tmp_path / 'out.epub'), 'toc': False,
+    })
+    job = wait_for_job(translation_server, result['job_id'])
+
+    assert job['status'] == 'done', job['error']
+    assert job['result'] == {'PL': str(tmp_path / 'out.epub')}
+    assert job['progress']['chunks_translated'] >= 1
+    translated = epub.read_epub(str(tmp_path / 'out.epub')).get_item_with_href('one.xhtml')
+    assert b'Cze' in translated.content
+
+    records = load_records(str(tmp_path / 'out.run.jsonl'))
+    assert (records[0]['chapter'], records[0]['document'], records[0]['chunk'], records[0]['lang']) == (1, 'one.xhtml', 0, 'PL')
+    assert records[0]['chunk_file'].endswith('translated_text_1_0.html')
+
+
+def test_serve_translate_epub_paths_stay_in_epub_root(tmp_path, fake_client):
+    server = create_translation_server('127.0.0.1', 0, client_factory=lambda vendor, model_name, temperature: fake_client(model_name), epub_root=str(tmp_path))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        with pytest.raises(urllib.error.HTTPError) as error:
+            request_json(server, '/translate-epub', {'input': '../book.epub'})
+        assert error.value.code == 403
+    finally:
+        server.shutdown()
+        server.server_close()
+        server.scheduler.shutdown(wait=False)
+
+
+def test_serve_translate_epub_defaults_output_to_epub_root(tmp_path, monkeypatch, fake_client, write_book):
+    root, work_dir = tmp_path / 'books', tmp_path / 'work'
+    root.mkdir()
+    work_dir.mkdir()
+    monkeypatch.chdir(work_dir)
+    write_book(root / 'book.epub')
+    server = create_translation_server('127.0.0.1', 0, client_factory=lambda vendor, model_name, temperature: fake_client(model_name), epub_root=str(root))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        _, result = request_json(server, '/translate-epub', {'input': 'book.epub', 'toc': False})
+        job = wait_for_job(server, result['job_id'])
+    finally:
+        server.shutdown()
+        server.server_close()
+        server.scheduler.shutdown(wait=False)
+
+    assert job['status'] == 'done', job['error']
+    assert job['result'] == {'PL': str(root / 'book.translated.epub')}
+    assert (root / 'book.translated.run.jsonl').exists()
+    assert list(work_dir.iterdir()) == []
+
+
+def test_serve_requires_epub_root_on_public_interfaces(fake_client):
+    with pytest.raises(ValueError):
+        create_translation_server('0.0.0.0', 0, client_factory=lambda vendor, model_name, temperature: fake_client(model_name))
@@ -0,0 +1,208 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from src.cascade import ModelCascade
+from src.cost_ledger import BudgetExceededError, CostLedger
+from src.passthrough import PassthroughClassifier
+from src.rolling_context import RollingContext
+from src.run_state import RunState
+from src.translator import TranslationOptions, TranslationRun, translate, translate_chunk, translate_chunk_cascade, translate_document_chunks
+
+
+def test_translate_chunk_cascade_keeps_primary_translation(fake_client):
+    primary, escalation = fake_client('gpt-4o-mini'), fake_client('gpt-4o')
+    cascade = ModelCascade(primary, escalation)
+
+    translated, _ = translate_chunk_cascade(cascade, '<p class="v1">Hello</p>', 'English', 'Polish')
+
+    assert translated == '<p class="v1">Cześć</p>'
+    assert (primary.calls, escalation.calls, cascade.escalated_chunks) == (1, 0, 0)
+
+
+def test_translate_chunk_cascade_escalates_broken_structure(fake_client):
+    primary = fake_client('gpt-4o-mini', translate=lambda text: 'Cześć')
+    escalation = fake_client('gpt-4o')
+    cascade = ModelCascade(primary, escalation)
+
+    translated, _ = translate_chunk_cascade(cascade, '<p class="v1">Hello</p>', 'English', 'Polish')
+
+    assert translated == '<p class="v1">Cześć</p>'
+    assert (primary.calls, escalation.calls, cascade.escalated_chunks) == (1, 1, 1)
+
+
+@pytest.mark.parametrize("error", [TimeoutError("Request timed out"), TimeoutError()])
+def test_translate_chunk_cascade_escalates_errors(error, fake_client):
+    def fail(text):
+        raise error
+
+    cascade = ModelCascade(fake_client('gpt-4o-mini', translate=fail), fake_client('gpt-4o'))
+
+    translated, _ = translate_chunk_cascade(cascade, '<p class="v1">Hello</p>', 'English', 'Polish')
+
+    assert translated == '<p class="v1">Cześć</p>'
+    assert cascade.escalated_chunks == 1
+
+
+def test_translate_chunk_reports_failed_calls(fake_client):
+    def fail(text):
+        raise TimeoutError()
+
+    errors = []
+    with pytest.raises(TimeoutError):
+        translate_chunk(fake_client('gpt-4o-mini', translate=fail), '<p>Hello</p>', 'English', 'Polish', on_error=errors.append)
+
+    assert [(stats.model_name, stats.error, stats.output_tokens) for stats in errors] == [('gpt-4o-mini', 'TimeoutError', 0)]
+    assert errors[0].latency >= 0
+
+
+def test_translate_chunk_reserves_budget_for_every_retry(fake_client):
+    text = '\n'.join('<p>Hello %d</p>' % i for i in range(20))
+    client = fake_client('gpt-4o-mini', translate=lambda text: text.replace('\n', ' '))
+    ledger = CostLedger()
+    ledger.max_cost = ledger.estimate_cost(text, 'gpt-4o-mini') + 0.00001
+
+    with pytest.raises(BudgetExceededError):
+        translate_chunk(client, text, 'English', 'Polish', on_stats=lambda stats: ledger.record(stats, 'PL'), ledger=ledger)
+
+    assert client.calls == 1
+    assert ledger.reserved_cost == pytest.approx(0)
+
+
+def test_translate_chunk_cascade_reserves_budget_for_the_escalation(fake_client):
+    def fail(text):
+        raise TimeoutError()
+
+    cascade = ModelCascade(fake_client('gpt-4o-mini', translate=fail), fake_client('gpt-4o'))
+    ledger = CostLedger()
+    ledger.max_cost = 2 * ledger.estimate_cost('<p class="v1">Hello</p>', 'gpt-4o-mini')
+
+    with pytest.raises(BudgetExceededError):
+        translate_chunk_cascade(
+            cascade, '<p class="v1">Hello</p>', 'English', 'Polish', on_stats=lambda stats: ledger.record(stats, 'PL'), ledger=ledger,
+        )
+
+    # A chunk that could not be escalated within the budget is not started at all
+    assert (cascade.primary.calls, cascade.escalation.calls) == (0, 0)
+    assert ledger.reserved_cost == pytest.approx(0)
+
+
+def test_translate_chunk_cascade_escalates_within_budget(fake_client):
+    def fail(text):
+        raise TimeoutError()
+
+    cascade = ModelCascade(fake_client('gpt-4o-mini', translate=fail), fake_client('gpt-4o'))
+    ledger = CostLedger(max_cost=1.0)
+
+    translated, _ = translate_chunk_cascade(
+        cascade, '<p class="v1">Hello</p>', 'English', 'Polish', on_stats=lambda stats: ledger.record(stats, 'PL'), ledger=ledger,
+    )
+
+    assert translated == '<p class="v1">Cześć</p>'
+    assert ledger.reserved_cost == pytest.approx(0)
+    assert ledger.total_cost > 0
+
+
+def test_translate_refuses_a_budget_for_models_without_prices(tmp_path, fake_client, write_book):
+    write_book(tmp_path / 'book.epub')
+
+    with pytest.raises(ValueError, match='my-local-model'):
+        translate(
+            fake_client('my-local-model'), str(tmp_path / 'book.epub'), str(tmp_path / 'out.epub'), TranslationOptions(toc=False, max_cost=1.0),
+        )
+
+
+def test_translate_document_chunks_with_rolling_context(fake_client):
+    prompts = []
+
+    class PromptRecordingClient(fake_client):
+        def invoke(self, messages):
+            prompts.append(messages[0].content)
+            return super().invoke(messages)
+
+    chunks = ['<p>Hello Anna</p>', '<p>Hello Bob</p>', '<p>Hello Carl</p>']
+    contexts = {'PL': RollingContext(lambda text: len(text.split()))}
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        translated = translate_document_chunks(
+            executor, PromptRecordingClient('gpt-4o-mini'), chunks, {}, {'PL': 'Polish'}, 'English',
+            TranslationRun(rolling_contexts=contexts, context_lag=0),
+        )
+
+    assert translated == {'PL': ['<p>Cześć Anna</p>', '<p>Cześć Bob</p>', '<p>Cześć Carl</p>']}
+    assert 'Context from the previous part' not in prompts[0]
+    assert 'Hello Anna => Cześć Anna' in prompts[1]
+    assert 'Hello Bob => Cześć Bob' in prompts[2]
+
+
+def test_translate_document_chunks_with_lagging_rolling_context(fake_client):
+    prompts = {}
+    in_flight, max_in_flight = [], []
+
+    class PromptRecordingClient(fake_client):
+        def invoke(self, messages):
+            prompts[messages[-1].content] = messages[0].content
+            in_flight.append(1)
+            max_in_flight.append(len(in_flight))
+            time.sleep(0.05)
+            in_flight.pop()
+            return super().invoke(messages)
+
+    chunks = ['<p>Hello Anna</p>', '<p>Hello Bob</p>', '<p>Hello Carl</p>', '<p>Hello Dan</p>']
+    contexts = {'PL': RollingContext(lambda text: len(text.split()))}
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        translated = translate_document_chunks(
+            executor, PromptRecordingClient('gpt-4o-mini'), chunks, {}, {'PL': 'Polish'}, 'English',
+            TranslationRun(rolling_contexts=contexts, context_lag=1),
+        )
+
+    assert translated == {'PL': ['<p>Cześć Anna</p>', '<p>Cześć Bob</p>', '<p>Cześć Carl</p>', '<p>Cześć Dan</p>']}
+    # Bob is sent with Anna still in flight, Carl once Anna is in the context
+    assert 'Context from the previous part' not in prompts['<p>Hello Bob</p>']
+    assert 'Hello Anna => Cześć Anna' in prompts['<p>Hello Carl</p>']
+    assert 'Hello Bob => Cześć Bob' in prompts['<p>Hello Dan</p>']
+    assert max(max_in_flight) == 2
+
+
+def test_translate_document_chunks_passes_through_untranslatable_chunks(fake_client):
+    client = fake_client('gpt-4o-mini')
+    classifier = PassthroughClassifier('EN', ['PL'])
+    chunks = ['<p>Hello</p>', '<pre><code>x = {"Hello": 1}</code></pre>', '<p>* * *</p>']
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        translated = translate_document_chunks(executor, client, chunks, {}, {'PL': 'Polish'}, 'English', TranslationRun(passthrough=classifier))
+
+    assert translated == {'PL': ['<p>Cześć</p>', chunks[1], chunks[2]]}
+    assert client.calls == 1
+    assert classifier.skipped_chunks == {'code': 1, 'markup': 1}
+
+
+def test_translate_document_chunks_keeps_chunks_in_flight_after_an_error(tmp_path, fake_client):
+    sent = threading.Event()
+
+    def translate(text):
+        if 'Boom' in text:
+            sent.wait(5)
+            raise RuntimeError('rate limited')
+        sent.set()
+        time.sleep(0.2)
+        return text.replace('Hello', 'Cześć')
+
+    chunks = ['<p>Boom</p>', '<p>Hello</p>']
+    run_state = RunState(str(tmp_path / 'book.state.json'))
+    errors = []
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        with pytest.raises(RuntimeError):
+            translate_document_chunks(
+                executor, fake_client('gpt-4o-mini', translate), chunks, {}, {'PL': 'Polish'}, 'English',
+                TranslationRun(
+                    run_state=run_state, on_error=lambda lang, chapter_number, chunk_index, stats: errors.append((lang, chunk_index, stats.error)),
+                ),
+                document_name='one.xhtml',
+            )
+        # The chunk sent before the error is already in the state when the error is raised
+        assert run_state.get(RunState.chunk_key('PL', 'one.xhtml', chunks[1])) == '<p>Cześć</p>'
+        assert errors == [('PL', 0, 'rate limited')]
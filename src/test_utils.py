@@ -1,5 +1,5 @@
 import pytest
-from src.utils import generate_book_filename, sanitize_text
+from src.utils import add_lang_suffix, generate_book_filename, sanitize_text, split_lang_codes
 
 
 def test_generate_book_filename_with_all_params():
@@ -68,4 +68,13 @@ def test_sanitize_text_with_diacritics():
     assert sanitize_text("café études") == "cafe-etudes"
 
 def test_sanitize_text_with_chinese():
-    assert sanitize_text("你好世界") == "Ni-Hao-Shi-Jie-"
\ No newline at end of file
+    assert sanitize_text("你好世界") == "Ni-Hao-Shi-Jie-"
+
+def test_split_lang_codes():
+    assert split_lang_codes("PL, DE,FR,,PL") == ["PL", "DE", "FR"]
+
+def test_split_lang_codes_single():
+    assert split_lang_codes("PL") == ["PL"]
+
+def test_add_lang_suffix():
+    assert add_lang_suffix("books/translated.epub", "DE") == "books/translated.de.epub"
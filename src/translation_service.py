@@ -0,0 +1,166 @@
+import os
+
+from src.dedup import DEDUP_BLOCKS, DEDUPLICATE
+from src.html_utils import rebuild_html
+from src.llm import get_api_key, get_model
+from src.pipeline import prepare_document
+from src.server import ClientPool, FairScheduler, HTTPError, JobRegistry, ServiceMetrics, create_server, is_loopback_host
+from src.translator import (
+    MAX_CHUNK_SIZE, MAX_CONCURRENCY, MODEL_NAME, MODEL_VENDOR, TEMPERATURE, TranslationOptions, TranslationRun, translate,
+    translate_chunk, translate_document_chunks,
+)
+from src.utils import lang_code_to_full_lang, split_lang_codes
+
+
+def create_translation_server(host='127.0.0.1', port=8000, client_factory=None, max_concurrency=MAX_CONCURRENCY, tenant_limits=None, default_tenant_limit=None, clients_per_model=1, max_jobs=8, job_ttl=3600, epub_root=None):
+    """
+    Creates the HTTP translation service used by the `serve` command.
+
+    Endpoints (JSON bodies, the tenant is taken from the X-Tenant header):
+        POST /translate-chunk: {text, from_lang, to_lang} -> {translation}
+        POST /translate-document: {html, from_lang, to_lang} -> 202 {job_id}, result {lang: html}
+        POST /translate-epub: {input, output, from_lang, to_lang, from_chapter, to_chapter, toc, dedup, dedup_blocks, max_cost}
+            -> 202 {job_id}, result {lang: output path}
+        GET /jobs/<id>: status, progress and result of a document or book job
+        GET /metrics: scheduler queues, client pool, token usage, cost and latency per tenant and model
+        GET /health
+
+    All requests may also set `vendor`, `model`, `temperature`, `book_title` and `book_author`.
+    Chunk requests of all endpoints and callers go through one FairScheduler.
+
+    /translate-epub reads and writes files on the server, so its paths are resolved inside `epub_root`.
+    Without `epub_root` any path is accepted and the server only listens on a loopback interface.
+
+    Args:
+        host (str): Interface to listen on
+        port (int): Port to listen on, 0 picks a free one
+        client_factory (callable, optional): Creates a model client from vendor, model name and temperature.
+            Defaults to `get_model` with the vendor's API key
+        max_concurrency (int): Maximum number of model requests in flight for all tenants
+        tenant_limits (dict, optional): Maximum number of model requests in flight per tenant
+        default_tenant_limit (int, optional): Limit of tenants not in `tenant_limits`. Defaults to `max_concurrency`
+        clients_per_model (int): Number of warm clients kept per vendor, model and temperature
+        max_jobs (int): Maximum number of document and book jobs running at the same time
+        job_ttl (float): Seconds a finished job stays available at /jobs/<id>
+        epub_root (str, optional): Directory that /translate-epub input and output paths must be in.
+            The output defaults to "<input>.translated.epub" next to the input.
+            Required when `host` is not a loopback interface
+
+    Returns:
+        ThreadingHTTPServer: The server, with the scheduler, clients, jobs and metrics attached
+    """
+    if epub_root is None and not is_loopback_host(host):
+        raise ValueError(f"Serving on {host} requires an epub root directory for /translate-epub paths")
+    if client_factory is None:
+        client_factory = lambda vendor, model_name, temperature: get_model(get_api_key(vendor), vendor, model_name, temperature)
+
+    clients = ClientPool(client_factory, clients_per_model)
+    scheduler = FairScheduler(max_concurrency, tenant_limits, default_tenant_limit)
+    jobs = JobRegistry(max_jobs, job_ttl)
+    metrics = ServiceMetrics()
+
+    def get_client(body):
+        return clients.get(body.get('vendor', MODEL_VENDOR), body.get('model', MODEL_NAME), float(body.get('temperature', TEMPERATURE)))
+
+    def get_langs(body):
+        to_langs = split_lang_codes(body.get('to_lang', 'PL'))
+        return lang_code_to_full_lang(body.get('from_lang', 'EN')), {lang: lang_code_to_full_lang(lang) for lang in to_langs}
+
+    def translate_chunk_handler(body, tenant):
+        client = get_client(body)
+        full_from_lang, full_to_langs = get_langs(body)
+        if len(full_to_langs) > 1:
+            raise ValueError("translate-chunk accepts a single target language")
+
+        future = scheduler.submit(
+            tenant, translate_chunk, client, body['text'], full_from_lang, next(iter(full_to_langs.values())),
+            body.get('book_title'), body.get('book_author'), on_stats=lambda stats: metrics.record(tenant, stats),
+        )
+        translated_text, _ = future.result()
+        return 200, {'translation': translated_text}
+
+    def translate_document_handler(body, tenant):
+        client = get_client(body)
+        full_from_lang, full_to_langs = get_langs(body)
+        html_text = body['html']
+
+        def run(progress):
+            prepared = prepare_document(html_text.encode('utf-8'), int(body.get('max_chunk_size', MAX_CHUNK_SIZE)))
+            if prepared.chunks is None:
+                return {lang: html_text for lang in full_to_langs}
+
+            translated = set()
+            progress.update(chunks_total=len(prepared.chunks) * len(full_to_langs), chunks_translated=0)
+
+            def on_stats(lang, chapter_number, chunk_index, stats):
+                metrics.record(tenant, stats)
+                translated.add((lang, chunk_index))
+                progress['chunks_translated'] = len(translated)
+
+            translated_chunks = translate_document_chunks(
+                scheduler.executor(tenant), client, prepared.chunks, prepared.mapping, full_to_langs, full_from_lang,
+                TranslationRun(body.get('book_title'), body.get('book_author'), on_stats=on_stats),
+            )
+            return {lang: rebuild_html(prepared.text, chunks, prepared.mapping) for lang, chunks in translated_chunks.items()}
+
+        return 202, {'job_id': jobs.start(tenant, 'document', run)['id']}
+
+    def epub_path(path):
+        if path is None or epub_root is None:
+            return path
+        root = os.path.realpath(epub_root)
+        resolved = os.path.realpath(os.path.join(root, path))
+        if os.path.commonpath([root, resolved]) != root:
+            raise HTTPError(403, f"Path outside of the epub root: {path}")
+        return resolved
+
+    def translate_epub_handler(body, tenant):
+        client = get_client(body)
+        input_path, output_path = epub_path(body['input']), epub_path(body.get('output'))
+        if not os.path.exists(input_path):
+            raise ValueError(f"Input file not found: {body['input']}")
+        if output_path is None and epub_root is not None:
+            # The default book file name is relative to the working directory, outside the root
+            output_path = os.path.splitext(input_path)[0] + '.translated.epub'
+
+        def run(progress):
+            translated = set()
+            progress.update(chunks_translated=0, chapter=None)
+
+            def on_stats(lang, chapter_number, chunk_index, stats):
+                metrics.record(tenant, stats)
+                translated.add((lang, chapter_number, chunk_index))
+                progress.update(chunks_translated=len(translated), chapter=chapter_number)
+
+            options = TranslationOptions(
+                int(body.get('from_chapter', 0)), int(body.get('to_chapter', 9999)), body.get('from_lang', 'EN'),
+                body.get('to_lang', 'PL'), bool(body.get('toc', True)), max_cost=body.get('max_cost'),
+                deduplicate=bool(body.get('dedup', DEDUPLICATE)), dedup_blocks=bool(body.get('dedup_blocks', DEDUP_BLOCKS)),
+            )
+            return translate(client, input_path, output_path, options, executor=scheduler.executor(tenant), on_stats=on_stats)
+
+        return 202, {'job_id': jobs.start(tenant, 'epub', run)['id']}
+
+    def job_handler(body, tenant, job_id):
+        job = jobs.get(job_id)
+        if job is None:
+            raise HTTPError(404, f"Job not found: {job_id}")
+        return 200, job
+
+    def metrics_handler(body, tenant):
+        return 200, dict(metrics.summary(), scheduler=scheduler.stats(), clients=clients.stats(), jobs=jobs.counts())
+
+    server = create_server(host, port, [
+        ('POST', '/translate-chunk', translate_chunk_handler),
+        ('POST', '/translate-document', translate_document_handler),
+        ('POST', '/translate-epub', translate_epub_handler),
+        ('GET', r'/jobs/(\w+)', job_handler),
+        ('GET', '/metrics', metrics_handler),
+        ('GET', '/health', lambda body, tenant: (200, {'status': 'ok'})),
+    ])
+    server.scheduler = scheduler
+    server.clients = clients
+    server.jobs = jobs
+    server.metrics = metrics
+    return server
+
@@ -0,0 +1,788 @@
+import html
+import os
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Callable
+
+import ebooklib
+import langcodes
+from ebooklib import epub
+
+from src import llm_prompts
+from src.cascade import ModelCascade
+from src.chunk_sizer import chunk_sizer_key, load_chunk_sizer, save_chunk_sizer
+from src.cost_ledger import BudgetExceededError, CostLedger
+from src.dedup import ChunkDeduplicator
+from src.epub_utils import get_metadata_author, get_metadata_title, preserve_head_links
+from src.epub_writer import write_epub
+from src.html_utils import html_structure_matches, prepare_html, rebuild_html, restore_attributes
+from src.llm import MAX_OUPUT_TOKENS, ChunkStats, extract_response_text, extract_usage, get_client_model_name
+from src.llm_prompts import generate_book_info_prompt
+from src.model_prices import has_price
+from src.passthrough import PassthroughClassifier
+from src.pipeline import PIPELINE_DEPTH, RebuildStage, create_process_pool, document_blocks, prepare_ahead
+from src.rolling_context import CONTEXT_LAG, CONTEXT_SUMMARY_WORDS, RollingContext, tiktoken_counter
+from src.run_log import RunLog
+from src.run_state import RunState
+from src.utils import add_lang_suffix, generate_book_filename, lang_code_to_full_lang, save_chunk_to_file, split_lang_codes, truncate_text
+
+# langchain.llms pulls in every installed integration; only needed for type hints.
+if TYPE_CHECKING:
+    from langchain.llms import BaseLLM
+
+MODEL_VENDOR = os.getenv("MODEL_VENDOR", "openai")
+MODEL_NAME = os.getenv("MODEL_NAME", "gpt-4o-mini")
+TEMPERATURE = float(os.getenv("TEMPERATURE", 0.2))
+RETRY_LIMIT = int(os.getenv("RETRY_LIMIT", 1))
+
+MAX_CHUNK_SIZE = int(os.getenv("MAX_CHUNK_SIZE", 10_000))
+MAX_CONCURRENCY = int(os.getenv("MAX_CONCURRENCY", 4))
+
+
+@dataclass
+class TranslationOptions:
+    """
+    What `translate` translates and how.
+
+    Attributes:
+        from_chapter (int): Starting chapter for translation
+        to_chapter (int): Ending chapter for translation
+        from_lang (str): Source language code
+        to_lang (str | list): Target language code, a comma-separated list or a list of codes
+        toc (bool): Whether to translate the table of contents
+        adaptive_chunks (bool): Whether to adapt the chunk size to observed model behaviour
+        max_cost (float, optional): Budget in USD for this run and the earlier runs resumed from `state_path`.
+            No model call is made once its estimated cost could go over it; translated chunks and the cost
+            spent are saved to `state_path` so the run can be resumed. The models must have known prices
+        state_path (str, optional): File with translated chunks of an interrupted run to resume from.
+            Defaults to "<output>.state.json" when `max_cost` is set
+        deduplicate (bool): Send identical chunks to the model only once
+        dedup_blocks (bool): With `deduplicate`, also cut repeated short blocks out of their chunks: blocks
+            without letters (scene separators) are passed through and blocks with text are translated once
+        rolling_context (bool): Add a token-bounded context (last translated lines and a summary refreshed
+            every CONTEXT_SUMMARY_EVERY chunks) to every chunk's prompt. Chunks of each language are then
+            translated in order
+        passthrough (bool): Keep documents and long blocks that need no translation (cover and image pages,
+            code listings, tables of numbers, text already in the target language) without sending them
+        run_log_path (str, optional): JSONL file the stats, cost and location of every model call are appended to,
+            for the `report` command. Defaults to "<output>.run.jsonl"
+    """
+    from_chapter: int = 0
+    to_chapter: int = 9999
+    from_lang: str = 'EN'
+    to_lang: str | list = 'PL'
+    toc: bool = True
+    adaptive_chunks: bool = False
+    max_cost: float | None = None
+    state_path: str | None = None
+    deduplicate: bool = False
+    dedup_blocks: bool = False
+    rolling_context: bool = False
+    passthrough: bool = False
+    run_log_path: str | None = None
+
+
+@dataclass
+class TranslationRun:
+    """
+    Book details, shared state and callbacks of a translation run, used by every `translate_document_chunks` call.
+
+    Attributes:
+        book_title (str, optional): Title of the book being translated
+        book_author (str, optional): Author of the book being translated
+        temp_dir (str, optional): Directory to save intermediate translation chunks
+        ledger (CostLedger, optional): Budget every model call reserves its estimated cost from before it is
+            made; `on_stats` must record the calls in it. Raises BudgetExceededError when it runs out
+        run_state (RunState, optional): Chunks already translated by an interrupted run are taken from it
+            and newly translated ones are added to it
+        on_stats (callable, optional): Called with the language code, chapter number, chunk index and
+            `ChunkStats` of every model call
+        on_error (callable, optional): Called with the language code, chapter number, chunk index and
+            `ChunkStats` (with `error` set) of every model call that raised
+        cascade (ModelCascade, optional): Translate with `translate_chunk_cascade` instead of the client
+        deduplicator (ChunkDeduplicator, optional): Reuses translations of identical chunks and repeated
+            blocks across the book
+        rolling_contexts (dict, optional): Target language codes mapped to `RollingContext` records that are
+            added to every chunk's prompt and updated with its translation
+        context_lag (int): Number of preceding chunks that may still be in flight when a chunk is sent with
+            `rolling_contexts`. 0 translates each language strictly in order
+        passthrough (PassthroughClassifier, optional): Chunks it classifies as not translatable (markup,
+            code, numbers, text already in the target language) are kept as they are
+    """
+    book_title: str | None = None
+    book_author: str | None = None
+    temp_dir: str | None = None
+    ledger: CostLedger | None = None
+    run_state: RunState | None = None
+    on_stats: Callable | None = None
+    on_error: Callable | None = None
+    cascade: ModelCascade | None = None
+    deduplicator: ChunkDeduplicator | None = None
+    rolling_contexts: dict | None = None
+    context_lag: int = CONTEXT_LAG
+    passthrough: PassthroughClassifier | None = None
+
+
+def translate_chunk(client: "BaseLLM", text, from_lang, to_lang, book_title=None, book_author=None, retry_num=0, on_stats=None, retry_limit=RETRY_LIMIT, translation_context="", on_error=None, ledger=None):
+    MAX_LINE_DIFF_PERCENTAGE = 0.1
+    MIN_LINES_FOR_RETRY = 10
+
+    messages = llm_prompts.TRANSLATE_PROMPT.format_messages(
+        from_lang=from_lang,
+        to_lang=to_lang,
+        book_details=generate_book_info_prompt(book_title, book_author),
+        translation_context=translation_context,
+        # source_text=html.escape(text)
+        source_text=text
+    )
+
+    model_name = get_client_model_name(client)
+    # Held until `on_stats` has recorded the real cost, so concurrent calls cannot overspend
+    estimated_cost = ledger.reserve_estimate(text, model_name, translation_context) if ledger else 0
+    try:
+        start_time = time.perf_counter()
+        try:
+            response = client.invoke(messages)
+        except Exception as e:
+            if on_error:
+                on_error(ChunkStats(
+                    model_name=model_name,
+                    input_chars=len(text),
+                    output_chars=0,
+                    input_tokens=0,
+                    output_tokens=0,
+                    cached_tokens=0,
+                    latency=time.perf_counter() - start_time,
+                    retry_num=retry_num,
+                    line_mismatch=False,
+                    error=str(e) or type(e).__name__,
+                ))
+            raise
+        latency = time.perf_counter() - start_time
+        print("\t\t" + str(response.usage_metadata))
+
+        translated_text = extract_response_text(response)
+        decoded_text = html.unescape(translated_text)
+
+        original_lines = text.count('\n')
+        decoded_lines = decoded_text.count('\n')
+        line_mismatch = abs(original_lines - decoded_lines) > 2
+        structure_mismatch = not html_structure_matches(text, decoded_text)
+
+        if on_stats:
+            on_stats(ChunkStats(
+                model_name=model_name,
+                input_chars=len(text),
+                output_chars=len(decoded_text),
+                latency=latency,
+                retry_num=retry_num,
+                line_mismatch=line_mismatch,
+                structure_mismatch=structure_mismatch,
+                **extract_usage(response),
+            ))
+    finally:
+        if ledger:
+            ledger.release(estimated_cost)
+
+    if line_mismatch:
+        print(f"\t\tWarning: The number of lines in the original text ({original_lines}) and the decoded text ({decoded_lines}) are different.")
+        print("\t\t\tOriginal last line:", truncate_text(text.splitlines()[-1]))
+        print("\t\t\tTranslated last line:", truncate_text(decoded_text.splitlines()[-1]))
+
+        should_retry = (
+            retry_num < retry_limit and 
+            original_lines > MIN_LINES_FOR_RETRY and 
+            abs(original_lines - decoded_lines) / original_lines > MAX_LINE_DIFF_PERCENTAGE
+        )
+
+        if should_retry:
+            print(f"\t\tRetrying translation... Attempt {retry_num + 1} of {retry_limit}")
+            return translate_chunk(
+                client=client,
+                text=text, 
+                from_lang=from_lang, 
+                to_lang=to_lang, 
+                book_title=book_title, 
+                book_author=book_author, 
+                retry_num=retry_num + 1,
+                on_stats=on_stats,
+                retry_limit=retry_limit,
+                translation_context=translation_context,
+                on_error=on_error,
+                ledger=ledger,
+            )
+
+    return decoded_text, text
+
+
+def translate_chunk_cascade(cascade: ModelCascade, text, from_lang, to_lang, book_title=None, book_author=None, on_stats=None, translation_context="", on_error=None, ledger=None):
+    """
+    Translates a chunk with the primary (cheap) model of the cascade and re-sends it to the
+    escalation model only if the primary translation fails the line-count or HTML structure
+    checks, or the request errors.
+
+    Args:
+        cascade (ModelCascade): Primary and escalation model clients
+        text (str): The chunk to translate
+        from_lang (str): Full source language name
+        to_lang (str): Full target language name
+        book_title (str, optional): Title of the book being translated. Defaults to None
+        book_author (str, optional): Author of the book being translated. Defaults to None
+        on_stats (callable, optional): Called with `ChunkStats` of every model call. Defaults to None
+        translation_context (str, optional): Rolling context added to the prompt. Defaults to ""
+        on_error (callable, optional): Called with `ChunkStats` (with `error` set) of every model call
+            that raised. Defaults to None
+        ledger (CostLedger, optional): Budget every model call reserves its estimated cost from. `on_stats`
+            must record the calls in it. Defaults to None
+
+    Returns:
+        tuple: The translated chunk and the original chunk, as returned by `translate_chunk`
+    """
+    calls = []
+
+    def record_stats(stats):
+        calls.append(stats)
+        if on_stats:
+            on_stats(stats)
+
+    # The escalation is reserved before the primary call, so a chunk is only started when it could be
+    # escalated within the budget
+    escalation_cost = ledger.reserve_estimate(text, cascade.escalation_model_name, translation_context) if ledger else 0
+    try:
+        try:
+            # Retrying on the cheap model is pointless when a stronger one is available
+            translated_chunk, original_chunk = translate_chunk(
+                cascade.primary, text, from_lang, to_lang, book_title, book_author, on_stats=record_stats, retry_limit=0,
+                translation_context=translation_context, on_error=on_error, ledger=ledger,
+            )
+            failure = "line count mismatch" if calls[-1].line_mismatch else "HTML structure mismatch" if calls[-1].structure_mismatch else None
+        except BudgetExceededError:
+            raise
+        except Exception as e:
+            # Many client errors (e.g. timeouts) have no message
+            failure = str(e) or type(e).__name__
+
+        if not failure:
+            cascade.record_chunk(calls, escalated=False)
+            return translated_chunk, original_chunk
+
+        print(f"\t\tEscalating to {cascade.escalation_model_name}: {failure}")
+        if ledger:
+            # Handed over to the escalation call, which reserves its own estimate (and its retries')
+            ledger.release(escalation_cost)
+            escalation_cost = 0
+        try:
+            return translate_chunk(
+                cascade.escalation, text, from_lang, to_lang, book_title, book_author, on_stats=record_stats,
+                translation_context=translation_context, on_error=on_error, ledger=ledger,
+            )
+        finally:
+            cascade.record_chunk(calls, escalated=True)
+    finally:
+        if ledger:
+            ledger.release(escalation_cost)
+
+
+def summarize_context(client: "BaseLLM", summary, translated_text, to_lang, on_stats=None, ledger=None):
+    """
+    Updates the rolling summary of the book with newly translated text (see `RollingContext`).
+
+    Args:
+        client (BaseLLM): The language model client, preferably a cheap one
+        summary (str): The summary so far, may be empty
+        translated_text (str): Text translated since the summary was last updated
+        to_lang (str): Full target language name
+        on_stats (callable, optional): Called with `ChunkStats` of the model call. Defaults to None
+        ledger (CostLedger, optional): Budget the call reserves its estimated cost from. `on_stats` must
+            record the call in it. Defaults to None
+
+    Returns:
+        str: The updated summary
+    """
+    messages = llm_prompts.SUMMARIZE_CONTEXT_PROMPT.format_messages(
+        to_lang=to_lang,
+        max_words=CONTEXT_SUMMARY_WORDS,
+        summary=summary or "(none yet)",
+        translated_text=translated_text,
+    )
+
+    model_name = get_client_model_name(client)
+    estimated_cost = ledger.reserve_estimate(translated_text, model_name, summary) if ledger else 0
+    try:
+        start_time = time.perf_counter()
+        response = client.invoke(messages)
+        latency = time.perf_counter() - start_time
+
+        updated_summary = extract_response_text(response)
+        if on_stats:
+            on_stats(ChunkStats(
+                model_name=model_name,
+                input_chars=len(translated_text),
+                output_chars=len(updated_summary),
+                latency=latency,
+                retry_num=0,
+                line_mismatch=False,
+                **extract_usage(response),
+            ))
+    finally:
+        if ledger:
+            ledger.release(estimated_cost)
+
+    return updated_summary
+
+
+def toc_to_text(toc):
+    return "\n".join([item.title.strip() for item in toc if isinstance(item, epub.Link)])
+
+
+def apply_translated_toc(toc, translated_toc_text):
+    translated_titles = [title.strip() for title in translated_toc_text.split('\n')]
+
+    translated_toc = []
+    title_index = 0
+    for item in toc:
+        if isinstance(item, epub.Link):
+            translated_toc.append(epub.Link(item.href, translated_titles[title_index], item.uid))
+            title_index += 1
+        else:
+            translated_toc.append(item)
+
+    return tuple(translated_toc)
+
+
+def translate_toc(client: "BaseLLM", toc, from_lang='EN', to_lang='PL', on_stats=None, ledger=None):
+    toc_list = list(toc)
+
+    translated_toc_text = translate_text(client, toc_to_text(toc_list), from_lang, to_lang, on_stats=on_stats, ledger=ledger)
+
+    return apply_translated_toc(toc_list, translated_toc_text)
+
+
+def translate_text(
+    client: "BaseLLM",
+    text,
+    from_lang,
+    to_lang,
+    temp_dir=None,
+    book_title=None,
+    book_author=None,
+    chapter_number=None,
+    max_chunk_size=MAX_CHUNK_SIZE,
+    on_stats=None,
+    ledger=None,
+):
+    """
+    Translates HTML text content from one language to another while preserving HTML structure.
+
+    Args:
+        client (BaseLLM): The language model client used for translation
+        text (str): The HTML text content to translate
+        from_lang (str): Source language code
+        to_lang (str): Target language code
+        temp_dir (str, optional): Directory to save intermediate translation chunks. Defaults to None
+        book_title (str, optional): Title of the book being translated. Defaults to None
+        book_author (str, optional): Author of the book being translated. Defaults to None
+        chapter_number (int, optional): Current chapter number being translated. Defaults to None
+        max_chunk_size (int, optional): Maximum size of a chunk sent to the model. Defaults to MAX_CHUNK_SIZE
+        on_stats (callable, optional): Called with `ChunkStats` of every model call. Defaults to None
+        ledger (CostLedger, optional): Budget every model call reserves its estimated cost from. `on_stats`
+            must record the calls in it. Defaults to None
+
+    Returns:
+        str: The translated HTML text with preserved structure
+    """
+    translated_chunks = []
+
+    prepared = prepare_html(text, max_chunk_size)
+
+    if not prepared:
+        return text
+
+    chunks, mininifed_mapping = prepared
+
+    for i, chunk in enumerate(chunks):
+        print("\tTranslating chunk %d/%d..." % (i+1, len(chunks)))
+        translated_chunk, original_chunk = translate_chunk(client, chunk, from_lang, to_lang, book_title, book_author, on_stats=on_stats, ledger=ledger)
+        translated_chunks.append(translated_chunk)
+
+        save_chunk_to_file(temp_dir, chapter_number, restore_attributes(original_chunk, mininifed_mapping), i, prefix='original')
+        save_chunk_to_file(temp_dir, chapter_number, restore_attributes(translated_chunk, mininifed_mapping), i)
+
+    return rebuild_html(text, translated_chunks, mininifed_mapping)
+
+def translate_document_chunks(executor, client: "BaseLLM", chunks, mapping, to_langs, from_lang, run=None, chapter_number=None, document_name=None):
+    """
+    Translates the chunks of one prepared document into every target language concurrently.
+
+    All chunk requests are submitted to the shared `executor`, so the number of requests in flight
+    is bounded by its pool size regardless of the number of target languages. With `run.rolling_contexts`
+    a chunk is sent once the chunk `run.context_lag + 1` places before it is in the context, so at most
+    `run.context_lag + 1` chunks of each language are in flight and the context lags behind by as many.
+
+    Args:
+        executor (ThreadPoolExecutor): Shared pool running the chunk requests
+        client (BaseLLM): The language model client used for translation
+        chunks (list): Minified chunks produced by `prepare_html`
+        mapping (dict): Attribute mapping produced by `prepare_html`
+        to_langs (dict): Target language codes mapped to full language names
+        from_lang (str): Full source language name
+        run (TranslationRun, optional): Book details, shared state and callbacks of the run. Defaults to none of them
+        chapter_number (int, optional): Current chapter number being translated. Defaults to None
+        document_name (str, optional): Name of the document in the book, used for `run.run_state` keys. Defaults to None
+
+    Returns:
+        dict: Target language codes mapped to lists of translated chunks
+    """
+    run = run or TranslationRun()
+    ledger, run_state, cascade, deduplicator = run.ledger, run.run_state, run.cascade, run.deduplicator
+    rolling_contexts, passthrough, temp_dir = run.rolling_contexts, run.passthrough, run.temp_dir
+
+    def send(to_lang, i, text, translation_context=""):
+        print("\tTranslating chunk %d/%d (%s)..." % (i+1, len(chunks), to_lang))
+        chunk_on_stats = (lambda stats: run.on_stats(to_lang, chapter_number, i, stats)) if run.on_stats else None
+        chunk_on_error = (lambda stats: run.on_error(to_lang, chapter_number, i, stats)) if run.on_error else None
+        if cascade:
+            translated_text, _ = translate_chunk_cascade(
+                cascade, text, from_lang, to_langs[to_lang], run.book_title, run.book_author, on_stats=chunk_on_stats,
+                translation_context=translation_context, on_error=chunk_on_error, ledger=ledger,
+            )
+        else:
+            translated_text, _ = translate_chunk(
+                client, text, from_lang, to_langs[to_lang], run.book_title, run.book_author, on_stats=chunk_on_stats,
+                translation_context=translation_context, on_error=chunk_on_error, ledger=ledger,
+            )
+
+        return translated_text
+
+    def translate_one(to_lang, i, chunk, translation_context=""):
+        passthrough_reason = passthrough.chunk_reason(chunk, to_lang) if passthrough else None
+        if passthrough_reason:
+            print("\tChunk %d/%d (%s) passed through: %s" % (i+1, len(chunks), to_lang, passthrough_reason))
+            passthrough.record(passthrough_reason, chunk)
+            return chunk
+
+        state_key = RunState.chunk_key(to_lang, document_name, chunk) if run_state else None
+        if run_state and run_state.get(state_key) is not None:
+            print("\tChunk %d/%d (%s) restored from the saved state" % (i+1, len(chunks), to_lang))
+            return run_state.get(state_key)
+
+        if deduplicator:
+            translated_chunk = deduplicator.translate(chunk, mapping, to_lang, lambda text: send(to_lang, i, text, translation_context))
+        else:
+            translated_chunk = send(to_lang, i, chunk, translation_context)
+
+        if run_state:
+            run_state.put(state_key, translated_chunk)
+
+        lang_temp_dir = os.path.join(temp_dir, to_lang) if temp_dir and len(to_langs) > 1 else temp_dir
+        save_chunk_to_file(lang_temp_dir, chapter_number, restore_attributes(chunk, mapping), i, prefix='original')
+        save_chunk_to_file(lang_temp_dir, chapter_number, restore_attributes(translated_chunk, mapping), i)
+
+        return translated_chunk
+
+    def submit_in_context(to_lang, translated_chunks):
+        lang_futures = futures[to_lang]
+        while len(lang_futures) < len(chunks) and len(lang_futures) - len(translated_chunks) <= run.context_lag:
+            i = len(lang_futures)
+            lang_futures.append(executor.submit(translate_one, to_lang, i, chunks[i], rolling_contexts[to_lang].render()))
+
+    def translate_in_context():
+        translated = {to_lang: [] for to_lang in to_langs}
+        for to_lang, translated_chunks in translated.items():
+            submit_in_context(to_lang, translated_chunks)
+
+        while any(len(translated_chunks) < len(chunks) for translated_chunks in translated.values()):
+            oldest = [futures[to_lang][len(translated_chunks)] for to_lang, translated_chunks in translated.items() if len(translated_chunks) < len(chunks)]
+            wait(oldest, return_when=FIRST_COMPLETED)
+            for to_lang, translated_chunks in translated.items():
+                # The context is updated in chunk order, whatever order the requests finish in
+                lang_futures = futures[to_lang]
+                while len(translated_chunks) < len(lang_futures) and lang_futures[len(translated_chunks)].done():
+                    i = len(translated_chunks)
+                    translated_chunks.append(lang_futures[i].result())
+                    rolling_contexts[to_lang].update(chunks[i], translated_chunks[i])
+                submit_in_context(to_lang, translated_chunks)
+
+        return translated
+
+    if rolling_contexts:
+        futures = {to_lang: [] for to_lang in to_langs}
+    else:
+        futures = {
+            to_lang: [executor.submit(translate_one, to_lang, i, chunk) for i, chunk in enumerate(chunks)]
+            for to_lang in to_langs
+        }
+
+    try:
+        if rolling_contexts:
+            return translate_in_context()
+        return {to_lang: [future.result() for future in lang_futures] for to_lang, lang_futures in futures.items()}
+    except Exception:
+        all_futures = [future for lang_futures in futures.values() for future in lang_futures]
+        for future in all_futures:
+            future.cancel()
+        # Chunks already sent are paid for: wait for them so their translations reach `run_state`
+        wait(all_futures)
+        raise
+
+
+def translate(client: "BaseLLM", input_epub_path, output_epub_path=None, options=None, escalation_client=None, executor=None, on_stats=None):
+    """
+    Translates a book into one or more target languages.
+
+    The book is read, parsed, minified and split once; chunk requests for all target languages
+    go through one shared pool of MAX_CONCURRENCY threads, and one EPUB is written per language.
+    Parsing and rebuilding of chapters run in a process pool, PIPELINE_DEPTH chapters ahead of
+    and behind the chapter being translated.
+
+    Args:
+        client (BaseLLM): The language model client used for translation
+        input_epub_path (str): Path to the source EPUB file
+        output_epub_path (str, optional): Output file path. With several target languages the
+            language code is added before the extension. Defaults to a generated file name
+        options (TranslationOptions, optional): Chapters, languages and features of the translation.
+            Defaults to the whole book from English to Polish with the table of contents
+        escalation_client (BaseLLM, optional): Stronger model for a cascade: chunks are translated with
+            `client` first and re-sent to this model only when they fail the checks. Defaults to None
+        executor (optional): Pool to run the chunk requests on instead of a new pool of MAX_CONCURRENCY threads
+        on_stats (callable, optional): Called with the language code, chapter number, chunk index and
+            `ChunkStats` of every model call
+
+    Returns:
+        dict: Target language codes mapped to output file paths
+    """
+    options = options or TranslationOptions()
+    from_lang, state_path = options.from_lang, options.state_path
+    book = epub.read_epub(input_epub_path)
+
+    to_langs = split_lang_codes(options.to_lang)
+    full_from_lang = lang_code_to_full_lang(from_lang)
+    full_to_langs = {lang: lang_code_to_full_lang(lang) for lang in to_langs}
+
+    book_title = get_metadata_title(book)
+    book_author = get_metadata_author(book)
+
+    chapters_count = len([i for i in book.get_items() if i.get_type() == ebooklib.ITEM_DOCUMENT])
+
+    temp_dir = tempfile.mkdtemp()
+    print("Debugging: Translated chunks will be stored in the temporary directory: %s" % temp_dir)
+    if len(to_langs) > 1:
+        for lang in to_langs:
+            os.makedirs(os.path.join(temp_dir, lang))
+
+    prompt = llm_prompts.TRANSLATE_PROMPT.format_messages(
+        from_lang=full_from_lang,
+        to_lang=full_to_langs[to_langs[0]],
+        book_details=generate_book_info_prompt(book_title, book_author),
+        source_text="..."
+    )[0].content
+    indented_prompt = '\n'.join(['\t' + line for line in prompt.split('\n')])
+    print("Prompt sample: \n%s" % indented_prompt)
+
+    model_name = get_client_model_name(client) or MODEL_NAME
+
+    chunk_sizers = {}
+    if options.adaptive_chunks:
+        for lang in to_langs:
+            chunk_sizers[lang] = load_chunk_sizer(
+                chunk_sizer_key(model_name, from_lang, lang), MAX_CHUNK_SIZE, MAX_OUPUT_TOKENS.get(model_name),
+                model_name=get_client_model_name(client),
+            )
+        print("Adaptive chunk size: starting at %d characters" % min(sizer.chunk_size for sizer in chunk_sizers.values()))
+
+    cascade = ModelCascade(client, escalation_client) if escalation_client else None
+    if options.max_cost is not None:
+        unpriced = [name for name in (model_name, cascade and cascade.escalation_model_name) if name and not has_price(name)]
+        if unpriced:
+            raise ValueError("--max-cost needs the prices of %s; add them with MODEL_PRICES_FILE" % ", ".join(unpriced))
+
+    default_output_epub_path = output_epub_path or generate_book_filename(to_langs[0], MODEL_NAME, TEMPERATURE, book_title, book_author)
+    run_log = RunLog(options.run_log_path or os.path.splitext(default_output_epub_path)[0] + '.run.jsonl')
+    print("Run log: %s" % run_log.path)
+
+    if options.max_cost is not None and not state_path:
+        state_path = os.path.splitext(default_output_epub_path)[0] + '.state.json'
+    run_state = RunState.load(state_path) if state_path else None
+    if run_state and run_state.chunks:
+        print("Resuming from %s (%d translated chunks, $%.4f spent)" % (state_path, len(run_state.chunks), run_state.spent_cost))
+
+    # The budget covers the runs resumed from the same state, not only this one
+    ledger = CostLedger(options.max_cost, previous_cost=run_state.spent_cost if run_state else 0.0)
+
+    def record_run_stats(lang, kind, stats):
+        run_log.record(stats, lang, cost=ledger.record(stats, lang), kind=kind)
+
+    original_toc = book.toc
+    translated_tocs = {}
+    if options.toc:
+        try:
+            for lang in to_langs:
+                translated_tocs[lang] = translate_toc(
+                    client, original_toc, from_lang, lang, on_stats=lambda stats, lang=lang: record_run_stats(lang, 'toc', stats), ledger=ledger,
+                )
+        except BudgetExceededError as e:
+            print(f"Keeping the original table of contents: {str(e)}")
+
+    rolling_contexts = {}
+    if options.rolling_context:
+        count_tokens = tiktoken_counter(model_name)
+        for lang in to_langs:
+            # Summaries are made with the primary (cheaper) model of a cascade
+            summarize = lambda summary, text, lang=lang: summarize_context(
+                client, summary, text, full_to_langs[lang], on_stats=lambda stats: record_run_stats(lang, 'summary', stats), ledger=ledger,
+            )
+            rolling_contexts[lang] = RollingContext(count_tokens, summarize)
+
+    def record_stats(lang, chapter_number, chunk_index, stats):
+        cost = ledger.record(stats, lang, chapter_number)
+        lang_temp_dir = os.path.join(temp_dir, lang) if len(to_langs) > 1 else temp_dir
+        run_log.record(
+            stats, lang, chapter_number, chapter_documents.get(chapter_number), chunk_index, cost,
+            chunk_file=os.path.join(lang_temp_dir, 'translated_text_%s_%d.html' % (chapter_number, chunk_index)),
+        )
+        if lang in chunk_sizers:
+            chunk_sizers[lang].observe(stats)
+        if on_stats:
+            on_stats(lang, chapter_number, chunk_index, stats)
+
+    def record_error(lang, chapter_number, chunk_index, stats):
+        run_log.record(stats, lang, chapter_number, chapter_documents.get(chapter_number), chunk_index)
+
+    documents = [item for item in book.get_items() if item.get_type() == ebooklib.ITEM_DOCUMENT]
+    for item in documents:
+        preserve_head_links(item)
+
+    # Chapters to translate: item name -> chapter number
+    chapter_numbers = {
+        item.get_name(): chapter
+        for chapter, item in enumerate(documents, start=1)
+        if chapter >= options.from_chapter and chapter <= options.to_chapter
+    }
+    chapter_documents = {chapter: name for name, chapter in chapter_numbers.items()}
+
+    deduplicator = ChunkDeduplicator(dedup_blocks=options.dedup_blocks) if options.deduplicate else None
+
+    passthrough_classifier = PassthroughClassifier(from_lang, to_langs) if options.passthrough else None
+
+    def get_max_chunk_size(item):
+        # A resumed run splits documents as before, so their saved chunks match again
+        if run_state and run_state.chunk_size(item.get_name()):
+            return run_state.chunk_size(item.get_name())
+
+        # The book is split once for all languages, so use the most conservative learned size
+        max_chunk_size = min(sizer.chunk_size for sizer in chunk_sizers.values()) if chunk_sizers else MAX_CHUNK_SIZE
+        if run_state:
+            run_state.set_chunk_size(item.get_name(), max_chunk_size)
+        return max_chunk_size
+
+    run = TranslationRun(
+        temp_dir=temp_dir, ledger=ledger, run_state=run_state, on_stats=record_stats, on_error=record_error, cascade=cascade,
+        deduplicator=deduplicator, rolling_contexts=rolling_contexts, passthrough=passthrough_classifier,
+    )
+
+    # Item name -> translated content, per target language
+    translated_documents = {lang: {} for lang in to_langs}
+
+    # Parsing and chunking run in a process pool ahead of the chapter being translated and
+    # rebuilding runs behind it, so only the model requests hold up the chapter loop
+    with create_process_pool() as process_pool, nullcontext(executor) if executor else ThreadPoolExecutor(max_workers=MAX_CONCURRENCY) as executor:
+        chapter_items = [item for item in documents if item.get_name() in chapter_numbers]
+        if deduplicator and options.dedup_blocks:
+            # Repeated blocks are counted over all chapters before the first one is translated
+            for blocks in process_pool.map(document_blocks, [item.content for item in chapter_items]):
+                deduplicator.add_blocks(blocks)
+
+        rebuilds = RebuildStage(process_pool, max_pending=PIPELINE_DEPTH * len(to_langs))
+        prepared_documents = prepare_ahead(
+            process_pool, chapter_items, get_max_chunk_size,
+            from_lang=from_lang if options.passthrough else None, to_langs=to_langs,
+        )
+
+        try:
+            for item, prepared in prepared_documents:
+                current_chapter = chapter_numbers[item.get_name()]
+                print("Processing chapter %d/%d..." % (current_chapter, chapters_count))
+
+                # Languages the whole document has to be translated into
+                document_langs = {
+                    lang: full_lang for lang, full_lang in full_to_langs.items()
+                    if not (passthrough_classifier and passthrough_classifier.skips(prepared.passthrough_reason, lang))
+                }
+                if len(document_langs) < len(full_to_langs):
+                    print("\tPassed through (%s): %s" % (", ".join(sorted(set(full_to_langs) - set(document_langs))), prepared.passthrough_reason))
+                    passthrough_classifier.record(prepared.passthrough_reason, prepared.text)
+
+                try:
+                    if prepared.chunks is not None and document_langs:
+                        translated_chunks = translate_document_chunks(
+                            executor, client, prepared.chunks, prepared.mapping, document_langs, full_from_lang, run,
+                            chapter_number=current_chapter, document_name=item.get_name(),
+                        )
+                        for lang in document_langs:
+                            rebuilds.submit((lang, item.get_name()), prepared.text, translated_chunks[lang], prepared.mapping)
+
+                    print("\tChapter cost: %s" % ", ".join(
+                        "$%.4f (%s)" % (ledger.chapter_cost(lang, current_chapter), lang) for lang in to_langs
+                    ))
+                except BudgetExceededError as e:
+                    print(f"\t\tStopping at chapter {current_chapter}: {str(e)}")
+                    print(f"\t\tTranslated chunks and the ${ledger.spent_cost:.4f} spent so far are saved in {state_path}; the budget"
+                          f" covers resumed runs too, so run the same command with a higher --max-cost to resume.")
+                    break
+                except Exception as e:
+                    print(f"\t\tError translating chapter {current_chapter}: {str(e)}")
+                    break
+                finally:
+                    if run_state:
+                        run_state.set_spent_cost(ledger.spent_cost)
+                        run_state.save()
+                    for lang, sizer in chunk_sizers.items():
+                        save_chunk_sizer(chunk_sizer_key(model_name, from_lang, lang), sizer)
+                    if chunk_sizers:
+                        print("\tAdaptive chunk size: %d characters" % min(sizer.chunk_size for sizer in chunk_sizers.values()))
+        except Exception as e:
+            print(f"\t\tError preparing chapters: {str(e)}")
+        finally:
+            prepared_documents.close()
+
+        for (lang, name), content in rebuilds.finish().items():
+            translated_documents[lang][name] = content.encode('utf-8')
+
+    original_contents = {item.get_name(): item.content for item in documents}
+    output_paths = {}
+
+    for lang in to_langs:
+        for item in documents:
+            item.content = translated_documents[lang].get(item.get_name(), original_contents[item.get_name()])
+
+        book.set_unique_metadata('DC', 'language', langcodes.standardize_tag(lang))
+        book.toc = translated_tocs.get(lang, original_toc)
+
+        if output_epub_path:
+            lang_output_epub_path = add_lang_suffix(output_epub_path, lang) if len(to_langs) > 1 else output_epub_path
+        else:
+            lang_output_epub_path = generate_book_filename(lang, MODEL_NAME, TEMPERATURE, book_title, book_author)
+
+        write_epub(lang_output_epub_path, book, {})
+        output_paths[lang] = lang_output_epub_path
+
+        tokens = ledger.tokens[lang]
+        print("Translation to %s completed. Output file: %s" % (lang, lang_output_epub_path))
+        print("\tTokens used: %d input (%d cached), %d output. Book price: $%.4f" % (
+            tokens['input_tokens'], tokens['cached_tokens'], tokens['output_tokens'], ledger.book_costs[lang]
+        ))
+
+    if cascade:
+        print(cascade.summary())
+    if deduplicator:
+        print(deduplicator.summary())
+    if passthrough_classifier:
+        print(passthrough_classifier.summary())
+    for (lang, name), error in rebuilds.errors.items():
+        print("Warning: %s (%s) could not be rebuilt and was left untranslated: %s" % (name, lang, error))
+    print("Total run price: $%.4f" % ledger.total_cost)
+
+    return output_paths
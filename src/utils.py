@@ -99,4 +99,35 @@ def truncate_text(text: str, max_length: int = 100, ellipsis: str = "...") -> st
     """
     if len(text) <= max_length:
         return text
-    return text[:max_length - len(ellipsis)] + ellipsis
\ No newline at end of file
+    return text[:max_length - len(ellipsis)] + ellipsis
+
+def split_lang_codes(lang_codes) -> List[str]:
+    """
+    Splits a comma-separated list of language codes.
+
+    Args:
+        lang_codes: A single code, a comma-separated string of codes or a list of codes
+
+    Returns:
+        List of language codes without surrounding whitespace and duplicates, in the given order
+
+    Example:
+        >>> split_lang_codes("PL, DE,FR")
+        ['PL', 'DE', 'FR']
+    """
+    if isinstance(lang_codes, str):
+        lang_codes = lang_codes.split(',')
+
+    return list(dict.fromkeys(code.strip() for code in lang_codes if code.strip()))
+
+
+def add_lang_suffix(path: str, lang_code: str) -> str:
+    """
+    Adds a language code before the file extension.
+
+    Example:
+        >>> add_lang_suffix("books/translated.epub", "DE")
+        'books/translated.de.epub'
+    """
+    root, ext = os.path.splitext(path)
+    return f"{root}.{lang_code.lower()}{ext}"
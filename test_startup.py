@@ -0,0 +1,63 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+STARTUP_BENCHMARK = os.getenv("STARTUP_BENCHMARK", "false").lower() in ("1", "true", "yes")
+
+# Wall-clock budget (seconds) for `python main.py <command> --help`, which covers
+# interpreter start, module imports and CLI setup but no actual work. Wall-clock limits are
+# flaky on slow or busy machines, so the budgets are only checked with STARTUP_BENCHMARK=1.
+STARTUP_BUDGETS = {
+    'translate': 1.5,
+    'show-chapters': 1.5,
+    'show-chunks': 1.5,
+    'report': 1.5,
+    'serve': 1.5,
+    'worker': 1.5,
+    'assemble': 1.5,
+    'requeue': 1.5,
+}
+
+LAZY_MODULES = [
+    'langchain_openai',
+    'langchain_anthropic',
+    'langchain_google_genai',
+    'langchain.llms',
+    'tiktoken',
+]
+
+
+def run_python(*args):
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, *args],
+        cwd=ROOT_DIR,
+        capture_output=True,
+        text=True,
+    )
+    return result, time.perf_counter() - start
+
+
+def test_import_main_does_not_load_vendor_sdks():
+    result, _ = run_python(
+        '-c',
+        'import sys, main; print(",".join(m for m in %r if m in sys.modules))' % LAZY_MODULES,
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == ""
+
+
+@pytest.mark.skipif(not STARTUP_BENCHMARK, reason="startup time budgets are checked with STARTUP_BENCHMARK=1")
+@pytest.mark.parametrize("command", sorted(STARTUP_BUDGETS))
+def test_command_startup_time_budget(command):
+    # Warm-up run so the measurement is not dominated by a cold .pyc cache
+    run_python('main.py', command, '--help')
+
+    result, elapsed = run_python('main.py', command, '--help')
+
+    assert result.returncode == 0, result.stderr
+    assert elapsed < STARTUP_BUDGETS[command], f"{command} took {elapsed:.2f}s"